@@ -1,20 +1,42 @@
 # app.py
 import os
+import signal
 import logging
 from tornado.web import Application, RequestHandler
 from tornado.ioloop import IOLoop
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from tornado.options import define, options
+from tornado.process import fork_processes
 from handlers.chat import ChatWebSocket
-from handlers.model import ModelsHandler
+from handlers.model import ModelsHandler, UpstreamPoolHandler
 from handlers.database import DatabaseHandler
 from handlers.auth import AuthHandler
 from handlers.conversation import ConversationHandler
+from handlers.search import MessageSearchHandler
+from handlers.usage import UsageHandler
+from handlers.export import ExportHandler, ImportHandler
+from handlers.metrics import MetricsHandler, observe_request
 from config.settings import SETTINGS
-from utils.database import Database
+from utils.database import CACHE_CHANNEL, Database
+from utils.async_database import AsyncDatabase
+from utils.write_behind import MessageWriter
+from utils.usage import UsageTracker
+from utils.conversation_lifecycle import ConversationLifecycle
+from utils.rate_limit import RateLimiter
+from utils.response_cache import ResponseCache
+from utils.http_pool import HTTPPool
+from utils.provider_router import ProviderRouter
+from utils.pubsub import PubSub
+from utils.model_catalog import ModelCatalog
+from utils.generation_buffer import GENERATIONS_CHANNEL, GenerationRegistry
 import tornado.options
 
 # 创建logger实例
 logger = logging.getLogger(__name__)
 
+define("processes", default=1, type=int, help="工作进程数，0 表示与CPU核数相同")
+
 
 class BaseHandler(RequestHandler):
     """基础处理器"""
@@ -69,34 +91,57 @@ class DatabasePageHandler(BaseHandler):
         self.render("database.html")
 
 
-def make_app():
-    """创建Tornado应用"""
-    return Application(
-        [
-            (r"/", MainHandler),  # 主页
-            (r"/login", LoginHandler),  # 登录页面
-            (r"/models", ModelsPageHandler),  # 模型管理页面
-            (r"/database", DatabasePageHandler),  # 数据库管理页面
-            (r"/ws/chat", ChatWebSocket),  # WebSocket连接
-            (r"/api/auth", AuthHandler),  # 用户认证
-            (r"/api/models", ModelsHandler),  # 模型管理API
-            (r"/api/database(?:/([^/]+))?", DatabaseHandler),  # 数据库管理API
-            (
-                r"/api/conversations(?:/([^/]+))?(?:/([^/]+))?(?:/([^/]+))?",
-                ConversationHandler,
-            ),  # 会话管理API
-        ],
+class ChatApplication(Application):
+    """记录每个请求耗时的应用"""
+
+    def log_request(self, handler):
+        """请求结束时记录指标，再写访问日志"""
+        observe_request(handler)
+        super().log_request(handler)
+
+
+def make_app(debug=None):
+    """创建Tornado应用
+
+    Args:
+        debug: 是否开启调试模式（自动重载），默认读取配置
+    """
+    handlers = [
+        (r"/", MainHandler),  # 主页
+        (r"/login", LoginHandler),  # 登录页面
+        (r"/models", ModelsPageHandler),  # 模型管理页面
+        (r"/database", DatabasePageHandler),  # 数据库管理页面
+        (r"/ws/chat", ChatWebSocket),  # WebSocket连接
+        (r"/api/auth", AuthHandler),  # 用户认证
+        (r"/api/models", ModelsHandler),  # 模型管理API
+        (r"/api/upstream/pool", UpstreamPoolHandler),  # 上游连接池统计
+        (r"/api/database(?:/([^/]+))?", DatabaseHandler),  # 数据库管理API
+        (
+            r"/api/conversations(?:/([^/]+))?(?:/([^/]+))?(?:/([^/]+))?",
+            ConversationHandler,
+        ),  # 会话管理API
+        (r"/api/search/messages", MessageSearchHandler),  # 跨会话消息搜索
+        (r"/api/usage(?:/([^/]+))?", UsageHandler),  # 用量统计API
+        (r"/api/export(?:/([^/]+))?", ExportHandler),  # 会话导出（NDJSON）
+        (r"/api/import", ImportHandler),  # 会话导入（NDJSON）
+    ]
+    if SETTINGS["metrics"]["enabled"]:
+        handlers.append((r"/metrics", MetricsHandler))  # Prometheus 指标
+
+    return ChatApplication(
+        handlers,
         template_path=os.path.join(os.path.dirname(__file__), "templates"),
         static_path=os.path.join(os.path.dirname(__file__), "static"),
         cookie_secret=SETTINGS["cookie_secret"],  # 用于安全cookie
         login_url="/login",  # 登录页面URL
         xsrf_cookies=True,  # 启用XSRF保护
-        debug=SETTINGS["debug"],
+        debug=SETTINGS["debug"] if debug is None else debug,
     )
 
 
 def main():
     """主函数"""
+    server = None
     try:
         # 配置日志
         logging.basicConfig(
@@ -107,24 +152,106 @@ def main():
         # 解析命令行参数
         tornado.options.parse_command_line()
 
+        # 监听 socket 在 fork 之前创建，由所有工作进程共享
+        sockets = bind_sockets(SETTINGS["port"])
+        multi_process = options.processes != 1
+        task_id = 0
+        if multi_process:
+            if SETTINGS["pubsub"]["backend"] == "local":
+                logger.warning(
+                    "多进程部署时跨进程的取消、恢复和缓存失效需要 "
+                    "PUBSUB_BACKEND=mongo，local 后端下不使用会话缓存"
+                )
+            # 父进程只负责监控工作进程；MongoClient、线程池、IOLoop 等
+            # 都不能跨 fork 共享，必须在 fork 之后由每个工作进程各自创建
+            task_id = fork_processes(options.processes)
+            logger.info(f"工作进程 {task_id} 已启动，pid: {os.getpid()}")
+
         # 初始化数据库连接
         mongodb_uri = (
             f"mongodb://{SETTINGS['database']['host']}:{SETTINGS['database']['port']}"
         )
         Database.initialize(mongodb_uri, SETTINGS["database"]["name"])
+        AsyncDatabase.initialize(SETTINGS["database"]["max_workers"])
         logger.info("数据库初始化成功")
 
-        # 创建应用实例
-        app = make_app()
-        app.listen(SETTINGS["port"])
+        # 聊天消息先进入后写队列，再批量写入数据库
+        MessageWriter.initialize()
+
+        # 每轮对话的用量先在内存中累加，定期汇总到 usage 集合
+        UsageTracker.initialize()
+
+        # 大会话的后台删除和闲置会话的自动归档
+        ConversationLifecycle.initialize()
+
+        # 生成请求限流（mongo 后端时多个工作进程共享令牌桶）
+        RateLimiter.initialize()
+
+        # 回答缓存（默认关闭）：进程内 LRU + 共享的 response_cache 集合
+        ResponseCache.initialize()
+
+        # 初始化上游连接池，允许大量流式回答并发进行并复用连接
+        HTTPPool.initialize()
+
+        # 多个上游之间的故障转移、对冲请求和熔断
+        ProviderRouter.initialize()
+
+        # 模型目录在后台定期刷新，/api/models 不再同步请求上游
+        ModelCatalog.initialize()
+
+        # 进程间消息广播：接收发给本进程持有的生成、以及本进程连接的消息
+        PubSub.initialize()
+        PubSub.subscribe(GENERATIONS_CHANNEL, GenerationRegistry.on_remote_request)
+        PubSub.subscribe(PubSub.worker_channel(), ChatWebSocket.on_worker_message)
+
+        # 会话、最近消息和消息数缓存是进程内的：多进程部署时写入广播给其他进程
+        # 使其缓存失效；local 后端无法广播，只能不使用缓存
+        if multi_process and PubSub.is_local():
+            Database.disable_caches()
+        elif multi_process:
+            # 写入在线程池中执行，广播交回 IOLoop 线程
+            io_loop = IOLoop.current()
+            Database.share_caches(
+                lambda message: io_loop.add_callback(
+                    PubSub.publish, CACHE_CHANNEL, message
+                ),
+                PubSub.worker_id,
+            )
+            PubSub.subscribe(CACHE_CHANNEL, Database.on_cache_invalidated)
+
+        # 创建应用实例（调试模式的自动重载不支持多进程）
+        app = make_app(debug=SETTINGS["debug"] and not multi_process)
+        server = HTTPServer(app)
+        server.add_sockets(sockets)
         logger.info(f"服务器启动在 http://localhost:{SETTINGS['port']}")
 
+        # 指标是进程内的：多进程部署时共享端口的 /metrics 只能取到其中一个进程，
+        # 配置 METRICS_PORT 后每个工作进程在 METRICS_PORT + 进程序号 上单独导出
+        metrics_port = SETTINGS["metrics"]["port"]
+        if SETTINGS["metrics"]["enabled"] and metrics_port:
+            Application([(r"/metrics", MetricsHandler)]).listen(metrics_port + task_id)
+            logger.info(f"指标导出在 http://localhost:{metrics_port + task_id}/metrics")
+
+        # 收到 SIGTERM 时停止事件循环，在 finally 中写完队列里的消息再退出
+        IOLoop.current().asyncio_loop.add_signal_handler(
+            signal.SIGTERM, IOLoop.current().stop
+        )
+
         # 启动事件循环
         IOLoop.current().start()
     except Exception as e:
         logger.error(f"服务器启动失败: {str(e)}")
         raise
     finally:
+        if server is not None:
+            server.stop()
+        IOLoop.current().run_sync(MessageWriter.drain)
+        UsageTracker.cleanup()
+        ConversationLifecycle.cleanup()
+        IOLoop.current().run_sync(UsageTracker.flush)
+        ModelCatalog.cleanup()
+        PubSub.cleanup()
+        AsyncDatabase.cleanup()
         Database.cleanup()
 
 
@@ -0,0 +1,251 @@
+"""会话导出/导入的内存压测
+
+在独立的数据库中生成一个用户的大量消息（默认 100 万条，分布在若干会话中），
+通过 ExportHandler 流式导出到临时文件，再通过 ImportHandler 流式导入为另一个用户，
+用 tracemalloc 记录进程内的 Python 内存。每传输约 10% 的数据采样一次当前内存，
+内存应保持平稳，峰值只与批大小有关，与导出的总量无关。
+
+需要一个可写的 MongoDB（默认使用配置中的地址，数据库名为 mychat_export_benchmark，
+已生成的数据会复用，--drop 时重新生成）。
+
+用法:
+    python -m benchmarks.export_memory --messages 1000000 --conversations 20
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+from bson import ObjectId
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from tornado.web import Application, create_signed_value
+from config.settings import SETTINGS
+from handlers.export import ExportHandler, ImportHandler
+from utils.async_database import AsyncDatabase
+from utils.database import Database
+
+# 导出用户和导入用户（固定ID，重复运行时复用已生成的数据）
+EXPORT_USER = "65f000000000000000000001"
+IMPORT_USER = "65f000000000000000000002"
+SEED_BATCH = 10000
+
+
+def seed(messages, conversations, content_bytes):
+    """为导出用户生成会话和消息，已有相同数量的数据时跳过"""
+    db = Database.ensure_connection()
+    user_id = ObjectId(EXPORT_USER)
+    conversation_ids = [
+        str(conversation["_id"])
+        for conversation in db.conversations.find({"user_id": user_id}, {"_id": 1})
+    ]
+    if len(conversation_ids) == conversations and (
+        db.messages.count_documents(
+            {"conversation_id": {"$in": [ObjectId(i) for i in conversation_ids]}}
+        )
+        == messages
+    ):
+        print(f"复用已生成的 {conversations} 个会话、{messages} 条消息")
+        return
+
+    clear_user(EXPORT_USER)
+    conversation_ids = [
+        Database.create_conversation(EXPORT_USER, f"会话 {i}", "", "gpt-3.5-turbo")[
+            "_id"
+        ]
+        for i in range(conversations)
+    ]
+    content = ("压测消息内容 benchmark message " * content_bytes)[:content_bytes]
+    start = time.perf_counter()
+    written = 0
+    while written < messages:
+        size = min(SEED_BATCH, messages - written)
+        batch = [
+            Database.build_message(
+                conversation_ids[(written + i) % conversations],
+                "user" if i % 2 == 0 else "assistant",
+                f"{written + i} {content}",
+            )
+            for i in range(size)
+        ]
+        db.messages.insert_many(batch, ordered=False)
+        written += size
+    db.conversations.update_many(
+        {"user_id": user_id}, {"$set": {"message_count": messages // conversations}}
+    )
+    print(f"生成 {messages} 条消息，耗时 {time.perf_counter() - start:.1f}s")
+
+
+def clear_user(user_id):
+    """删除上一次导入的会话和消息"""
+    db = Database.ensure_connection()
+    conversation_ids = [
+        conversation["_id"]
+        for conversation in db.conversations.find(
+            {"user_id": ObjectId(user_id)}, {"_id": 1}
+        )
+    ]
+    db.messages.delete_many({"conversation_id": {"$in": conversation_ids}})
+    db.conversations.delete_many({"_id": {"$in": conversation_ids}})
+
+
+class MemorySampler:
+    """传输过程中定时采样当前 Python 内存"""
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.last = time.perf_counter()
+        self.bytes = 0
+        self.samples = []
+
+    def add(self, size):
+        self.bytes += size
+        now = time.perf_counter()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.samples.append((self.bytes, tracemalloc.get_traced_memory()[0]))
+
+    def report(self, name, elapsed):
+        mb = 1024 * 1024
+        print(
+            f"[{name}] {self.bytes / mb:.1f}MB，耗时 {elapsed:.1f}s，"
+            f"峰值内存 {tracemalloc.get_traced_memory()[1] / mb:.1f}MB"
+        )
+        # 最多显示均匀分布的 10 个采样点（已传输字节数:当前内存）
+        step = max(len(self.samples) // 10, 1)
+        print(
+            "  当前内存: "
+            + " ".join(
+                f"{done / mb:.0f}MB:{current / mb:.1f}MB"
+                for done, current in self.samples[step - 1 :: step]
+            )
+        )
+
+
+async def export_to_file(base_url, cookie, path, gzip):
+    """流式下载导出内容到文件"""
+    sampler = MemorySampler()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    with open(path, "wb") as output:
+
+        def on_chunk(chunk):
+            output.write(chunk)
+            sampler.add(len(chunk))
+
+        await AsyncHTTPClient().fetch(
+            HTTPRequest(
+                f"{base_url}/api/export{'?gzip=true' if gzip else ''}",
+                headers={"Cookie": cookie},
+                streaming_callback=on_chunk,
+                request_timeout=3600,
+            )
+        )
+    sampler.report("export" + (" +gzip" if gzip else ""), time.perf_counter() - start)
+
+
+async def import_from_file(base_url, cookie, path, gzip):
+    """流式上传导出文件"""
+    sampler = MemorySampler()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+
+    async def body_producer(write):
+        with open(path, "rb") as source:
+            while True:
+                chunk = source.read(64 * 1024)
+                if not chunk:
+                    return
+                sampler.add(len(chunk))
+                await write(chunk)
+
+    response = await AsyncHTTPClient().fetch(
+        HTTPRequest(
+            f"{base_url}/api/import{'?gzip=true' if gzip else ''}",
+            method="POST",
+            headers={"Cookie": cookie},
+            body_producer=body_producer,
+            request_timeout=3600,
+        )
+    )
+    sampler.report("import" + (" +gzip" if gzip else ""), time.perf_counter() - start)
+    print(f"  {response.body.decode()}")
+
+
+async def main_async(args):
+    sockets = bind_sockets(0, "127.0.0.1")
+    port = sockets[0].getsockname()[1]
+    app = Application(
+        [
+            (r"/api/export(?:/([^/]+))?", ExportHandler),
+            (r"/api/import", ImportHandler),
+        ],
+        cookie_secret=SETTINGS["cookie_secret"],
+    )
+    server = HTTPServer(app)
+    server.add_sockets(sockets)
+    base_url = f"http://127.0.0.1:{port}"
+
+    def cookie(user_id):
+        value = create_signed_value(SETTINGS["cookie_secret"], "user_id", user_id)
+        return f"user_id={value.decode()}"
+
+    handle, path = tempfile.mkstemp(suffix=".ndjson")
+    os.close(handle)
+    tracemalloc.start()
+    try:
+        for gzip in (False, True) if args.gzip else (False,):
+            await export_to_file(base_url, cookie(EXPORT_USER), path, gzip)
+            if args.import_:
+                await AsyncDatabase.run(clear_user, IMPORT_USER)
+                await import_from_file(base_url, cookie(IMPORT_USER), path, gzip)
+    finally:
+        tracemalloc.stop()
+        server.stop()
+        os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话导出/导入的内存压测")
+    parser.add_argument("--messages", type=int, default=1000000, help="消息总数")
+    parser.add_argument("--conversations", type=int, default=20, help="会话数")
+    parser.add_argument(
+        "--content-bytes", type=int, default=200, help="每条消息内容的字符数"
+    )
+    parser.add_argument("--batch-size", type=int, default=1000, help="导出/导入批大小")
+    parser.add_argument("--gzip", action="store_true", help="同时测试 gzip 压缩")
+    parser.add_argument(
+        "--no-import", dest="import_", action="store_false", help="只测试导出"
+    )
+    parser.add_argument(
+        "--database", default="mychat_export_benchmark", help="压测使用的数据库名"
+    )
+    parser.add_argument("--drop", action="store_true", help="重新生成压测数据")
+    args = parser.parse_args()
+
+    SETTINGS["export"]["batch_size"] = args.batch_size
+    SETTINGS["export"]["import_batch_size"] = args.batch_size
+    # 导入的请求体可能超过默认上限
+    SETTINGS["export"]["max_import_bytes"] = 1 << 40
+    mongodb_uri = (
+        f"mongodb://{SETTINGS['database']['host']}:{SETTINGS['database']['port']}"
+    )
+    Database.initialize(mongodb_uri, args.database)
+    AsyncDatabase.initialize(4)
+    try:
+        if args.drop:
+            Database.client.drop_database(args.database)
+            Database.cleanup()
+            Database.initialize(mongodb_uri, args.database)
+        seed(args.messages, args.conversations, args.content_bytes)
+        asyncio.run(main_async(args))
+    finally:
+        AsyncDatabase.cleanup()
+        Database.cleanup()
+
+
+if __name__ == "__main__":
+    main()
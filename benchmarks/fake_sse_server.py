@@ -0,0 +1,163 @@
+"""本地模拟的 OpenAI 兼容 SSE 服务，供压测脚本使用
+
+服务运行在独立线程自己的 IOLoop 中，因此即使被测代码阻塞了主线程的事件循环，
+模拟服务也能继续正常输出。
+"""
+
+import asyncio
+import json
+import threading
+import time
+from tornado.httpserver import HTTPServer
+from tornado.iostream import StreamClosedError
+from tornado.ioloop import IOLoop
+from tornado.netutil import bind_sockets
+from tornado.web import Application, RequestHandler
+
+
+class FakeCompletionsHandler(RequestHandler):
+    """模拟 /v1/chat/completions 流式接口"""
+
+    def initialize(self, options):
+        self.options = options
+
+    async def post(self):
+        self.options["requests"] += 1
+        # 注入的故障：直接返回错误状态码，或延迟输出第一个事件
+        if self.options["status"] != 200:
+            self.set_status(self.options["status"])
+            self.write({"error": {"message": "injected fault"}})
+            return
+        if self.options["first_delay"]:
+            await asyncio.sleep(self.options["first_delay"])
+
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+
+        events = self.options["events"]
+        interval = self.options["interval"]
+        token = self.options["token"]
+        try:
+            for index in range(events):
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "choices": [{"index": 0, "delta": {"content": token}}],
+                }
+                self.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+                await self.flush()
+                if interval:
+                    await asyncio.sleep(interval)
+
+            # 与 OpenAI 相同：最后一个内容事件之后单独发送 finish_reason
+            finish = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            self.write(f"data: {json.dumps(finish)}\n\n")
+
+            body = json.loads(self.request.body or b"{}")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                # 与 OpenAI 相同：最后一个事件没有 choices，只有 usage
+                usage = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "choices": [],
+                    "usage": {
+                        "prompt_tokens": len(body.get("messages", [])),
+                        "completion_tokens": events,
+                        "total_tokens": len(body.get("messages", [])) + events,
+                    },
+                }
+                self.write(f"data: {json.dumps(usage)}\n\n")
+            self.write("data: [DONE]\n\n")
+            await self.flush()
+        except StreamClosedError:
+            # 客户端中止了请求
+            self.options["aborted"] += 1
+
+
+class FakeModelsHandler(RequestHandler):
+    """模拟 /v1/models 接口"""
+
+    def get(self):
+        self.write(
+            {
+                "object": "list",
+                "data": [
+                    {"id": "gpt-3.5-turbo", "object": "model", "owned_by": "openai"},
+                    {"id": "gpt-4", "object": "model", "owned_by": "openai"},
+                ],
+            }
+        )
+
+
+class FakeSSEServer:
+    """在后台线程中运行的模拟服务
+
+    Args:
+        events: 每次回答输出的事件数量
+        interval: 事件间隔（秒）
+        token: 每个事件携带的内容
+        status: 不为 200 时直接返回该状态码（模拟上游故障）
+        first_delay: 输出第一个事件前等待的秒数（模拟首字慢）
+
+    options 中的故障参数可在运行中修改。
+    """
+
+    def __init__(
+        self, events=50, interval=0.01, token="你好", status=200, first_delay=0
+    ):
+        self.options = {
+            "events": events,
+            "interval": interval,
+            "token": token,
+            "status": status,
+            "first_delay": first_delay,
+            "requests": 0,
+            "aborted": 0,
+        }
+        self.port = None
+        self._loop = None
+        self._thread = None
+        self._started = threading.Event()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def _run(self, sockets):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        self._loop = IOLoop.current()
+        app = Application(
+            [
+                (
+                    r"/v1/chat/completions",
+                    FakeCompletionsHandler,
+                    {"options": self.options},
+                ),
+                (r"/v1/models", FakeModelsHandler),
+            ]
+        )
+        server = HTTPServer(app)
+        server.add_sockets(sockets)
+        self._started.set()
+        self._loop.start()
+        server.stop()
+
+    def start(self):
+        sockets = bind_sockets(0, "127.0.0.1")
+        self.port = sockets[0].getsockname()[1]
+        self._thread = threading.Thread(target=self._run, args=(sockets,), daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.add_callback(self._loop.stop)
+            self._thread.join(timeout=5)
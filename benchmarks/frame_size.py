@@ -0,0 +1,107 @@
+"""WebSocket 帧协议与压缩的传输字节数对比
+
+对一段流式回答的片段序列（transcript），分别计算不同帧协议
+（完整JSON / 短字段名JSON / msgpack）在不压缩和 permessage-deflate
+不同压缩级别下发送到客户端的总字节数。压缩按 permessage-deflate 的方式
+模拟：整个连接共用一个压缩上下文，每帧以 Z_SYNC_FLUSH 结束并去掉末尾4字节。
+
+用法:
+    python -m benchmarks.frame_size                          # 使用内置的示例回答
+    python -m benchmarks.frame_size --transcript deltas.json # 使用录制的片段列表
+"""
+
+import argparse
+import json
+import zlib
+from utils import frame_protocol
+
+SAMPLE_ANSWER = (
+    "好的，下面是一个使用 Python 实现冒泡排序的例子：\n\n"
+    "```python\n"
+    "def bubble_sort(items):\n"
+    "    n = len(items)\n"
+    "    for i in range(n):\n"
+    "        for j in range(0, n - i - 1):\n"
+    "            if items[j] > items[j + 1]:\n"
+    "                items[j], items[j + 1] = items[j + 1], items[j]\n"
+    "    return items\n"
+    "```\n\n"
+    "冒泡排序的时间复杂度是 O(n²)，每一轮都会把当前最大的元素“冒泡”到末尾。"
+    "对于已经基本有序的数据，可以在一轮中没有发生交换时提前结束，"
+    "这样最好情况下的时间复杂度可以降到 O(n)。"
+) * 8
+
+
+def sample_transcript():
+    """把示例回答切成与上游相近的一到三个字符的片段"""
+    deltas = []
+    index = 0
+    while index < len(SAMPLE_ANSWER):
+        step = 1 + index % 3
+        deltas.append(SAMPLE_ANSWER[index : index + step])
+        index += step
+    return deltas
+
+
+def frame_sizes(frames, level, mem_level=8):
+    """计算一组帧在指定压缩级别下的字节数，level 为 None 表示不压缩"""
+    if level is None:
+        return sum(len(frame) for frame in frames)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15, mem_level)
+    total = 0
+    for frame in frames:
+        data = compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        total += len(data) - 4
+    return total
+
+
+def encode_frames(deltas, protocol):
+    frames = []
+    for delta in deltas:
+        frame = frame_protocol.encode({"type": "stream", "content": delta}, protocol)
+        frames.append(frame if isinstance(frame, bytes) else frame.encode("utf-8"))
+    return frames
+
+
+def coalesce(deltas, size):
+    """模拟合并发送：每 size 个片段合并为一帧"""
+    return ["".join(deltas[i : i + size]) for i in range(0, len(deltas), size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket 帧传输字节数对比")
+    parser.add_argument("--transcript", help="录制的片段列表（JSON数组）")
+    parser.add_argument(
+        "--coalesce", type=int, default=20, help="合并发送时每帧包含的片段数"
+    )
+    args = parser.parse_args()
+
+    if args.transcript:
+        with open(args.transcript, encoding="utf-8") as f:
+            deltas = json.load(f)
+    else:
+        deltas = sample_transcript()
+
+    protocols = [("完整JSON", frame_protocol.JSON_PROTOCOL)]
+    protocols.append(("短字段名JSON", frame_protocol.COMPACT_PROTOCOL))
+    if frame_protocol.msgpack is not None:
+        protocols.append(("msgpack", frame_protocol.MSGPACK_PROTOCOL))
+
+    payload = len("".join(deltas).encode("utf-8"))
+    print(f"片段数 {len(deltas)}，正文 {payload} 字节")
+    for mode, chunks in (
+        ("逐片段", deltas),
+        (f"每{args.coalesce}片段合并", coalesce(deltas, args.coalesce)),
+    ):
+        for name, protocol in protocols:
+            frames = encode_frames(chunks, protocol)
+            sizes = [frame_sizes(frames, level) for level in (None, 1, 6, 9)]
+            print(
+                f"{mode:<10} {name:<12} 不压缩 {sizes[0]:>8}  "
+                f"deflate-1 {sizes[1]:>8}  deflate-6 {sizes[2]:>8}  "
+                f"deflate-9 {sizes[3]:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
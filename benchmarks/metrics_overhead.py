@@ -0,0 +1,142 @@
+"""指标埋点的开销压测
+
+分别测量：
+1. 各指标操作的单次耗时（计数、带标签计数、直方图、计时上下文），
+   与同样循环下的空操作对比；
+2. AsyncDatabase.run 加上排队/执行计时后，相对直接 run_in_executor 的额外耗时
+   （函数本身为空操作，差值即为埋点开销）；
+3. /metrics 导出的耗时（按标签组合数）。
+
+用法:
+    python -m benchmarks.metrics_overhead --iterations 1000000
+"""
+
+import argparse
+import asyncio
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from utils.async_database import AsyncDatabase
+from utils.metrics import Counter, Histogram, Registry
+
+
+def per_op(statement, namespace, iterations):
+    """多次运行取最短耗时，返回每次操作的纳秒数"""
+    timer = timeit.Timer(statement, globals=namespace)
+    return min(timer.repeat(repeat=5, number=iterations)) / iterations * 1e9
+
+
+def measure_primitives(iterations):
+    """指标操作的单次耗时"""
+    registry = Registry()
+    counter = Counter("bench_counter", "", registry=registry)
+    labeled = Counter("bench_labeled", "", ["method"], registry=registry)
+    histogram = Histogram("bench_histogram", "", registry=registry)
+    labeled_histogram = Histogram(
+        "bench_labeled_histogram", "", ["method"], registry=registry
+    )
+    namespace = {
+        "counter": counter,
+        "labeled": labeled,
+        "histogram": histogram,
+        "labeled_histogram": labeled_histogram,
+        "perf_counter": time.perf_counter,
+    }
+
+    baseline = per_op("pass", namespace, iterations)
+    cases = [
+        ("Counter.inc()", "counter.inc()"),
+        ("Counter.labels(m).inc()", "labeled.labels('get_messages').inc()"),
+        ("Histogram.observe()", "histogram.observe(0.003)"),
+        (
+            "Histogram.labels(m).observe()",
+            "labeled_histogram.labels('get_messages').observe(0.003)",
+        ),
+        ("with Histogram.time()", "with histogram.time(): pass"),
+        ("两次 perf_counter()（对照）", "perf_counter(); perf_counter()"),
+    ]
+    print(f"空循环: {baseline:.1f} ns")
+    for name, statement in cases:
+        cost = per_op(statement, namespace, iterations) - baseline
+        print(f"{name}: {cost:.1f} ns")
+
+
+async def measure_executor(calls):
+    """AsyncDatabase.run 的埋点开销（函数本身为空操作）"""
+    executor = ThreadPoolExecutor(max_workers=1)
+    AsyncDatabase.executor = executor
+    loop = asyncio.get_running_loop()
+
+    def noop():
+        return None
+
+    async def raw():
+        for _ in range(calls):
+            await loop.run_in_executor(executor, noop)
+
+    async def instrumented():
+        for _ in range(calls):
+            await AsyncDatabase.run(noop)
+
+    results = {}
+    for name, func in (("run_in_executor", raw), ("AsyncDatabase.run", instrumented)):
+        best = float("inf")
+        for _ in range(5):
+            start = time.perf_counter()
+            await func()
+            best = min(best, time.perf_counter() - start)
+        results[name] = best / calls * 1e6
+        print(f"{name}: {results[name]:.2f} µs/次")
+    overhead = results["AsyncDatabase.run"] - results["run_in_executor"]
+    print(
+        f"埋点额外耗时: {overhead:.2f} µs/次 "
+        f"({overhead / results['run_in_executor'] * 100:.1f}% 的线程切换开销)"
+    )
+    executor.shutdown()
+    AsyncDatabase.executor = None
+
+
+def measure_render(label_sets):
+    """导出耗时"""
+    registry = Registry()
+    histogram = Histogram(
+        "bench_http_request_seconds", "", ["handler", "status"], registry=registry
+    )
+    counter = Counter("bench_tokens_total", "", ["model", "type"], registry=registry)
+    for index in range(label_sets):
+        histogram.labels(f"Handler{index}", "200").observe(0.01)
+        counter.labels(f"model-{index}", "prompt").inc(100)
+
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        body = registry.render()
+        best = min(best, time.perf_counter() - start)
+    print(
+        f"{label_sets} 组标签: 导出 {best * 1000:.2f} ms, "
+        f"{len(body) / 1024:.0f} KB, {body.count(chr(10))} 行"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="指标埋点的开销压测")
+    parser.add_argument(
+        "--iterations", type=int, default=1000000, help="每项指标操作的次数"
+    )
+    parser.add_argument("--calls", type=int, default=20000, help="线程池调用次数")
+    parser.add_argument(
+        "--label-sets", default="10,100,1000", help="导出测试的标签组合数，逗号分隔"
+    )
+    args = parser.parse_args()
+
+    print("== 指标操作 ==")
+    measure_primitives(args.iterations)
+    print("== 数据库线程池调用 ==")
+    asyncio.run(measure_executor(args.calls))
+    print("== 导出 ==")
+    for label_sets in (int(count) for count in args.label_sets.split(",")):
+        measure_render(label_sets)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""多进程部署的扩展性压测
+
+与 app.py --processes N 相同，监听 socket 在 fork 之前创建，由 N 个工作进程共享；
+每个工作进程在 fork 之后各自初始化上游连接池，通过 WebSocket 输出
+OpenAIClient.chat_stream 的流式回答（与 ChatWebSocket 相同的合并发送路径，
+不访问 MongoDB）。多个压测进程同时保持固定数量的并发回答，
+统计每秒完成的回答数，对比不同工作进程数下的吞吐。
+
+上游同样是多进程的模拟 SSE 服务，避免上游先成为瓶颈。
+吞吐能否随进程数线性增长取决于机器的CPU核数，进程数不宜超过核数。
+
+用法:
+    python -m benchmarks.process_scaling --workers 1,2,4 --streams 200 --events 200
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from tornado.web import Application
+from tornado.websocket import WebSocketHandler, websocket_connect
+from benchmarks.fake_sse_server import FakeCompletionsHandler
+from config.settings import OPENAI_CONFIG, SETTINGS
+from utils.http_pool import HTTPPool
+from utils.openai_client import OpenAIClient
+from utils.stream_writer import CoalescingWriter
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+class StreamSocket(WebSocketHandler):
+    """收到任意消息后流式返回一个回答"""
+
+    async def on_message(self, message):
+        ws_config = SETTINGS["websocket"]
+        writer = CoalescingWriter(
+            lambda text: self.write_message({"type": "stream", "content": text}),
+            interval=ws_config["flush_interval_ms"] / 1000,
+            max_bytes=ws_config["flush_bytes"],
+            max_interval=ws_config["max_flush_interval_ms"] / 1000,
+        )
+        try:
+            async for content in OpenAIClient().chat_stream(MESSAGES):
+                writer.write(content)
+        finally:
+            writer.close()
+        self.write_message({"type": "done"})
+
+
+def serve(sockets, handlers, streams):
+    """工作进程入口：fork 之后创建 IOLoop 和上游连接池"""
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    HTTPPool.initialize(max_clients=max(streams, 10))
+    server = HTTPServer(Application(handlers))
+    server.add_sockets(sockets)
+    asyncio.get_event_loop().run_forever()
+
+
+def start_workers(count, handlers, streams):
+    """绑定端口后 fork 出 count 个共享该端口的进程"""
+    sockets = bind_sockets(0, "127.0.0.1")
+    port = sockets[0].getsockname()[1]
+    processes = [
+        multiprocessing.Process(
+            target=serve, args=(sockets, handlers, streams), daemon=True
+        )
+        for _ in range(count)
+    ]
+    for process in processes:
+        process.start()
+    for sock in sockets:
+        sock.close()
+    return port, processes
+
+
+def run_clients(port, streams, duration):
+    """压测进程入口：保持 streams 个并发回答，返回完成的回答数和片段字节数"""
+
+    async def client(deadline, totals):
+        ws = await websocket_connect(f"ws://127.0.0.1:{port}/ws")
+        while time.perf_counter() < deadline:
+            await ws.write_message("go")
+            while True:
+                data = json.loads(await ws.read_message())
+                if data["type"] == "done":
+                    break
+                totals["bytes"] += len(data["content"].encode("utf-8"))
+            totals["completed"] += 1
+        ws.close()
+
+    async def main():
+        totals = {"completed": 0, "bytes": 0}
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(client(deadline, totals) for _ in range(streams)))
+        return totals
+
+    return asyncio.run(main())
+
+
+def measure(workers, args, upstream_port):
+    """在给定工作进程数下测量吞吐"""
+    OPENAI_CONFIG["base_url"] = f"http://127.0.0.1:{upstream_port}"
+    port, processes = start_workers(
+        workers, [(r"/ws", StreamSocket)], args.streams // workers + 1
+    )
+    try:
+        per_client = [args.streams // args.clients] * args.clients
+        for index in range(args.streams % args.clients):
+            per_client[index] += 1
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.starmap(
+                run_clients, [(port, count, args.duration) for count in per_client]
+            )
+        elapsed = time.perf_counter() - start
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+    completed = sum(result["completed"] for result in results)
+    return completed / elapsed, sum(result["bytes"] for result in results) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程部署的扩展性压测")
+    parser.add_argument(
+        "--workers", default="1,2,4", help="要测试的工作进程数，逗号分隔"
+    )
+    parser.add_argument("--streams", type=int, default=200, help="并发回答数量")
+    parser.add_argument("--events", type=int, default=200, help="每个回答的事件数")
+    parser.add_argument("--interval", type=float, default=0, help="事件间隔（秒）")
+    parser.add_argument("--duration", type=float, default=10, help="每轮压测时长（秒）")
+    parser.add_argument("--clients", type=int, default=4, help="压测进程数")
+    parser.add_argument(
+        "--upstream",
+        type=int,
+        default=0,
+        help="模拟上游的进程数，默认与最大工作进程数相同",
+    )
+    args = parser.parse_args()
+
+    worker_counts = [int(count) for count in args.workers.split(",")]
+    upstream_options = {
+        "events": args.events,
+        "interval": args.interval,
+        "token": "你好",
+        "requests": 0,
+        "aborted": 0,
+    }
+    upstream_port, upstream = start_workers(
+        args.upstream or max(worker_counts),
+        [
+            (
+                r"/v1/chat/completions",
+                FakeCompletionsHandler,
+                {"options": upstream_options},
+            )
+        ],
+        args.streams,
+    )
+    print(
+        f"CPU核数: {os.cpu_count()}, 并发回答: {args.streams}, "
+        f"每个回答 {args.events} 个事件, 每轮 {args.duration:.0f}s"
+    )
+
+    try:
+        baseline = None
+        for workers in worker_counts:
+            rate, throughput = measure(workers, args, upstream_port)
+            baseline = baseline or rate
+            print(
+                f"{workers} 个工作进程: {rate:.1f} 回答/s, "
+                f"{throughput / 1024:.0f} KB/s, "
+                f"相对 {worker_counts[0]} 个进程 {rate / baseline:.2f}x"
+            )
+    finally:
+        for process in upstream:
+            process.terminate()
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
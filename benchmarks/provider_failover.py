@@ -0,0 +1,133 @@
+"""上游故障转移、熔断与对冲请求压测
+
+启动两个本地模拟上游（primary / secondary），向 primary 注入故障，
+通过 ProviderRouter 依次发起对话，统计成功率、首字延迟分位数和各上游收到的请求数：
+
+1. down：primary 全部返回 503，请求应转移到 secondary，熔断后不再请求 primary；
+2. flaky：primary 每 3 个请求失败 1 个，首字前失败应在 secondary 上重试成功；
+3. slow：primary 每 10 个请求中有 1 个首字很慢，分别在关闭/开启对冲时对比尾延迟。
+
+用法:
+    python -m benchmarks.provider_failover --requests 200 --slow-delay 1.0
+"""
+
+import argparse
+import asyncio
+import time
+from benchmarks.fake_sse_server import FakeSSEServer
+from config.settings import OPENAI_CONFIG
+from utils.http_pool import HTTPPool
+from utils.provider_router import ProviderRouter
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_scenario(name, primary, secondary, requests, inject, hedge=False):
+    """依次发起 requests 次对话，inject(index) 在每次请求前修改 primary 的故障参数"""
+    OPENAI_CONFIG["router"]["hedge"] = hedge
+    ProviderRouter.stats.update(requests=0, retries=0, hedges=0, hedges_won=0)
+    ProviderRouter.initialize(
+        [
+            {"name": "primary", "base_url": primary.base_url, "api_key": "x"},
+            {"name": "secondary", "base_url": secondary.base_url, "api_key": "x"},
+        ]
+    )
+    for server in (primary, secondary):
+        server.options["requests"] = 0
+
+    ttfts, failures = [], 0
+    start = time.perf_counter()
+    for index in range(requests):
+        inject(index)
+        request_start = time.perf_counter()
+        ttft = None
+        try:
+            async for delta in ProviderRouter.chat_events(MESSAGES, "gpt-3.5-turbo"):
+                if ttft is None and delta.content:
+                    ttft = time.perf_counter() - request_start
+        except Exception:
+            failures += 1
+            continue
+        ttfts.append(ttft)
+    elapsed = time.perf_counter() - start
+
+    stats = ProviderRouter.get_stats()
+    circuits = {
+        endpoint["name"]: endpoint["circuit"] for endpoint in stats["endpoints"]
+    }
+    print(
+        f"[{name}{' +hedge' if hedge else ''}] {requests} 次请求，失败 {failures}，"
+        f"耗时 {elapsed:.2f}s"
+    )
+    if ttfts:
+        print(
+            f"  首字延迟 p50={percentile(ttfts, 0.5) * 1000:.1f}ms "
+            f"p95={percentile(ttfts, 0.95) * 1000:.1f}ms "
+            f"p99={percentile(ttfts, 0.99) * 1000:.1f}ms "
+            f"max={max(ttfts) * 1000:.1f}ms"
+        )
+    print(
+        f"  上游请求 primary={primary.options['requests']} "
+        f"secondary={secondary.options['requests']}，重试 {stats['retries']}，"
+        f"对冲 {stats['hedges']}（胜出 {stats['hedges_won']}），熔断状态 {circuits}"
+    )
+
+
+async def main_async(args):
+    HTTPPool.initialize()
+    primary = FakeSSEServer(events=args.events, interval=0).start()
+    secondary = FakeSSEServer(events=args.events, interval=0).start()
+    router_config = OPENAI_CONFIG["router"]
+    router_config["retry_backoff"] = 0.01
+    router_config["hedge_max_delay"] = args.hedge_max_delay
+    router_config["hedge_min_delay"] = 0.01
+    try:
+
+        def down(index):
+            primary.options["status"] = 503
+
+        def flaky(index):
+            primary.options["status"] = 503 if index % 3 == 0 else 200
+
+        def slow(index):
+            primary.options["status"] = 200
+            primary.options["first_delay"] = args.slow_delay if index % 10 == 0 else 0
+
+        await run_scenario("down", primary, secondary, args.requests, down)
+        # 错误率熔断会让 flaky 的 primary 暂停服务，这里只看重试的效果
+        router_config["breaker_failures"] = args.requests
+        router_config["breaker_error_rate"] = 1.1
+        await run_scenario("flaky", primary, secondary, args.requests, flaky)
+        for hedge in (False, True):
+            await run_scenario(
+                "slow", primary, secondary, args.requests, slow, hedge=hedge
+            )
+    finally:
+        primary.stop()
+        secondary.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上游故障转移、熔断与对冲请求压测")
+    parser.add_argument("--requests", type=int, default=200, help="每个场景的请求数")
+    parser.add_argument("--events", type=int, default=5, help="每次回答的事件数")
+    parser.add_argument(
+        "--slow-delay", type=float, default=1.0, help="slow 场景中慢请求的首字延迟"
+    )
+    parser.add_argument(
+        "--hedge-max-delay",
+        type=float,
+        default=0.2,
+        help="对冲等待时间上限（样本不足 20 个时使用）",
+    )
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
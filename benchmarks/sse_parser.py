@@ -0,0 +1,189 @@
+"""SSE 解析压测
+
+对比旧的逐行解析（拼接 bytes、整行解码为字符串、两次 startswith 后 json.loads）
+与 utils/sse 的增量解码器在同一段录制流上的耗时。录制流默认按 OpenAI
+chat.completion.chunk 的格式生成，也可以用 --capture 指定真实录制的原始响应体；
+数据块按 --chunk-size 随机切分，模拟网络读取时的任意截断。
+
+用法:
+    python -m benchmarks.sse_parser --events 10000 --chunk-size 1,512,4096
+    python -m benchmarks.sse_parser --capture stream.txt
+"""
+
+import argparse
+import json
+import random
+import time
+from utils.sse import SSEDecoder, parse_chat_event
+
+
+def make_capture(events, seed=0):
+    """生成录制流：role 增量、内容增量、finish_reason 和 usage，最后是 [DONE]"""
+    rng = random.Random(seed)
+    words = ["你好", "，", "这是", "一个", "测试", "回答", "。", " the", " quick", "\n"]
+    base = {
+        "id": "chatcmpl-8capture",
+        "object": "chat.completion.chunk",
+        "created": 1700000000,
+        "model": "gpt-3.5-turbo-0613",
+        "system_fingerprint": "fp_capture",
+    }
+    lines = []
+    for index in range(events):
+        if index == 0:
+            delta = {"role": "assistant", "content": ""}
+        else:
+            delta = {"content": rng.choice(words)}
+        chunk = dict(
+            base,
+            choices=[
+                {"index": 0, "delta": delta, "logprobs": None, "finish_reason": None}
+            ],
+        )
+        lines.append(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+    final = dict(
+        base,
+        choices=[{"index": 0, "delta": {}, "logprobs": None, "finish_reason": "stop"}],
+        usage={
+            "prompt_tokens": 20,
+            "completion_tokens": events,
+            "total_tokens": events + 20,
+        },
+    )
+    lines.append(f"data: {json.dumps(final)}\n\n")
+    lines.append("data: [DONE]\n\n")
+    return "".join(lines).encode("utf-8")
+
+
+def make_large_event(size):
+    """一个很大的事件（如较长的 tool_calls 参数），用于对比跨多个数据块的长行"""
+    chunk = {
+        "object": "chat.completion.chunk",
+        "choices": [{"index": 0, "delta": {"content": "长" * size}}],
+    }
+    return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\ndata: [DONE]\n\n".encode(
+        "utf-8"
+    )
+
+
+def split_chunks(stream, chunk_size, seed=0):
+    """按平均 chunk_size 字节随机切分"""
+    rng = random.Random(seed)
+    chunks = []
+    position = 0
+    while position < len(stream):
+        size = max(1, int(rng.uniform(0.5, 1.5) * chunk_size))
+        chunks.append(stream[position : position + size])
+        position += size
+    return chunks
+
+
+def parse_sse_line(line):
+    """旧实现：OpenAIClient._parse_sse_line"""
+    if not line:
+        return None
+    if line.startswith("data: "):
+        try:
+            data = json.loads(line[6:])
+            if data.get("choices") and len(data["choices"]) > 0:
+                delta = data["choices"][0].get("delta", {})
+                return delta.get("content", "")
+        except json.JSONDecodeError:
+            pass
+    return None
+
+
+def legacy_parse(chunks):
+    """旧实现：chat_stream 中的逐行解析"""
+    contents = []
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            line = line.rstrip(b"\r").decode("utf-8")
+            if line.startswith("data: "):
+                if line.startswith("data: [DONE]"):
+                    return contents
+                content = parse_sse_line(line)
+                if content:
+                    contents.append(content)
+    return contents
+
+
+def incremental_parse(chunks):
+    """新实现：SSEDecoder + parse_chat_event"""
+    contents = []
+    decoder = SSEDecoder()
+    for chunk in chunks:
+        for event in decoder.feed(chunk):
+            delta = parse_chat_event(event)
+            if delta is None:
+                return contents
+            if delta.content:
+                contents.append(delta.content)
+    return contents
+
+
+def best_of(func, chunks, repeat):
+    """多次运行取最短耗时"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(chunks)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE 解析压测")
+    parser.add_argument("--events", type=int, default=10000, help="录制流的事件数")
+    parser.add_argument(
+        "--chunk-size", default="1,64,512,4096", help="平均数据块大小（字节），逗号分隔"
+    )
+    parser.add_argument("--capture", help="真实录制的原始响应体文件")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数，取最短耗时")
+    parser.add_argument(
+        "--large-event",
+        type=int,
+        default=256,
+        help="大事件的内容长度（千字），0 表示不测",
+    )
+    args = parser.parse_args()
+
+    if args.capture:
+        with open(args.capture, "rb") as f:
+            stream = f.read()
+    else:
+        stream = make_capture(args.events)
+    events = stream.count(b"\n\n")
+    print(f"录制流: {len(stream) / 1024:.0f} KB, {events} 个事件")
+
+    for chunk_size in (int(size) for size in args.chunk_size.split(",")):
+        chunks = split_chunks(stream, chunk_size)
+        legacy_time, legacy_result = best_of(legacy_parse, chunks, args.repeat)
+        new_time, new_result = best_of(incremental_parse, chunks, args.repeat)
+        assert legacy_result == new_result, "两种实现的解析结果不一致"
+        print(
+            f"数据块约 {chunk_size} 字节 ({len(chunks)} 块): "
+            f"旧实现 {legacy_time * 1e6 / events:.2f} µs/事件, "
+            f"增量解码 {new_time * 1e6 / events:.2f} µs/事件, "
+            f"加速 {legacy_time / new_time:.2f}x"
+        )
+
+    if args.large_event:
+        # 单个大事件按 1KB 数据块到达：旧实现每块都重新切分整个未完成的行
+        chunks = split_chunks(make_large_event(args.large_event * 1000), 1024)
+        legacy_time, legacy_result = best_of(legacy_parse, chunks, args.repeat)
+        new_time, new_result = best_of(incremental_parse, chunks, args.repeat)
+        assert legacy_result == new_result, "两种实现的解析结果不一致"
+        print(
+            f"单个 {args.large_event} 千字的事件 ({len(chunks)} 块): "
+            f"旧实现 {legacy_time * 1000:.1f} ms, 增量解码 {new_time * 1000:.1f} ms, "
+            f"加速 {legacy_time / new_time:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
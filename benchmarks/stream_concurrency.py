@@ -0,0 +1,103 @@
+"""并发流式回答压测
+
+对比旧的阻塞式实现（requests + iter_lines 直接跑在事件循环上）与
+OpenAIClient.chat_stream 异步实现在同一进程内并发处理多路回答的耗时。
+
+用法:
+    python -m benchmarks.stream_concurrency --streams 200 --events 50 --interval 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import requests
+from benchmarks.fake_sse_server import FakeSSEServer
+from config.settings import OPENAI_CONFIG
+from utils.http_pool import HTTPPool
+from utils.openai_client import OpenAIClient
+
+
+def blocking_stream(base_url, messages):
+    """旧实现：阻塞式读取上游SSE"""
+    response = requests.post(
+        f"{base_url}/v1/chat/completions",
+        json={"model": "gpt-3.5-turbo", "messages": messages, "stream": True},
+        stream=True,
+    )
+    response.raise_for_status()
+    for line in response.iter_lines():
+        if line:
+            line = line.decode("utf-8")
+            if line.startswith("data: [DONE]"):
+                break
+            if line.startswith("data: "):
+                data = json.loads(line[6:])
+                yield data["choices"][0]["delta"].get("content", "")
+
+
+async def run_blocking(base_url, streams):
+    async def consume():
+        # 与旧版 on_message 一样在协程中直接调用阻塞代码
+        return sum(1 for _ in blocking_stream(base_url, MESSAGES))
+
+    return await asyncio.gather(*(consume() for _ in range(streams)))
+
+
+async def run_async(streams):
+    async def consume():
+        count = 0
+        async for _ in OpenAIClient().chat_stream(MESSAGES):
+            count += 1
+        return count
+
+    return await asyncio.gather(*(consume() for _ in range(streams)))
+
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发流式回答压测")
+    parser.add_argument("--streams", type=int, default=200, help="并发回答数量")
+    parser.add_argument("--events", type=int, default=50, help="每个回答的事件数")
+    parser.add_argument("--interval", type=float, default=0.01, help="事件间隔（秒）")
+    parser.add_argument(
+        "--blocking-streams",
+        type=int,
+        default=10,
+        help="旧实现的并发数量（串行执行，数值过大耗时很长）",
+    )
+    args = parser.parse_args()
+
+    server = FakeSSEServer(events=args.events, interval=args.interval).start()
+    OPENAI_CONFIG["base_url"] = server.base_url
+    HTTPPool.initialize(max_clients=max(args.streams, 10))
+    single = args.events * args.interval
+
+    try:
+        start = time.perf_counter()
+        results = asyncio.run(run_blocking(server.base_url, args.blocking_streams))
+        blocking_elapsed = time.perf_counter() - start
+        print(
+            f"阻塞实现: {args.blocking_streams} 路并发, "
+            f"共 {sum(results)} 个片段, 耗时 {blocking_elapsed:.2f}s "
+            f"(单路理论耗时 {single:.2f}s, "
+            f"倍数 {blocking_elapsed / single:.1f}x)"
+        )
+
+        start = time.perf_counter()
+        results = asyncio.run(run_async(args.streams))
+        async_elapsed = time.perf_counter() - start
+        print(
+            f"异步实现: {args.streams} 路并发, "
+            f"共 {sum(results)} 个片段, 耗时 {async_elapsed:.2f}s "
+            f"(单路理论耗时 {single:.2f}s, "
+            f"倍数 {async_elapsed / single:.1f}x)"
+        )
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
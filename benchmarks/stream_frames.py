@@ -0,0 +1,116 @@
+"""WebSocket 流式输出帧数与CPU开销压测
+
+在同一进程内启动一个 WebSocket 服务，按给定速率输出一个很长的回答，
+分别以逐片段发送（flush_ms=0）和合并发送的方式测量客户端收到的帧数、
+字节数、每秒帧数以及整个进程消耗的CPU时间。
+
+用法:
+    python -m benchmarks.stream_frames --deltas 5000 --rate 2000 --clients 20
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from tornado.web import Application
+from tornado.websocket import WebSocketHandler, websocket_connect
+from utils.stream_writer import CoalescingWriter
+
+
+class StreamSocket(WebSocketHandler):
+    """按固定速率输出片段的测试服务"""
+
+    def initialize(self, options):
+        self.options = options
+
+    async def open(self):
+        flush_ms = int(self.get_argument("flush_ms", 40))
+        writer = CoalescingWriter(
+            lambda text: self.write_message(
+                json.dumps({"type": "stream", "content": text})
+            ),
+            interval=flush_ms / 1000,
+            max_bytes=1024,
+            max_interval=0.2,
+        )
+        deltas = self.options["deltas"]
+        # 每 10 毫秒产生一批片段，模拟上游的输出速率
+        per_tick = max(1, self.options["rate"] // 100)
+        for index in range(deltas):
+            writer.write("字")
+            if index % per_tick == per_tick - 1:
+                await asyncio.sleep(0.01)
+        writer.close()
+        self.write_message(json.dumps({"type": "done"}))
+
+
+async def run_client(url):
+    connection = await websocket_connect(url)
+    frames = 0
+    size = 0
+    while True:
+        message = await connection.read_message()
+        if message is None:
+            break
+        frames += 1
+        size += len(message.encode("utf-8"))
+        if json.loads(message)["type"] == "done":
+            break
+    connection.close()
+    return frames, size
+
+
+async def run(port, flush_ms, clients):
+    url = f"ws://127.0.0.1:{port}/ws?flush_ms={flush_ms}"
+    start_cpu = time.process_time()
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run_client(url) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - start_cpu
+    frames = sum(frames for frames, _ in results)
+    size = sum(size for _, size in results)
+    return frames, size, elapsed, cpu
+
+
+async def main(args):
+    sockets = bind_sockets(0, "127.0.0.1")
+    port = sockets[0].getsockname()[1]
+    app = Application(
+        [
+            (
+                r"/ws",
+                StreamSocket,
+                {"options": {"deltas": args.deltas, "rate": args.rate}},
+            )
+        ]
+    )
+    server = HTTPServer(app)
+    server.add_sockets(sockets)
+
+    for flush_ms in (0, *args.flush_ms):
+        frames, size, elapsed, cpu = await run(port, flush_ms, args.clients)
+        label = "逐片段发送" if flush_ms == 0 else f"合并发送({flush_ms}ms)"
+        print(
+            f"{label:<16} 每个回答 {frames / args.clients:.0f} 帧, "
+            f"{size / args.clients / 1024:.1f} KB, "
+            f"{frames / elapsed:.0f} 帧/秒, "
+            f"每个回答CPU {cpu / args.clients * 1000:.2f} ms"
+        )
+    server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="WebSocket 流式输出帧数压测")
+    parser.add_argument("--deltas", type=int, default=5000, help="每个回答的片段数")
+    parser.add_argument("--rate", type=int, default=2000, help="每秒产生的片段数")
+    parser.add_argument("--clients", type=int, default=20, help="并发客户端数")
+    parser.add_argument(
+        "--flush-ms",
+        type=int,
+        nargs="+",
+        default=[30, 50],
+        help="要对比的合并时间窗口（毫秒）",
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -13,6 +14,153 @@ SETTINGS = {
         "host": os.getenv("MONGODB_HOST", "localhost"),
         "port": int(os.getenv("MONGODB_PORT", 27018)),
         "name": os.getenv("MONGODB_NAME", "ymbox_ai_chat"),
+        # 执行数据库操作的线程池大小
+        "max_workers": int(os.getenv("MONGODB_MAX_WORKERS", 32)),
+        # 聊天消息的后写队列：合并各会话的消息批量写入
+        "write_behind": {
+            # 合并写入的时间窗口（毫秒）
+            "flush_interval_ms": int(os.getenv("MESSAGE_FLUSH_INTERVAL_MS", 20)),
+            # 每批最多写入的消息数
+            "max_batch": int(os.getenv("MESSAGE_FLUSH_MAX_BATCH", 500)),
+            # ack：AI回复写入数据库后再发送 done；async：立即发送，后台写入
+            "durability": os.getenv("MESSAGE_DURABILITY", "ack"),
+            # 写入失败时的重试次数
+            "max_retries": 3,
+        },
+    },
+    # WebSocket 流式输出：合并片段后再发送，客户端可在连接时通过查询参数调整
+    "websocket": {
+        # 合并时间窗口（毫秒），为 0 时每个片段单独发送
+        "flush_interval_ms": int(os.getenv("WS_FLUSH_INTERVAL_MS", 40)),
+        # 缓存达到该字节数时立即发送
+        "flush_bytes": int(os.getenv("WS_FLUSH_BYTES", 1024)),
+        # 自适应时间窗口的上限（毫秒），客户端请求的窗口也不能超过该值
+        "max_flush_interval_ms": int(os.getenv("WS_MAX_FLUSH_INTERVAL_MS", 200)),
+        # permessage-deflate 压缩（默认关闭），级别 1-9，内存级别 1-9
+        "compression": os.getenv("WS_COMPRESSION", "false").lower() == "true",
+        "compression_level": int(os.getenv("WS_COMPRESSION_LEVEL", 6)),
+        "compression_mem_level": int(os.getenv("WS_COMPRESSION_MEM_LEVEL", 5)),
+        # 每个用户同时进行的生成数上限（多进程部署时按进程统计）
+        "max_generations_per_user": int(os.getenv("WS_MAX_GENERATIONS_PER_USER", 3)),
+        # 连接断开后等待客户端重连恢复生成的秒数，超时取消；为 0 时立即取消
+        "resume_grace_seconds": float(os.getenv("WS_RESUME_GRACE_SECONDS", 30)),
+        # 生成结束后缓冲保留的秒数，供稍后重连的客户端取回结果
+        "resume_ttl_seconds": float(os.getenv("WS_RESUME_TTL_SECONDS", 120)),
+    },
+    # 多进程部署时进程间的消息广播（转发取消、恢复生成等请求）
+    "pubsub": {
+        # local：仅进程内（单进程部署）；mongo：基于 capped collection 跨进程广播
+        "backend": os.getenv("PUBSUB_BACKEND", "local"),
+        # mongo 后端 capped collection 的大小（字节）
+        "mongo_size": int(os.getenv("PUBSUB_MONGO_SIZE", 16 * 1024 * 1024)),
+        # 跨进程恢复生成时等待持有进程回应的秒数
+        "resume_timeout_seconds": float(os.getenv("PUBSUB_RESUME_TIMEOUT", 3)),
+    },
+    # 生成请求的令牌桶限流（每分钟请求数为 0 的范围不限流）
+    "rate_limit": {
+        "enabled": os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true",
+        # local：进程内；mongo：多个工作进程共享 rate_limits 集合中的令牌桶
+        "backend": os.getenv("RATE_LIMIT_BACKEND", "local"),
+        # 每个用户：每分钟请求数和突发容量
+        "user_per_minute": float(os.getenv("RATE_LIMIT_USER_PER_MINUTE", 20)),
+        "user_burst": float(os.getenv("RATE_LIMIT_USER_BURST", 5)),
+        # 每个模型（所有用户共享）
+        "model_per_minute": float(os.getenv("RATE_LIMIT_MODEL_PER_MINUTE", 0)),
+        "model_burst": float(os.getenv("RATE_LIMIT_MODEL_BURST", 20)),
+        # 按模型单独设置每分钟请求数，JSON，如 {"gpt-4": 60}
+        "models": json.loads(os.getenv("RATE_LIMIT_MODELS") or "{}"),
+        # 全局
+        "global_per_minute": float(os.getenv("RATE_LIMIT_GLOBAL_PER_MINUTE", 0)),
+        "global_burst": float(os.getenv("RATE_LIMIT_GLOBAL_BURST", 50)),
+        # 令牌能在该秒数内补足时排队等待，否则立即返回 retry_after
+        "max_wait_seconds": float(os.getenv("RATE_LIMIT_MAX_WAIT", 10)),
+    },
+    # Prometheus 指标导出
+    "metrics": {
+        # 是否在应用端口上提供 /metrics
+        "enabled": os.getenv("METRICS_ENABLED", "true").lower() == "true",
+        # 大于 0 时每个工作进程另外在 METRICS_PORT + 进程序号 上导出（多进程部署）
+        "port": int(os.getenv("METRICS_PORT", 0)),
+    },
+    # 用量统计：每轮对话的 token 数、延迟和上游状态
+    "usage": {
+        # 内存中的累加值汇总到 usage 集合的间隔（秒）
+        "rollup_interval": float(os.getenv("USAGE_ROLLUP_INTERVAL", 60)),
+        # usage 集合中按小时汇总的数据保留天数
+        "retention_days": int(os.getenv("USAGE_RETENTION_DAYS", 90)),
+    },
+    # 会话列表（侧边栏）
+    "conversations": {
+        "page_size": int(os.getenv("CONVERSATIONS_PAGE_SIZE", 50)),
+        "max_page_size": 200,
+        # 最后一条消息摘要的最大字符数
+        "preview_chars": int(os.getenv("CONVERSATIONS_PREVIEW_CHARS", 80)),
+    },
+    # 会话内的消息列表
+    "messages": {
+        "page_size": 10,
+        "max_page_size": 100,
+        # 定位消息时前后各返回的最多消息数
+        "max_locate_window": 100,
+    },
+    # 会话删除与归档
+    "lifecycle": {
+        # 消息数超过该值的会话删除时由后台任务分批删除消息
+        "background_delete_threshold": int(
+            os.getenv("CONVERSATION_BACKGROUND_DELETE_THRESHOLD", 5000)
+        ),
+        # 后台任务每批删除的消息数
+        "delete_batch_size": int(os.getenv("CONVERSATION_DELETE_BATCH_SIZE", 1000)),
+        # 一次批量删除/归档最多处理的会话数
+        "max_bulk": 1000,
+        # 最后消息早于该天数的会话自动归档，0 表示不自动归档
+        "archive_after_days": float(os.getenv("CONVERSATION_ARCHIVE_AFTER_DAYS", 0)),
+        # 每次自动归档最多处理的会话数
+        "archive_batch": 100,
+        # 归档块压缩前的最大字节数（BSON 文档上限为 16MB）
+        "archive_chunk_bytes": 4 * 1024 * 1024,
+        "compression_level": 6,
+        # 归档/恢复一个会话时持有的租约（秒），每处理一个归档块续期一次；
+        # 持有租约期间其他进程不会同时归档或恢复该会话
+        "archive_lease": 300,
+        # 后台任务的执行间隔（秒）
+        "job_interval": float(os.getenv("CONVERSATION_LIFECYCLE_INTERVAL", 60)),
+    },
+    # 会话导出与导入（NDJSON）
+    "export": {
+        # 导出时每批读取并写出的文档数
+        "batch_size": int(os.getenv("EXPORT_BATCH_SIZE", 1000)),
+        # 导入时每次 insert_many 的文档数
+        "import_batch_size": int(os.getenv("IMPORT_BATCH_SIZE", 1000)),
+        # 导入请求体的最大字节数（流式接收，不会整体读入内存）
+        "max_import_bytes": int(os.getenv("IMPORT_MAX_BYTES", 1024 * 1024 * 1024)),
+        # gzip 压缩级别
+        "compression_level": 6,
+    },
+    # 消息搜索
+    "search": {
+        # 参与相关度排序的最多候选消息数
+        "max_candidates": int(os.getenv("SEARCH_MAX_CANDIDATES", 500)),
+        "page_size": 20,
+        "max_page_size": 100,
+    },
+    # 会话与最近消息的内存缓存
+    "cache": {
+        # 最多缓存的会话数
+        "max_conversations": int(os.getenv("CACHE_MAX_CONVERSATIONS", 10000)),
+        # 缓存有效期（秒）；多进程部署时修改通过 pubsub 广播给其他进程，
+        # 广播丢失时这也是最长的不一致时间（local 后端下多进程不使用缓存）
+        "ttl": int(os.getenv("CACHE_TTL", 300)),
+        # 每个会话缓存的最近消息条数
+        "recent_messages": int(os.getenv("CACHE_RECENT_MESSAGES", 50)),
+    },
+    # 回答缓存：模型和上下文完全相同的请求直接返回缓存的回答（默认关闭）
+    "response_cache": {
+        "enabled": os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true",
+        # 进程内最多缓存的回答数
+        "max_entries": int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000)),
+        # 缓存有效期（秒），MongoDB 中的条目由 TTL 索引删除
+        "ttl": int(os.getenv("RESPONSE_CACHE_TTL", 86400)),
     },
 }
 
@@ -21,6 +169,65 @@ OPENAI_CONFIG = {
     "api_key": os.getenv("OPENAI_API_KEY"),
     "base_url": os.getenv("OPENAI_BASE_URL", "https://api.apiyi.com"),
     "default_model": "gpt-3.5-turbo",
+    # 上游请求超时（秒），流式回答可能持续较长时间
+    "connect_timeout": float(os.getenv("OPENAI_CONNECT_TIMEOUT", 10)),
+    "request_timeout": float(os.getenv("OPENAI_REQUEST_TIMEOUT", 600)),
+    # 流式请求带上 stream_options.include_usage，不支持该参数的上游可关闭
+    "stream_usage": os.getenv("OPENAI_STREAM_USAGE", "true").lower() == "true",
+    # 多个上游（故障转移/对冲请求），JSON 列表，每项包含 name、base_url、api_key，
+    # 可选 models（只服务这些模型）；为空时只使用上面的 base_url / api_key
+    "providers": json.loads(os.getenv("OPENAI_PROVIDERS") or "[]"),
+    # 上游路由：收到第一个片段前失败时重试，连续失败的上游熔断
+    "router": {
+        # 每次对话最多请求上游的次数（含重试）
+        "max_attempts": int(os.getenv("OPENAI_MAX_ATTEMPTS", 3)),
+        # 第 n 次重试前等待 retry_backoff * 2^(n-1) 秒（带随机抖动）
+        "retry_backoff": float(os.getenv("OPENAI_RETRY_BACKOFF", 0.2)),
+        # 熔断：连续失败次数，或最近 breaker_window 次请求的错误率达到阈值
+        "breaker_failures": int(os.getenv("OPENAI_BREAKER_FAILURES", 5)),
+        "breaker_error_rate": float(os.getenv("OPENAI_BREAKER_ERROR_RATE", 0.5)),
+        "breaker_window": 20,
+        # 熔断后经过该秒数放行一个试探请求，成功则恢复
+        "breaker_cooldown": float(os.getenv("OPENAI_BREAKER_COOLDOWN", 30)),
+        # 对冲请求：首字延迟超过该上游历史首字延迟的分位数时，向另一个上游再发一次
+        "hedge": os.getenv("OPENAI_HEDGE", "false").lower() == "true",
+        "hedge_percentile": float(os.getenv("OPENAI_HEDGE_PERCENTILE", 0.95)),
+        # 对冲等待时间的上下限（秒）；样本不足时使用上限
+        "hedge_min_delay": float(os.getenv("OPENAI_HEDGE_MIN_DELAY", 0.5)),
+        "hedge_max_delay": float(os.getenv("OPENAI_HEDGE_MAX_DELAY", 5)),
+        # 每个上游保留的首字延迟样本数
+        "latency_window": 200,
+    },
+    # 上下文组装配置
+    "context": {
+        # 为模型回复预留的token数
+        "reserve_tokens": int(os.getenv("OPENAI_RESERVE_TOKENS", 1024)),
+        # 未知模型的上下文窗口大小
+        "default_context_size": int(os.getenv("OPENAI_DEFAULT_CONTEXT_SIZE", 4096)),
+        # 最多携带的历史消息条数
+        "max_messages": int(os.getenv("OPENAI_MAX_CONTEXT_MESSAGES", 500)),
+        # 读取历史消息的批大小
+        "batch_size": 50,
+    },
+    # 上游连接池配置
+    "pool": {
+        # 进程内同时进行的上游请求数上限，超出的请求会排队等待
+        "max_clients": int(os.getenv("OPENAI_MAX_CLIENTS", 500)),
+        # 每个主机的最大连接数（需要 pycurl）
+        "max_host_connections": int(os.getenv("OPENAI_MAX_HOST_CONNECTIONS", 100)),
+        # 是否启用 HTTP/2（需要 pycurl）
+        "http2": os.getenv("OPENAI_HTTP2", "false").lower() == "true",
+    },
+    # 模型目录：后台定期刷新上游模型列表，接口直接返回缓存
+    "catalog": {
+        # 刷新间隔（秒），超过该时间的缓存视为过期，先返回旧数据再在后台刷新
+        "refresh_interval": float(os.getenv("MODELS_REFRESH_INTERVAL", 300)),
+        # 请求上游 /v1/models 的超时（秒）
+        "request_timeout": float(os.getenv("MODELS_REQUEST_TIMEOUT", 10)),
+        # 启动后还没有取到上游列表时，请求最多等待第一次刷新的秒数
+        "cold_wait": float(os.getenv("MODELS_COLD_WAIT", 2)),
+    },
+    # 上游不可用时使用的默认模型列表
     "models": [
         {"id": "gpt-4", "object": "model", "owned_by": "openai", "permission": []},
         {"id": "gpt-4-0314", "object": "model", "owned_by": "openai", "permission": []},
@@ -0,0 +1,128 @@
+"""检查 Database 各方法的热点查询是否命中索引
+
+用法:
+    python explain_queries.py                # 使用现有数据库中的样例数据
+    python explain_queries.py --seed 20000   # 在独立的测试库中写入样例数据后检查
+
+任一查询出现 COLLSCAN（全表扫描）时以非零状态码退出，可用于CI检查。
+"""
+
+import argparse
+import hashlib
+import sys
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import MongoClient
+from config.settings import SETTINGS
+from utils.indexes import ensure_indexes, explain_hot_queries
+from utils.search import index_tokens
+
+
+def seed(db, messages: int) -> None:
+    """写入样例数据：若干用户、会话和消息"""
+    for name in ("users", "conversations", "messages"):
+        db[name].drop()
+
+    users = [
+        {
+            "_id": ObjectId(),
+            "username": f"user{i}",
+            "password": hashlib.sha256(f"password{i}".encode()).hexdigest(),
+            "created_at": datetime.utcnow(),
+        }
+        for i in range(20)
+    ]
+    db.users.insert_many(users)
+
+    start = datetime.utcnow() - timedelta(days=30)
+    conversations = [
+        {
+            "_id": ObjectId(),
+            "user_id": users[i % len(users)]["_id"],
+            "title": f"会话{i}",
+            "system_prompt": "",
+            "model_id": "gpt-3.5-turbo",
+            "created_at": start,
+            "last_message_at": start + timedelta(minutes=i),
+        }
+        for i in range(200)
+    ]
+    db.conversations.insert_many(conversations)
+
+    batch = []
+    for i in range(messages):
+        batch.append(
+            {
+                "conversation_id": conversations[i % len(conversations)]["_id"],
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": f"消息内容 {i}",
+                "search_tokens": index_tokens(f"消息内容 {i}"),
+                "created_at": start + timedelta(seconds=i),
+            }
+        )
+        if len(batch) >= 5000:
+            db.messages.insert_many(batch)
+            batch = []
+    if batch:
+        db.messages.insert_many(batch)
+
+
+def load_sample(db):
+    """从数据库中取一组样例ID"""
+    message = db.messages.find_one(sort=[("created_at", -1)])
+    if not message:
+        raise RuntimeError("数据库中没有消息，请使用 --seed 写入样例数据")
+    conversation = db.conversations.find_one({"_id": message["conversation_id"]})
+    user = db.users.find_one({"_id": conversation["user_id"]})
+    return {
+        "user_id": user["_id"],
+        "username": user["username"],
+        "password": user["password"],
+        "conversation_id": conversation["_id"],
+        "message_id": message["_id"],
+        "created_at": message["created_at"],
+        "search_tokens": message.get("search_tokens", ["消息"])[:2],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="检查热点查询的执行计划")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="写入指定数量的样例消息到独立的测试库（库名加 _explain 后缀）",
+    )
+    args = parser.parse_args()
+
+    mongodb_uri = (
+        f"mongodb://{SETTINGS['database']['host']}:{SETTINGS['database']['port']}"
+    )
+    client = MongoClient(mongodb_uri)
+    try:
+        database_name = SETTINGS["database"]["name"]
+        if args.seed:
+            database_name += "_explain"
+        db = client[database_name]
+
+        if args.seed:
+            seed(db, args.seed)
+        ensure_indexes(db)
+
+        results = explain_hot_queries(db, load_sample(db))
+        for result in results:
+            flag = "全表扫描!" if result["collscan"] else "OK"
+            print(
+                f"[{flag}] {result['method']:<28} {result['collection']:<14} "
+                f"{' <- '.join(result['stages'])}  "
+                f"索引: {', '.join(result['indexes']) or '-'}"
+            )
+
+        if any(result["collscan"] for result in results):
+            print("存在全表扫描的热点查询")
+            sys.exit(1)
+        print("所有热点查询均使用索引")
+    finally:
+        if args.seed:
+            client.drop_database(database_name)
+        client.close()
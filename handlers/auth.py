@@ -1,7 +1,7 @@
 import json
 import logging
 from tornado.web import RequestHandler
-from utils.database import Database
+from utils.async_database import AsyncDatabase
 from bson import ObjectId
 
 logger = logging.getLogger(__name__)
@@ -24,7 +24,7 @@ class AuthHandler(RequestHandler):
                 return None
         return None
 
-    def post(self):
+    async def post(self):
         """处理登录请求"""
         try:
             data = json.loads(self.request.body)
@@ -40,7 +40,7 @@ class AuthHandler(RequestHandler):
                 return
 
             # 查找用户
-            user = Database.get_user(username, password)
+            user = await AsyncDatabase.get_user(username, password)
             if user:
                 user_id = str(user["_id"])
                 logger.info(f"用户 {username} 登录成功，ID: {user_id}")
@@ -66,7 +66,7 @@ class AuthHandler(RequestHandler):
             self.set_status(500)
             self.write({"error": str(e)})
 
-    def get(self):
+    async def get(self):
         """获取当前用户信息"""
         user_id = self.get_current_user()
         if not user_id:
@@ -83,7 +83,7 @@ class AuthHandler(RequestHandler):
                 self.write({"error": "无效的用户ID"})
                 return
 
-            user = Database.get_user_by_id(user_id)
+            user = await AsyncDatabase.get_user_by_id(user_id)
             if user:
                 logger.info(f"获取用户信息成功: {user['username']}")
                 self.write(
@@ -1,13 +1,45 @@
+import asyncio
 import json
 import logging
+import time
 from datetime import datetime
+from tornado.ioloop import IOLoop
 from tornado.websocket import WebSocketHandler
-from utils.database import Database
-from utils.openai_client import OpenAIClient
+from utils.async_database import AsyncDatabase
+from utils.conversation_lifecycle import ConversationLifecycle
+from utils.provider_router import ProviderRouter
+from utils.context_builder import ContextBuilder, TokenCounter
+from utils.stream_writer import CoalescingWriter
+from utils.generation_buffer import GENERATIONS_CHANNEL, GenerationRegistry
+from utils.pubsub import PubSub
+from utils.write_behind import MessageWriter
+from utils.usage import UsageTracker
+from utils.rate_limit import RateLimited, RateLimiter
+from utils.response_cache import ResponseCache
+from utils.metrics import Counter, Gauge, Histogram
+from utils import frame_protocol
+from config.settings import SETTINGS
 from bson import ObjectId, json_util
 
 logger = logging.getLogger(__name__)
 
+WS_CONNECTIONS = Gauge("mychat_ws_connections", "本进程的 WebSocket 连接数")
+GENERATIONS_ACTIVE = Gauge("mychat_generations_active", "本进程进行中的生成数")
+GENERATIONS = Counter(
+    "mychat_generations_total",
+    "完成的生成（ok / error / cancelled / cached）",
+    ["status"],
+)
+GENERATION_TTFT_SECONDS = Histogram(
+    "mychat_generation_ttft_seconds", "从请求上游到收到第一个片段的时间"
+)
+GENERATION_SECONDS = Histogram(
+    "mychat_generation_seconds", "从请求上游到生成结束的时间", ["status"]
+)
+GENERATION_TOKENS = Counter(
+    "mychat_generation_tokens_total", "输入/输出 token 数", ["model", "type"]
+)
+
 
 class ChatWebSocket(WebSocketHandler):
     """聊天WebSocket处理器"""
@@ -21,64 +53,298 @@ class ChatWebSocket(WebSocketHandler):
         user_id = self.get_secure_cookie("user_id")
         return user_id.decode("utf-8") if user_id else None
 
+    def get_compression_options(self):
+        """启用 permessage-deflate 压缩（需在配置中开启）"""
+        ws_config = SETTINGS["websocket"]
+        if not ws_config["compression"]:
+            return None
+        return {
+            "compression_level": ws_config["compression_level"],
+            "mem_level": ws_config["compression_mem_level"],
+        }
+
+    def select_subprotocol(self, subprotocols):
+        """协商帧协议：短字段名JSON或msgpack，未请求时使用默认JSON"""
+        return frame_protocol.select_protocol(subprotocols)
+
+    # 每个用户正在进行的生成数（本进程内所有连接共享）
+    active_generations = {}
+    # 本进程内的连接：connection_id -> ChatWebSocket，用于接收其他进程转发的消息
+    connections = {}
+
     def open(self):
         """处理WebSocket连接打开"""
+        # 本连接上挂接的生成：generation_id -> Generation
+        self.generations = {}
+        # 在其他工作进程上进行、已恢复到本连接的生成：generation_id -> 超时计时器
+        self.remote_generations = {}
+        self.connection_id = str(ObjectId())
         if not self.current_user:
             self.close(403, "未登录")
             return
+
+        # 协商流式输出的合并参数：客户端可通过 flush_ms / flush_bytes 调整
+        ws_config = SETTINGS["websocket"]
+        max_interval = ws_config["max_flush_interval_ms"]
+        try:
+            flush_ms = int(
+                self.get_argument("flush_ms", ws_config["flush_interval_ms"])
+            )
+            flush_bytes = int(
+                self.get_argument("flush_bytes", ws_config["flush_bytes"])
+            )
+        except ValueError:
+            flush_ms = ws_config["flush_interval_ms"]
+            flush_bytes = ws_config["flush_bytes"]
+        self.flush_interval = min(max(flush_ms, 0), max_interval) / 1000
+        self.flush_bytes = min(max(flush_bytes, 1), 65536)
+
+        ChatWebSocket.connections[self.connection_id] = self
         logger.info(f"WebSocket连接已打开: {self.current_user}")
+        self.write_message(
+            {
+                "type": "config",
+                "flush_ms": int(self.flush_interval * 1000),
+                "flush_bytes": self.flush_bytes,
+            }
+        )
 
     def on_close(self):
-        """处理WebSocket连接关闭"""
-        logger.info(f"WebSocket连接已关闭: {self.current_user}")
-
-    def _format_message(self, message):
-        """格式化消息，只保留 OpenAI API 所需的字段"""
-        # 只保留 OpenAI API 所需的基本字段
-        formatted = {"role": message["role"], "content": message["content"]}
+        """处理WebSocket连接关闭
 
-        # 如果有 name 字段（用于 function calling），也保留它
-        if "name" in message:
-            formatted["name"] = message["name"]
+        进行中的生成与连接分离，等待客户端重连恢复；
+        超过 resume_grace_seconds 仍未恢复则取消并中止上游请求。
+        """
+        logger.info(f"WebSocket连接已关闭: {self.current_user}")
+        grace = SETTINGS["websocket"]["resume_grace_seconds"]
+        for generation in list(self.generations.values()):
+            generation.detach(grace)
+        self.generations.clear()
 
-        return formatted
+        ChatWebSocket.connections.pop(self.connection_id, None)
+        for generation_id in list(self.remote_generations):
+            self._forget_remote(generation_id)
+            self._publish_request("detach", generation_id)
 
     def on_message(self, message):
-        """处理接收到的消息"""
+        """处理接收到的消息
+
+        生成在独立任务中进行，on_message 立即返回，
+        因此同一连接上可以同时进行多个生成，也能随时收到取消和恢复请求。
+        """
         try:
-            data = json.loads(message)
-            conversation_id = data.get("conversation_id")
-            content = data.get("content")
-            role = data.get("role", "user")
+            data = frame_protocol.decode(message, self.selected_subprotocol)
+        except frame_protocol.FrameError:
+            self.write_message({"type": "error", "error": "无效的JSON数据"})
+            return
 
-            if not conversation_id or not content:
+        if data.get("type") == "cancel":
+            # 未指定 generation_id 时取消本连接上的全部生成
+            cancelled = self.cancel_generations(data.get("generation_id"))
+            if not cancelled:
                 self.write_message(
-                    {"type": "error", "error": "会话ID和消息内容不能为空"}
+                    {
+                        "type": "error",
+                        "error": "没有可取消的生成",
+                        "generation_id": data.get("generation_id"),
+                    }
                 )
-                return
+            return
+
+        if data.get("type") == "resume":
+            self.resume_generation(data.get("generation_id"), data.get("last_seq"))
+            return
+
+        conversation_id = data.get("conversation_id")
+        content = data.get("content")
+        if not conversation_id or not content:
+            self.write_message({"type": "error", "error": "会话ID和消息内容不能为空"})
+            return
+
+        # 限制每个用户同时进行的生成数（跨连接统计）
+        max_generations = SETTINGS["websocket"]["max_generations_per_user"]
+        active = ChatWebSocket.active_generations.get(self.current_user, 0)
+        if active >= max_generations:
+            self.write_message(
+                {
+                    "type": "error",
+                    "error": f"同时进行的回答不能超过{max_generations}个，请稍后再试",
+                }
+            )
+            return
+
+        generation = GenerationRegistry.create(
+            str(ObjectId()), self.current_user, conversation_id
+        )
+        generation.attach(self)
+        generation.task = asyncio.ensure_future(self.generate(generation, data))
+        self.generations[generation.generation_id] = generation
+        ChatWebSocket.active_generations[self.current_user] = active + 1
+        generation.task.add_done_callback(
+            lambda _: ChatWebSocket._on_generation_done(generation)
+        )
+
+    def cancel_generations(self, generation_id=None) -> int:
+        """取消生成任务
+
+        Args:
+            generation_id: 要取消的生成ID，为None时取消本连接上的全部生成
+
+        Returns:
+            int: 取消的任务数
+        """
+        if generation_id is None:
+            generations = list(self.generations.values())
+            remote_ids = list(self.remote_generations)
+        else:
+            generation = self.generations.get(generation_id)
+            generations = [generation] if generation is not None else []
+            remote_ids = (
+                [generation_id] if generation_id in self.remote_generations else []
+            )
+
+        for generation in generations:
+            generation.task.cancel()
+        # 在其他工作进程上进行的生成，由持有它的进程取消
+        for remote_id in remote_ids:
+            self._publish_request("cancel", remote_id)
+        return len(generations) + len(remote_ids)
+
+    def resume_generation(self, generation_id, last_seq) -> None:
+        """重连后恢复生成：挂接到本连接并补发 last_seq 之后的片段
+
+        Args:
+            generation_id: 生成ID
+            last_seq: 客户端已收到的最后一个片段序号
+        """
+        try:
+            last_seq = int(last_seq or 0)
+        except (TypeError, ValueError):
+            last_seq = 0
+
+        generation = GenerationRegistry.get(generation_id, self.current_user)
+        if generation is not None:
+            logger.info(f"恢复生成: {generation_id}, last_seq={last_seq}")
+            generation.resume(self, last_seq)
+            return
+
+        if PubSub.is_local():
+            self._resume_failed(generation_id)
+            return
+
+        # 生成可能在其他工作进程上，广播恢复请求，超时没有回应则视为不存在
+        timeout = SETTINGS["pubsub"]["resume_timeout_seconds"]
+        self._forget_remote(generation_id)
+        self.remote_generations[generation_id] = IOLoop.current().call_later(
+            timeout, self._resume_failed, generation_id
+        )
+        self._publish_request("resume", generation_id, last_seq=last_seq)
+
+    def _resume_failed(self, generation_id) -> None:
+        """恢复失败：生成不存在或已过期"""
+        self.remote_generations.pop(generation_id, None)
+        self.write_message(
+            {
+                "type": "error",
+                "error": "生成不存在或已过期",
+                "generation_id": generation_id,
+            }
+        )
+
+    def _forget_remote(self, generation_id) -> None:
+        """不再跟踪其他进程上的生成"""
+        timer = self.remote_generations.pop(generation_id, None)
+        if timer is not None:
+            IOLoop.current().remove_timeout(timer)
+
+    def _publish_request(self, op, generation_id, **kwargs) -> None:
+        """向持有生成的工作进程广播请求"""
+        PubSub.publish(
+            GENERATIONS_CHANNEL,
+            {
+                "op": op,
+                "generation_id": generation_id,
+                "user_id": self.current_user,
+                "worker_id": PubSub.worker_id,
+                "connection_id": self.connection_id,
+                **kwargs,
+            },
+        )
+
+    @classmethod
+    def on_worker_message(cls, request):
+        """接收其他工作进程转发给本进程连接的消息"""
+        connection = cls.connections.get(request.get("connection_id"))
+        if connection is None:
+            return
 
+        message = request["message"]
+        generation_id = message.get("generation_id")
+        if generation_id in connection.remote_generations:
+            # 收到回应后不再等待超时；生成结束后不再跟踪
+            timer = connection.remote_generations[generation_id]
+            if timer is not None:
+                IOLoop.current().remove_timeout(timer)
+                connection.remote_generations[generation_id] = None
+            if message.get("type") in ("done", "cancelled", "error"):
+                connection.remote_generations.pop(generation_id, None)
+        connection.write_message(message)
+
+    @classmethod
+    def _on_generation_done(cls, generation):
+        """生成任务结束（完成、失败或取消）时释放配额"""
+        if generation.handler is not None:
+            generation.handler.generations.pop(generation.generation_id, None)
+        GenerationRegistry.release(generation.generation_id)
+
+        user_id = generation.user_id
+        remaining = cls.active_generations.get(user_id, 1) - 1
+        if remaining > 0:
+            cls.active_generations[user_id] = remaining
+        else:
+            cls.active_generations.pop(user_id, None)
+
+    async def generate(self, generation, data):
+        """处理一条用户消息并流式返回AI回答
+
+        输出写入生成缓冲，由缓冲转发给当前挂接的连接，连接断开后生成继续，
+        客户端可重连恢复。被取消时（用户取消或重连超时）中止上游请求，
+        已收到的部分回答仍会保存为助手消息。请求上游后无论结果如何，
+        都会记录本轮的用量（UsageTracker）。开启回答缓存时，上下文完全相同的
+        请求直接回放缓存的回答（done 消息带 cached: true），不请求上游。
+
+        Args:
+            generation: 生成缓冲（Generation）
+            data: 客户端发来的消息
+        """
+        conversation_id = generation.conversation_id
+        collected_content = []
+        persisted = False
+        # 本轮用量：请求上游后才记录
+        turn = {
+            "start": None,
+            "ttft": None,
+            "usage": None,
+            "upstream_status": None,
+            "finish_reason": None,
+        }
+        status = "error"
+        try:
             # 获取会话信息
-            conversation = Database.get_conversation(conversation_id)
+            conversation = await AsyncDatabase.get_conversation(conversation_id)
             if not conversation:
-                self.write_message({"type": "error", "error": "会话不存在"})
+                generation.finish({"type": "error", "error": "会话不存在"})
                 return
 
             logger.info(f"获取到会话信息: {conversation}")
 
             # 验证用户权限
-            if str(conversation["user_id"]) != self.current_user:
-                self.write_message({"type": "error", "error": "无权访问此会话"})
+            if str(conversation["user_id"]) != generation.user_id:
+                generation.finish({"type": "error", "error": "无权访问此会话"})
                 return
 
-            # 保存用户消息
-            user_message = Database.create_message(conversation_id, role, content)
-            self.write_message(
-                {"type": "user", "message": json.loads(json_util.dumps(user_message))}
-            )
-
-            # 获取会话历史
-            messages = Database.get_messages(conversation_id)
-            formatted_messages = []
+            # 继续已归档的会话前先恢复其消息
+            conversation = await ConversationLifecycle.ensure_restored(conversation)
 
             # 检查系统提示词
             system_prompt = None
@@ -89,65 +355,218 @@ class ChatWebSocket(WebSocketHandler):
 
             logger.info(f"系统提示词: {system_prompt}")
 
-            # 添加系统提示
-            if system_prompt:
-                formatted_messages.append({"role": "system", "content": system_prompt})
-                logger.info("已添加系统提示词到消息列表")
-
-            # 添加历史消息，确保每条消息都是可序列化的
-            for msg in messages:
-                formatted_messages.append(self._format_message(msg))
+            # 直接使用会话中的model_id
+            model_id = conversation.get("model_id")
+            if isinstance(model_id, dict):
+                model_id = model_id.get("model_id")
+            model_id = model_id or "gpt-3.5-turbo"
 
-            # logger.info(f"格式化后的消息列表: {formatted_messages}")
+            logger.info(f"使用的模型ID: {model_id}")
 
-            # 调用OpenAI API
-            client = OpenAIClient()
+            # 限流：令牌短时间内能补足时排队（通知客户端），否则返回 retry_after
             try:
-                # 直接使用会话中的model_id
-                model_id = conversation.get("model_id")
-                if isinstance(model_id, dict):
-                    model_id = model_id.get("model_id")
+                await RateLimiter.acquire(
+                    generation.user_id,
+                    model_id,
+                    on_queued=lambda wait: generation.send(
+                        {"type": "queued", "retry_after": round(wait, 1)}
+                    ),
+                )
+            except RateLimited as e:
+                generation.finish({"type": "error", **e.to_dict()})
+                return
 
-                logger.info(f"使用的模型ID: {model_id}")
+            # 保存用户消息：组装上下文时要从数据库读取，始终等待写入完成
+            user_message = await MessageWriter.create_message(
+                conversation_id,
+                data.get("role", "user"),
+                data.get("content"),
+                wait=True,
+            )
+            generation.send(
+                {"type": "user", "message": json.loads(json_util.dumps(user_message))}
+            )
 
-                response = client.chat_stream(
-                    messages=formatted_messages, model=model_id or "gpt-3.5-turbo"
-                )
+            # 按模型上下文窗口组装历史消息（按时间正序）
+            formatted_messages = await AsyncDatabase.run(
+                ContextBuilder.build, conversation_id, model_id, system_prompt
+            )
 
-                # 处理流式响应
-                collected_content = []
-                for content in response:
-                    if content:
-                        collected_content.append(content)
-                        self.write_message({"type": "stream", "content": content})
+            # 回答缓存：命中时按与流式输出相同的协议回放
+            cache_key = None
+            if ResponseCache.enabled_for(conversation):
+                cache_key = ResponseCache.make_key(model_id, formatted_messages)
+                cached = await ResponseCache.get(cache_key)
+                if cached is not None:
+                    turn["start"] = time.perf_counter()
+                    content = cached["content"]
+                    for offset in range(0, len(content), self.flush_bytes):
+                        generation.append(content[offset : offset + self.flush_bytes])
+                    collected_content.append(content)
+                    persisted = True
+                    ai_message = await MessageWriter.create_message(
+                        conversation_id, "assistant", content
+                    )
+                    generation.finish(
+                        {
+                            "type": "done",
+                            "message": json.loads(json_util.dumps(ai_message)),
+                            "cached": True,
+                        }
+                    )
+                    status = "cached"
+                    return
+
+            # 调用OpenAI API（首个片段前失败时由路由重试或换一个上游）
+            turn["start"] = time.perf_counter()
+            try:
+                response = ProviderRouter.chat_events(formatted_messages, model_id)
+
+                # 处理流式响应（异步迭代，不阻塞其他连接），片段合并后再发送，
+                # 每个合并后的片段在生成缓冲中分配一个序号
+                writer = CoalescingWriter(
+                    generation.append,
+                    interval=self.flush_interval,
+                    max_bytes=self.flush_bytes,
+                    max_interval=SETTINGS["websocket"]["max_flush_interval_ms"] / 1000,
+                )
+                try:
+                    async for delta in response:
+                        if delta.usage:
+                            turn["usage"] = delta.usage
+                        if delta.finish_reason:
+                            turn["finish_reason"] = delta.finish_reason
+                        if delta.content:
+                            if turn["ttft"] is None:
+                                turn["ttft"] = time.perf_counter() - turn["start"]
+                                turn["upstream_status"] = 200
+                            collected_content.append(delta.content)
+                            writer.write(delta.content)
+                finally:
+                    writer.close()
+                    # 被取消时关闭生成器，使其中止上游请求
+                    await response.aclose()
 
                 # 保存完整的助手回复
                 full_content = "".join(collected_content)
                 if full_content:
-                    ai_message = Database.create_message(
+                    # 消息已进入写入队列，此后被取消也不再重复保存
+                    persisted = True
+                    ai_message = await MessageWriter.create_message(
                         conversation_id, "assistant", full_content
                     )
-                    self.write_message(
+                    generation.finish(
                         {
                             "type": "done",
                             "message": json.loads(json_util.dumps(ai_message)),
                         }
                     )
+                else:
+                    generation.finish({"type": "done", "message": None})
+                turn["upstream_status"] = 200
+                status = "ok"
+                # 只缓存正常结束的完整回答（不缓存因长度截断等原因结束的回答）
+                if cache_key and full_content and turn["finish_reason"] == "stop":
+                    ResponseCache.put(cache_key, model_id, full_content)
 
             except Exception as e:
+                # HTTPClientError 带有上游的状态码
+                turn["upstream_status"] = getattr(e, "code", None)
                 logger.error(f"调用OpenAI API失败: {str(e)}")
-                self.write_message(
+                generation.finish(
                     {"type": "error", "error": f"调用AI服务失败: {str(e)}"}
                 )
 
-        except json.JSONDecodeError:
-            self.write_message({"type": "error", "error": "无效的JSON数据"})
+        except asyncio.CancelledError:
+            status = "cancelled"
+            logger.info(f"生成已取消: {generation.generation_id}")
+            # 保存已收到的部分回答
+            partial_message = None
+            partial_content = "".join(collected_content)
+            if partial_content and not persisted:
+                partial_message = await MessageWriter.create_message(
+                    conversation_id, "assistant", partial_content
+                )
+            generation.finish(
+                {
+                    "type": "cancelled",
+                    "message": (
+                        json.loads(json_util.dumps(partial_message))
+                        if partial_message
+                        else None
+                    ),
+                }
+            )
+            raise
         except Exception as e:
             logger.error(f"处理消息失败: {str(e)}")
-            self.write_message({"type": "error", "error": str(e)})
+            generation.finish({"type": "error", "error": str(e)})
+        finally:
+            if turn["start"] is not None:
+                self._record_usage(
+                    generation,
+                    model_id,
+                    formatted_messages,
+                    "".join(collected_content),
+                    status,
+                    turn,
+                )
+
+    @staticmethod
+    def _record_usage(generation, model_id, messages, content, status, turn):
+        """记录一轮对话的用量，上游没有返回 usage 时（被取消、出错或上游不支持）
+        按本地 token 计数估算；回答缓存命中时没有请求上游，token 数记为 0"""
+        try:
+            usage = turn["usage"] or {}
+            if status == "cached":
+                usage = {"prompt_tokens": 0, "completion_tokens": 0}
+            prompt_tokens = usage.get("prompt_tokens")
+            completion_tokens = usage.get("completion_tokens")
+            estimated = prompt_tokens is None or completion_tokens is None
+            if estimated:
+                counter = TokenCounter(model_id)
+                if prompt_tokens is None:
+                    prompt_tokens = sum(
+                        counter.count(message.get("content") or "")
+                        for message in messages
+                    )
+                if completion_tokens is None:
+                    completion_tokens = counter.count(content)
+
+            duration = time.perf_counter() - turn["start"]
+            UsageTracker.record(
+                generation.user_id,
+                generation.conversation_id,
+                model_id,
+                status,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                ttft=turn["ttft"],
+                duration=duration,
+                upstream_status=turn["upstream_status"],
+                estimated=estimated,
+            )
+
+            GENERATIONS.labels(status).inc()
+            GENERATION_SECONDS.labels(status).observe(duration)
+            if turn["ttft"] is not None:
+                GENERATION_TTFT_SECONDS.observe(turn["ttft"])
+            GENERATION_TOKENS.labels(model_id, "prompt").inc(prompt_tokens)
+            GENERATION_TOKENS.labels(model_id, "completion").inc(completion_tokens)
+        except Exception as e:
+            logger.error(f"记录用量失败: {str(e)}")
 
     def write_message(self, message):
-        """发送消息给客户端"""
+        """按协商的帧协议发送消息给客户端，返回写入完成的 Future
+
+        连接已关闭时丢弃消息并返回None
+        """
+        if self.ws_connection is None or self.ws_connection.is_closing():
+            return None
         if isinstance(message, dict):
-            message = json.dumps(message)
-        super().write_message(message)
+            message = frame_protocol.encode(message, self.selected_subprotocol)
+        return super().write_message(message, binary=isinstance(message, bytes))
+
+
+WS_CONNECTIONS.set_function(lambda: len(ChatWebSocket.connections))
+GENERATIONS_ACTIVE.set_function(lambda: sum(ChatWebSocket.active_generations.values()))
@@ -1,13 +1,52 @@
 import json
 import logging
-from datetime import datetime
+import math
+from datetime import datetime, timedelta
 from bson import ObjectId, json_util
 from tornado.web import RequestHandler
-from utils.database import Database
+from config.settings import SETTINGS
+from utils.async_database import AsyncDatabase
+from utils.conversation_lifecycle import ConversationLifecycle
+from utils.database import utc_now
+from utils.pagination import parse_page_size
+from utils.write_behind import MessageWriter
+from utils.rate_limit import RateLimited, RateLimiter
 from utils.openai_client import OpenAIClient
 
 logger = logging.getLogger(__name__)
 
+# POST /api/conversations/bulk/<action> 支持的批量操作
+BULK_ACTIONS = {
+    "delete": ConversationLifecycle.delete,
+    "archive": ConversationLifecycle.archive,
+    "restore": ConversationLifecycle.restore,
+}
+
+
+def bulk_selection(data):
+    """解析批量操作选中的会话：ids（会话ID列表）和/或 older_than_days
+
+    Returns:
+        tuple: (会话ID列表或None, 最后消息时间上限或None)
+
+    Raises:
+        ValueError: 参数无效或没有指定会话
+    """
+    ids = data.get("ids")
+    older_than_days = data.get("older_than_days")
+    if ids is None and older_than_days is None:
+        raise ValueError("需要指定 ids 或 older_than_days")
+    if ids is not None and (
+        not isinstance(ids, list) or not all(isinstance(i, str) for i in ids)
+    ):
+        raise ValueError("ids 必须是会话ID列表")
+    before = None
+    if older_than_days is not None:
+        if not isinstance(older_than_days, (int, float)) or older_than_days < 0:
+            raise ValueError("older_than_days 必须是非负数")
+        before = utc_now() - timedelta(days=older_than_days)
+    return ids, before
+
 
 class ConversationHandler(RequestHandler):
     """会话管理处理器"""
@@ -28,52 +67,113 @@ class ConversationHandler(RequestHandler):
                 return
 
             if not conversation_id:
-                # 获取会话列表
-                conversations = Database.get_conversations(user_id)
-                self.write({"conversations": conversations})
+                # 获取会话列表：按最后消息时间倒序分页，fields 为逗号分隔的字段
+                page_size = self.get_argument("page_size", None)
+                fields = self.get_argument("fields", None)
+                try:
+                    result = await AsyncDatabase.get_conversations(
+                        user_id,
+                        int(page_size) if page_size else None,
+                        self.get_argument("page_token", None),
+                        (
+                            [field for field in fields.split(",") if field]
+                            if fields
+                            else None
+                        ),
+                        self.get_argument("archived", "false").lower() == "true",
+                    )
+                except ValueError as e:
+                    self.set_status(400)
+                    self.write({"error": str(e)})
+                    return
+                self.write(result)
                 return
 
-            if action == "messages":
-                if sub_action == "locate":
-                    # 定位消息
-                    message_id = self.get_argument("message_id", "")
-                    result = Database.locate_message(conversation_id, message_id)
-                    if "error" in result:
-                        self.set_status(404)
-                        self.write({"error": result["error"]})
-                        return
-                    self.write(result)
-                else:
-                    # 获取消息列表
-                    page_size = int(self.get_argument("page_size", 10))
-                    page_token = self.get_argument("page_token", None)
-                    messages = Database.get_messages(
-                        conversation_id, page_size, page_token
-                    )
-                    self.write(messages)
-            elif action == "search":
-                # 搜索消息
-                query = self.get_argument("q", "")
-                messages = Database.search_messages(conversation_id, query)
-                self.write({"messages": messages})
-            else:
-                # 获取单个会话
-                conversation = Database.get_conversation(conversation_id)
-                if not conversation:
-                    self.set_status(404)
-                    self.write({"error": "会话不存在"})
+            # 验证会话存在且属于当前用户（会话信息有缓存）
+            conversation = await AsyncDatabase.get_conversation(conversation_id)
+            if not conversation:
+                self.set_status(404)
+                self.write({"error": "会话不存在"})
+                return
+            if str(conversation.get("user_id")) != user_id:
+                self.set_status(403)
+                self.write({"error": "无权访问此会话"})
+                return
+
+            try:
+                # 已归档的会话直接从归档块读取，写入新消息时才恢复
+                archived = bool(conversation.get("archived"))
+                if action == "messages":
+                    await self._get_messages(conversation_id, sub_action, archived)
                     return
-                if str(conversation.get("user_id")) != user_id:
-                    self.set_status(403)
-                    self.write({"error": "无权访问此会话"})
+                if action == "search":
+                    # 搜索消息
+                    search_config = SETTINGS["search"]
+                    result = await AsyncDatabase.search_messages(
+                        conversation_id,
+                        self.get_argument("q", ""),
+                        parse_page_size(
+                            self.get_argument("page_size", None),
+                            search_config["page_size"],
+                            search_config["max_page_size"],
+                        ),
+                        self.get_argument("page_token", None),
+                        archived,
+                    )
+                    self.write(result)
                     return
-                self.write({"conversation": conversation})
+            except ValueError as e:
+                self.set_status(400)
+                self.write({"error": str(e)})
+                return
+
+            # 获取单个会话
+            self.write({"conversation": conversation})
         except Exception as e:
             logger.error(f"处理请求失败: {str(e)}")
             self.set_status(500)
             self.write({"error": str(e)})
 
-    def post(self, conversation_id=None, action=None):
+    async def _get_messages(self, conversation_id, sub_action=None, archived=False):
+        """获取消息列表或定位消息
+
+        Raises:
+            ValueError: 分页参数或分页标记无效
+        """
+        config = SETTINGS["messages"]
+        if sub_action == "locate":
+            # 定位消息
+            message_id = self.get_argument("message_id", "")
+            window = parse_page_size(
+                self.get_argument("window", None), 10, config["max_locate_window"]
+            )
+            result = await AsyncDatabase.locate_message(
+                conversation_id, message_id, window, archived
+            )
+            if "error" in result:
+                self.set_status(404)
+                self.write({"error": result["error"]})
+                return
+            self.write(result)
+            return
+
+        # 获取消息列表
+        include_total = self.get_argument("include_total", "false").lower() == "true"
+        messages = await AsyncDatabase.get_messages(
+            conversation_id,
+            parse_page_size(
+                self.get_argument("page_size", None),
+                config["page_size"],
+                config["max_page_size"],
+            ),
+            self.get_argument("page_token", None),
+            direction=self.get_argument("direction", "older"),
+            include_total=include_total,
+            archived=archived,
+        )
+        self.write(messages)
+
+    async def post(self, conversation_id=None, action=None, sub_action=None):
         """处理POST请求"""
         try:
             if not self.current_user:
@@ -81,9 +181,25 @@ class ConversationHandler(RequestHandler):
                 self.write({"success": False, "error": "未登录"})
                 return
 
+            if conversation_id == "bulk":
+                # 批量删除/归档/恢复：{"ids": [...]} 和/或 {"older_than_days": N}
+                if action not in BULK_ACTIONS:
+                    self.set_status(400)
+                    self.write({"success": False, "error": f"不支持的操作: {action}"})
+                    return
+                try:
+                    ids, before = bulk_selection(json.loads(self.request.body or "{}"))
+                    result = await BULK_ACTIONS[action](self.current_user, ids, before)
+                except ValueError as e:
+                    self.set_status(400)
+                    self.write({"success": False, "error": str(e)})
+                    return
+                self.write({"success": True, **result})
+                return
+
             if conversation_id:
                 # 获取会话
-                conversation = Database.get_conversation(conversation_id)
+                conversation = await AsyncDatabase.get_conversation(conversation_id)
                 if not conversation:
                     self.set_status(404)
                     self.write({"success": False, "error": "会话不存在"})
@@ -95,6 +211,13 @@ class ConversationHandler(RequestHandler):
                     self.write({"success": False, "error": "无权访问此会话"})
                     return
 
+                if action in ("archive", "restore"):
+                    result = await BULK_ACTIONS[action](
+                        self.current_user, [conversation_id]
+                    )
+                    self.write({"success": True, **result})
+                    return
+
                 if action == "messages":
                     # 添加新消息
                     data = json.loads(self.request.body)
@@ -106,8 +229,25 @@ class ConversationHandler(RequestHandler):
                         self.write({"success": False, "error": "消息内容不能为空"})
                         return
 
-                    # 保存用户消息
-                    message = Database.create_message(conversation_id, role, content)
+                    # 与 WebSocket 生成共用限流，短时间内能补足令牌时排队等待
+                    model_id = conversation.get("model_id")
+                    if isinstance(model_id, dict):
+                        model_id = model_id.get("model_id")
+                    try:
+                        await RateLimiter.acquire(
+                            self.current_user, model_id or "gpt-3.5-turbo"
+                        )
+                    except RateLimited as e:
+                        self.set_status(429)
+                        self.set_header("Retry-After", str(math.ceil(e.retry_after)))
+                        self.write({"success": False, **e.to_dict()})
+                        return
+
+                    # 保存用户消息（已归档的会话先恢复）
+                    await ConversationLifecycle.ensure_restored(conversation)
+                    message = await MessageWriter.create_message(
+                        conversation_id, role, content, wait=True
+                    )
                     self.write(
                         {
                             "success": True,
@@ -128,7 +268,7 @@ class ConversationHandler(RequestHandler):
                 return
 
             # 创建会话
-            conversation = Database.create_conversation(
+            conversation = await AsyncDatabase.create_conversation(
                 user_id=self.current_user,
                 title=title,
                 system_prompt=system_prompt,
@@ -147,7 +287,7 @@ class ConversationHandler(RequestHandler):
             self.set_status(500)
             self.write({"success": False, "error": str(e)})
 
-    def patch(self, conversation_id=None, action=None):
+    async def patch(self, conversation_id=None, action=None, sub_action=None):
         """处理PATCH请求"""
         try:
             if not self.current_user:
@@ -161,7 +301,7 @@ class ConversationHandler(RequestHandler):
                 return
 
             # 获取会话
-            conversation = Database.get_conversation(conversation_id)
+            conversation = await AsyncDatabase.get_conversation(conversation_id)
             if not conversation:
                 self.set_status(404)
                 self.write({"success": False, "error": "会话不存在"})
@@ -183,10 +323,13 @@ class ConversationHandler(RequestHandler):
                 update_data["system_prompt"] = data["system_prompt"]
             if "model_id" in data:
                 update_data["model_id"] = data["model_id"]  # 直接更新model_id
+            if "cache_responses" in data:
+                # 单独关闭/开启该会话的回答缓存
+                update_data["cache_responses"] = bool(data["cache_responses"])
 
             if update_data:
                 update_data["updated_at"] = datetime.utcnow()
-                Database.update_conversation(conversation_id, update_data)
+                await AsyncDatabase.update_conversation(conversation_id, update_data)
                 conversation.update(update_data)
 
             self.write(
@@ -201,7 +344,7 @@ class ConversationHandler(RequestHandler):
             self.set_status(500)
             self.write({"success": False, "error": str(e)})
 
-    def put(self, conversation_id=None, action=None):
+    async def put(self, conversation_id=None, action=None, sub_action=None):
         """处理PUT请求"""
         try:
             if not self.current_user:
@@ -215,7 +358,7 @@ class ConversationHandler(RequestHandler):
                 return
 
             # 获取会话
-            conversation = Database.get_conversation(conversation_id)
+            conversation = await AsyncDatabase.get_conversation(conversation_id)
             if not conversation:
                 self.set_status(404)
                 self.write({"success": False, "error": "会话不存在"})
@@ -237,10 +380,12 @@ class ConversationHandler(RequestHandler):
                 update_data["system_prompt"] = data["system_prompt"]
             if "model_id" in data:
                 update_data["model_id"] = data["model_id"]
+            if "cache_responses" in data:
+                update_data["cache_responses"] = bool(data["cache_responses"])
 
             if update_data:
                 update_data["updated_at"] = datetime.utcnow()
-                Database.update_conversation(conversation_id, update_data)
+                await AsyncDatabase.update_conversation(conversation_id, update_data)
                 conversation.update(update_data)
 
             self.write(
@@ -255,7 +400,7 @@ class ConversationHandler(RequestHandler):
             self.set_status(500)
             self.write({"success": False, "error": str(e)})
 
-    def delete(self, conversation_id=None, action=None):
+    async def delete(self, conversation_id=None, action=None, sub_action=None):
         """处理DELETE请求"""
         try:
             if not self.current_user:
@@ -269,7 +414,7 @@ class ConversationHandler(RequestHandler):
                 return
 
             # 获取会话
-            conversation = Database.get_conversation(conversation_id)
+            conversation = await AsyncDatabase.get_conversation(conversation_id)
             if not conversation:
                 self.set_status(404)
                 self.write({"success": False, "error": "会话不存在"})
@@ -281,9 +426,11 @@ class ConversationHandler(RequestHandler):
                 self.write({"success": False, "error": "无权删除此会话"})
                 return
 
-            # 删除会话及其消息
-            Database.delete_conversation(conversation_id)
-            self.write({"success": True})
+            # 删除会话及其消息和归档（大会话的消息在后台分批删除）
+            result = await ConversationLifecycle.delete(
+                self.current_user, [conversation_id]
+            )
+            self.write({"success": True, **result})
 
         except Exception as e:
             logger.error(f"处理请求失败: {str(e)}")
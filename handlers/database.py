@@ -2,7 +2,10 @@ import json
 import logging
 from bson import ObjectId, json_util
 from tornado.web import RequestHandler
-from utils.database import Database
+from utils.async_database import AsyncDatabase
+from utils.write_behind import MessageWriter
+from utils.response_cache import ResponseCache
+from utils.conversation_lifecycle import ConversationLifecycle
 
 logger = logging.getLogger(__name__)
 
@@ -10,14 +13,27 @@ logger = logging.getLogger(__name__)
 class DatabaseHandler(RequestHandler):
     """数据库管理处理器"""
 
-    def get(self, action=None):
+    async def get(self, action=None):
         """处理GET请求"""
         try:
             if action == "collections":
                 # 获取所有集合列表
-                collections = Database.list_collections()
+                collections = await AsyncDatabase.list_collections()
                 self.write({"success": True, "collections": collections})
 
+            elif action == "cache":
+                # 获取缓存命中统计
+                stats = await AsyncDatabase.get_cache_stats()
+                self.write(
+                    {
+                        "success": True,
+                        "cache": stats,
+                        "write_behind": MessageWriter.get_stats(),
+                        "response_cache": ResponseCache.get_stats(),
+                        "lifecycle": ConversationLifecycle.get_stats(),
+                    }
+                )
+
             elif action == "data":
                 # 获取指定集合的数据
                 collection = self.get_argument("collection", None)
@@ -28,7 +44,9 @@ class DatabaseHandler(RequestHandler):
                 if not collection:
                     raise ValueError("未指定集合名称")
 
-                data = Database.get_collection_data(collection, query, page, page_size)
+                data = await AsyncDatabase.get_collection_data(
+                    collection, query, page, page_size
+                )
                 self.write(json_util.dumps({"success": True, **data}))
                 self.set_header("Content-Type", "application/json")
 
@@ -41,7 +59,7 @@ class DatabaseHandler(RequestHandler):
             self.set_status(500)
             self.write({"success": False, "error": str(e)})
 
-    def post(self, action=None):
+    async def post(self, action=None):
         """处理POST请求"""
         try:
             data = json.loads(self.request.body)
@@ -57,7 +75,7 @@ class DatabaseHandler(RequestHandler):
                     raise ValueError("未指定文档ID")
 
                 update_data = data.get("document", {})
-                Database.update_document(collection, doc_id, update_data)
+                await AsyncDatabase.update_document(collection, doc_id, update_data)
                 self.write({"success": True})
 
             else:
@@ -69,7 +87,7 @@ class DatabaseHandler(RequestHandler):
             self.set_status(500)
             self.write({"success": False, "error": str(e)})
 
-    def delete(self, action=None):
+    async def delete(self, action=None):
         """处理DELETE请求"""
         try:
             if action == "document":
@@ -80,7 +98,7 @@ class DatabaseHandler(RequestHandler):
                 if not collection or not doc_id:
                     raise ValueError("未指定集合名称或文档ID")
 
-                Database.delete_document(collection, doc_id)
+                await AsyncDatabase.delete_document(collection, doc_id)
                 self.write({"success": True})
 
             elif action == "truncate":
@@ -89,7 +107,7 @@ class DatabaseHandler(RequestHandler):
                 if not collection:
                     raise ValueError("未指定集合名称")
 
-                Database.truncate_collection(collection)
+                await AsyncDatabase.truncate_collection(collection)
                 self.write({"success": True})
 
             else:
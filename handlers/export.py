@@ -0,0 +1,195 @@
+import logging
+import zlib
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.web import RequestHandler, stream_request_body
+from config.settings import SETTINGS
+from utils.async_database import AsyncDatabase
+from utils.conversation_export import ConversationImporter, iter_export
+from utils.database import utc_now
+
+logger = logging.getLogger(__name__)
+
+# 解压导入数据时每次最多输出的字节数，压缩率极高的请求体也不会一次解压到内存
+DECOMPRESS_CHUNK = 1024 * 1024
+
+
+class ExportHandler(RequestHandler):
+    """会话导出处理器
+
+    GET /api/export 导出当前用户的全部会话，GET /api/export/<会话ID> 导出单个会话。
+    响应是分块传输的 NDJSON（gzip=true 时为 .ndjson.gz），每批写出后等待数据
+    发送到 socket 再读取下一批，客户端读得慢时不会在内存中堆积。
+    """
+
+    def get_current_user(self):
+        """获取当前用户"""
+        user_id = self.get_secure_cookie("user_id")
+        return user_id.decode("utf-8") if user_id else None
+
+    async def get(self, conversation_id=None):
+        """处理GET请求"""
+        started = False
+        try:
+            if not self.current_user:
+                self.set_status(401)
+                self.write({"success": False, "error": "请先登录"})
+                return
+
+            if conversation_id:
+                conversation = await AsyncDatabase.get_conversation(conversation_id)
+                if not conversation:
+                    self.set_status(404)
+                    self.write({"success": False, "error": "会话不存在"})
+                    return
+                if str(conversation["user_id"]) != self.current_user:
+                    self.set_status(403)
+                    self.write({"success": False, "error": "无权访问此会话"})
+                    return
+
+            use_gzip = self.get_argument("gzip", "false").lower() == "true"
+            filename = (
+                f"mychat-{conversation_id or 'conversations'}-"
+                f"{utc_now().strftime('%Y%m%d%H%M%S')}.ndjson"
+            )
+            compressor = None
+            if use_gzip:
+                filename += ".gz"
+                self.set_header("Content-Type", "application/gzip")
+                # wbits 16+: 带 gzip 头和校验
+                compressor = zlib.compressobj(
+                    SETTINGS["export"]["compression_level"],
+                    zlib.DEFLATED,
+                    16 + zlib.MAX_WBITS,
+                )
+            else:
+                self.set_header("Content-Type", "application/x-ndjson; charset=UTF-8")
+            self.set_header("Content-Disposition", f'attachment; filename="{filename}"')
+
+            started = True
+            chunks = iter_export(self.current_user, conversation_id)
+            try:
+                async for chunk in chunks:
+                    if compressor is not None:
+                        chunk = compressor.compress(chunk)
+                    if chunk:
+                        self.write(chunk)
+                        # 等待数据写入 socket 后再读取下一批
+                        await self.flush()
+                if compressor is not None:
+                    self.write(compressor.flush())
+            finally:
+                await chunks.aclose()
+
+        except StreamClosedError:
+            logger.info("客户端在导出完成前断开连接")
+        except Exception as e:
+            logger.error(f"导出会话失败: {str(e)}")
+            if started:
+                # 响应头已发出，只能中断连接让客户端得知导出不完整
+                self.request.connection.close()
+                return
+            self.set_status(500)
+            self.write({"success": False, "error": str(e)})
+
+
+@stream_request_body
+class ImportHandler(RequestHandler):
+    """会话导入处理器
+
+    POST /api/import，请求体为导出的 NDJSON（Content-Encoding: gzip 或 gzip=true
+    时为 gzip 压缩）。请求体边接收边解析，按批 insert_many 写入，
+    导入的会话和消息属于当前用户并使用新的ID。
+    """
+
+    importer = None
+    decompressor = None
+    error = None
+
+    def get_current_user(self):
+        """获取当前用户"""
+        user_id = self.get_secure_cookie("user_id")
+        return user_id.decode("utf-8") if user_id else None
+
+    def prepare(self):
+        """收到请求头后验证登录状态并准备流式解析"""
+        if self.request.method != "POST":
+            return
+        if not self.current_user:
+            self.set_status(401)
+            self.finish({"success": False, "error": "请先登录"})
+            return
+
+        self.request.connection.set_max_body_size(
+            SETTINGS["export"]["max_import_bytes"]
+        )
+        if (
+            self.request.headers.get("Content-Encoding", "").lower() == "gzip"
+            or self.get_argument("gzip", "false").lower() == "true"
+        ):
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.importer = ConversationImporter(self.current_user)
+
+    async def data_received(self, chunk):
+        """解析收到的数据块，攒够一批时写入（写入期间暂停接收）"""
+        if self.importer is None or self.error:
+            # 出错后继续接收并丢弃剩余的请求体
+            return
+        try:
+            if self.decompressor is None:
+                await self.importer.feed(chunk)
+                return
+            data = self.decompressor.decompress(chunk, DECOMPRESS_CHUNK)
+            await self.importer.feed(data)
+            while self.decompressor.unconsumed_tail:
+                data = self.decompressor.decompress(
+                    self.decompressor.unconsumed_tail, DECOMPRESS_CHUNK
+                )
+                await self.importer.feed(data)
+        except (ValueError, zlib.error) as e:
+            self.error = str(e)
+        except Exception as e:
+            logger.error(f"导入会话失败: {str(e)}")
+            self.error = str(e)
+
+    async def post(self):
+        """请求体接收完毕，写入剩余数据并返回导入结果"""
+        try:
+            if not self.error and self.decompressor is not None:
+                try:
+                    await self.importer.feed(self.decompressor.flush())
+                except (ValueError, zlib.error) as e:
+                    self.error = str(e)
+
+            if self.error:
+                # 已写入的批次保留，返回其数量
+                result = await self.importer.close(discard=True)
+                self.set_status(400)
+                self.write({"success": False, "error": self.error, **result})
+                return
+
+            result = await self.importer.close()
+            logger.info(
+                f"用户 {self.current_user} 导入 {result['conversations']} 个会话、"
+                f"{result['messages']} 条消息"
+            )
+            self.write({"success": True, **result})
+        except ValueError as e:
+            self.set_status(400)
+            self.write({"success": False, "error": str(e)})
+        except Exception as e:
+            logger.error(f"导入会话失败: {str(e)}")
+            self.set_status(500)
+            self.write({"success": False, "error": str(e)})
+        finally:
+            self.importer = None
+
+    def on_connection_close(self):
+        """上传中途断开时写入已导入会话的消息数"""
+        if self.importer is not None:
+            IOLoop.current().add_callback(self.importer.close, True)
+            self.importer = None
+
+    def check_xsrf_cookie(self):
+        """禁用XSRF检查，因为我们使用自定义的XSRF令牌"""
+        pass
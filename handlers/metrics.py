@@ -0,0 +1,37 @@
+import logging
+from tornado.web import RequestHandler
+from utils.metrics import REGISTRY, Histogram
+
+logger = logging.getLogger(__name__)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "mychat_http_request_seconds",
+    "HTTP 请求处理时间",
+    ["handler", "method", "status"],
+)
+
+
+def observe_request(handler: RequestHandler) -> None:
+    """请求结束时记录耗时（由 Application.log_request 调用）
+
+    按处理器类名而不是 URL 统计，避免路径中的ID产生大量标签组合。
+    """
+    HTTP_REQUEST_SECONDS.labels(
+        type(handler).__name__,
+        handler.request.method,
+        str(handler.get_status()),
+    ).observe(handler.request.request_time())
+
+
+class MetricsHandler(RequestHandler):
+    """以 Prometheus 文本格式导出本进程的指标"""
+
+    def get(self):
+        """处理GET请求"""
+        try:
+            self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.write(REGISTRY.render())
+        except Exception as e:
+            logger.error(f"导出指标失败: {str(e)}")
+            self.set_status(500)
+            self.write(str(e))
@@ -0,0 +1,57 @@
+import logging
+from tornado.web import RequestHandler
+from config.settings import SETTINGS
+from utils.async_database import AsyncDatabase
+from utils.pagination import parse_page_size
+
+logger = logging.getLogger(__name__)
+
+
+class MessageSearchHandler(RequestHandler):
+    """跨会话消息搜索处理器"""
+
+    def get_current_user(self):
+        """获取当前用户"""
+        user_id = self.get_secure_cookie("user_id")
+        return user_id.decode("utf-8") if user_id else None
+
+    async def get(self):
+        """在当前用户的所有会话中搜索消息"""
+        try:
+            user_id = self.get_current_user()
+            if not user_id:
+                self.set_status(401)
+                self.write({"error": "请先登录"})
+                return
+
+            query = self.get_argument("q", "")
+            page_token = self.get_argument("page_token", None)
+            try:
+                page_size = parse_page_size(
+                    self.get_argument("page_size", None),
+                    SETTINGS["search"]["page_size"],
+                    SETTINGS["search"]["max_page_size"],
+                )
+                result = await AsyncDatabase.search_user_messages(
+                    user_id, query, page_size, page_token
+                )
+            except ValueError as e:
+                self.set_status(400)
+                self.write({"error": str(e)})
+                return
+            self.write(result)
+        except Exception as e:
+            logger.error(f"搜索消息失败: {str(e)}")
+            self.set_status(500)
+            self.write({"error": str(e)})
+
+    def set_default_headers(self):
+        """设置CORS头"""
+        self.set_header("Access-Control-Allow-Origin", "*")
+        self.set_header("Access-Control-Allow-Headers", "Content-Type, X-XSRFToken")
+        self.set_header("Access-Control-Allow-Methods", "GET, OPTIONS")
+
+    def options(self):
+        """处理OPTIONS请求"""
+        self.set_status(204)
+        self.finish()
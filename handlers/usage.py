@@ -0,0 +1,63 @@
+import logging
+from bson import json_util
+from tornado.web import RequestHandler
+from utils.usage import UsageTracker
+
+logger = logging.getLogger(__name__)
+
+
+class UsageHandler(RequestHandler):
+    """用量统计处理器"""
+
+    def get_current_user(self):
+        """获取当前用户"""
+        user_id = self.get_secure_cookie("user_id")
+        return user_id.decode("utf-8") if user_id else None
+
+    async def get(self, action=None):
+        """处理GET请求
+
+        summary: 按 group_by（user_id / model / conversation_id）汇总最近 days 天的
+        用量，可用 user_id 筛选（user_id=me 表示当前用户）；stats: 本进程的统计信息
+        """
+        try:
+            if not self.current_user:
+                self.set_status(401)
+                self.write({"success": False, "error": "请先登录"})
+                return
+
+            if action == "summary":
+                group_by = self.get_argument("group_by", "model")
+                days = float(self.get_argument("days", 7))
+                limit = min(int(self.get_argument("limit", 100)), 1000)
+                user_id = self.get_argument("user_id", None)
+                if user_id == "me":
+                    user_id = self.current_user
+
+                summary = await UsageTracker.get_summary(group_by, days, user_id, limit)
+                self.set_header("Content-Type", "application/json")
+                self.write(
+                    json_util.dumps(
+                        {
+                            "success": True,
+                            "group_by": group_by,
+                            "days": days,
+                            "summary": summary,
+                        }
+                    )
+                )
+
+            elif action == "stats":
+                self.write({"success": True, "stats": UsageTracker.get_stats()})
+
+            else:
+                self.set_status(400)
+                self.write({"success": False, "error": "无效的操作"})
+
+        except ValueError as e:
+            self.set_status(400)
+            self.write({"success": False, "error": str(e)})
+        except Exception as e:
+            logger.error(f"获取用量统计失败: {str(e)}")
+            self.set_status(500)
+            self.write({"success": False, "error": str(e)})
@@ -0,0 +1,95 @@
+"""为历史会话生成会话列表的摘要字段
+
+新消息在写入时已维护会话的 message_count、last_message_preview 和
+last_message_role，此脚本用于补齐升级前的历史会话（或修正计数）。
+
+用法:
+    python rebuild_conversation_summaries.py          # 只处理缺少摘要字段的会话
+    python rebuild_conversation_summaries.py --all    # 重建所有会话的摘要字段
+"""
+
+import argparse
+from pymongo import UpdateOne
+from utils.database import Database, message_preview
+from config.settings import SETTINGS
+
+BATCH_SIZE = 500
+
+
+def summarize(db, conversation_ids):
+    """统计一批会话的消息数和最后一条消息"""
+    summaries = {
+        conversation_id: {
+            "message_count": 0,
+            "last_message_preview": "",
+            "last_message_role": None,
+        }
+        for conversation_id in conversation_ids
+    }
+    rows = db.messages.aggregate(
+        [
+            {"$match": {"conversation_id": {"$in": conversation_ids}}},
+            {"$sort": {"conversation_id": 1, "created_at": 1, "_id": 1}},
+            {
+                "$group": {
+                    "_id": "$conversation_id",
+                    "count": {"$sum": 1},
+                    "content": {"$last": "$content"},
+                    "role": {"$last": "$role"},
+                }
+            },
+        ]
+    )
+    for row in rows:
+        summaries[row["_id"]] = {
+            "message_count": row["count"],
+            "last_message_preview": message_preview(row["content"]),
+            "last_message_role": row["role"],
+        }
+    return summaries
+
+
+def write_summaries(db, conversation_ids):
+    """写入一批会话的摘要字段"""
+    db.conversations.bulk_write(
+        [
+            UpdateOne({"_id": conversation_id}, {"$set": summary})
+            for conversation_id, summary in summarize(db, conversation_ids).items()
+        ],
+        ordered=False,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成会话列表的摘要字段")
+    parser.add_argument("--all", action="store_true", help="重建所有会话")
+    args = parser.parse_args()
+
+    try:
+        mongodb_uri = (
+            f"mongodb://{SETTINGS['database']['host']}:{SETTINGS['database']['port']}"
+        )
+        Database.initialize(mongodb_uri, SETTINGS["database"]["name"])
+        db = Database.ensure_connection()
+
+        query = {} if args.all else {"message_count": {"$exists": False}}
+        cursor = db.conversations.find(query, {"_id": 1}).batch_size(BATCH_SIZE)
+
+        updated = 0
+        batch = []
+        for conversation in cursor:
+            batch.append(conversation["_id"])
+            if len(batch) >= BATCH_SIZE:
+                write_summaries(db, batch)
+                updated += len(batch)
+                batch = []
+                print(f"已处理 {updated} 个会话")
+        if batch:
+            write_summaries(db, batch)
+            updated += len(batch)
+
+        print(f"会话摘要生成完成，共 {updated} 个会话")
+    except Exception as e:
+        print(f"生成会话摘要失败: {str(e)}")
+    finally:
+        Database.cleanup()
@@ -0,0 +1,55 @@
+"""为历史消息生成搜索索引词
+
+新消息在写入时已生成 search_tokens，此脚本用于补齐升级前的历史消息。
+
+用法:
+    python rebuild_search_index.py          # 只处理缺少索引词的消息
+    python rebuild_search_index.py --all    # 重建所有消息的索引词
+"""
+
+import argparse
+from pymongo import UpdateOne
+from utils.database import Database
+from utils.search import index_tokens
+from config.settings import SETTINGS
+
+BATCH_SIZE = 1000
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成消息搜索索引词")
+    parser.add_argument("--all", action="store_true", help="重建所有消息")
+    args = parser.parse_args()
+
+    try:
+        mongodb_uri = (
+            f"mongodb://{SETTINGS['database']['host']}:{SETTINGS['database']['port']}"
+        )
+        Database.initialize(mongodb_uri, SETTINGS["database"]["name"])
+        db = Database.ensure_connection()
+
+        query = {} if args.all else {"search_tokens": {"$exists": False}}
+        cursor = db.messages.find(query, {"content": 1}).batch_size(BATCH_SIZE)
+
+        updated = 0
+        operations = []
+        for message in cursor:
+            operations.append(
+                UpdateOne(
+                    {"_id": message["_id"]},
+                    {"$set": {"search_tokens": index_tokens(message.get("content"))}},
+                )
+            )
+            if len(operations) >= BATCH_SIZE:
+                db.messages.bulk_write(operations, ordered=False)
+                updated += len(operations)
+                operations = []
+                print(f"已处理 {updated} 条消息")
+        if operations:
+            db.messages.bulk_write(operations, ordered=False)
+            updated += len(operations)
+
+        print(f"搜索索引词生成完成，共 {updated} 条消息")
+    except Exception as e:
+        print(f"生成搜索索引词失败: {str(e)}")
+    finally:
+        Database.cleanup()
@@ -14,6 +14,7 @@ const state = {
     ws: null,  // WebSocket连接
     currentAiMessage: null,  // 当前AI消息元素
     currentContent: '',  // 当前消息内容
+    generations: {},  // 进行中的生成：generation_id -> {element, content, seq}
 };
 
 // 初始化应用
@@ -130,10 +131,15 @@ function formatTimestamp(timestamp) {
 }
 
 // 加载会话列表
-async function loadConversations() {
+// 会话列表按最后消息时间倒序分页加载，append 为 true 时加载下一页
+async function loadConversations(append = false) {
     try {
         console.log('加载会话列表...');
-        const response = await fetch('/api/conversations', {
+        const params = new URLSearchParams();
+        if (append && state.conversationsPageToken) {
+            params.set('page_token', state.conversationsPageToken);
+        }
+        const response = await fetch(`/api/conversations?${params}`, {
             headers: {
                 'X-XSRFToken': getCookie('_xsrf')
             }
@@ -148,7 +154,13 @@ async function loadConversations() {
 
         // 更新会话列表
         const conversationsList = document.getElementById('conversationsList');
+        state.conversationsPageToken = data.next_page_token || null;
         if (conversationsList) {
+            const loadMore = conversationsList.querySelector('.load-more-conversations');
+            if (loadMore) loadMore.remove();
+            if (append) {
+                data.conversations = (state.conversations || []).concat(data.conversations || []);
+            }
             conversationsList.innerHTML = '';
             if (data.conversations && data.conversations.length > 0) {
                 // 按最后消息时间排序
@@ -182,8 +194,8 @@ async function loadConversations() {
                     // 检查是否是当前会话
                     if (state.currentConversation && state.currentConversation._id === conversation._id) {
                         item.classList.add('active');
-                        // 更新当前会话的信息
-                        state.currentConversation = conversation;
+                        // 更新当前会话的信息（列表只包含摘要字段，保留系统提示词等完整信息）
+                        state.currentConversation = { ...state.currentConversation, ...conversation };
                     }
                     
                     // 获取最后更新时间
@@ -196,15 +208,27 @@ async function loadConversations() {
                     
                     item.innerHTML = `
                         <div class="conversation-title">${conversation.title}</div>
+                        <div class="conversation-preview"></div>
                         <div class="conversation-info">
                             <span class="model-name">${conversation.model_name || ''}</span>
                             <span class="timestamp">${formatTimestamp(lastTime)}</span>
                         </div>
                     `;
+                    // 摘要是用户内容，作为文本插入
+                    item.querySelector('.conversation-preview').textContent =
+                        conversation.last_message_preview || '';
                     item.onclick = () => switchConversation(conversation._id);
                     conversationsList.appendChild(item);
                 });
 
+                if (state.conversationsPageToken) {
+                    const button = document.createElement('button');
+                    button.className = 'btn btn-link load-more-conversations';
+                    button.textContent = '加载更多';
+                    button.onclick = () => loadConversations(true);
+                    conversationsList.appendChild(button);
+                }
+
                 console.log('会话列表更新完成，当前会话:', state.currentConversation);
             } else {
                 conversationsList.innerHTML = '<div class="no-conversations">暂无会话</div>';
@@ -370,7 +394,8 @@ async function loadMessages(conversationId, reset = true) {
                 pageSize: 10,
                 totalCount: 0,
                 loadedMessages: new Set(),
-                nextPageToken: null
+                nextPageToken: null,
+                prevPageToken: null
             };
             // 清空消息区域
             const messagesContainer = document.getElementById('chatMessages');
@@ -390,7 +415,10 @@ async function loadMessages(conversationId, reset = true) {
         // 构建URL
         let url = `/api/conversations/${conversationId}/messages?page_size=${state.messageLoadingState.pageSize}`;
         if (state.messageLoadingState.nextPageToken) {
-            url += `&page_token=${state.messageLoadingState.nextPageToken}`;
+            url += `&page_token=${encodeURIComponent(state.messageLoadingState.nextPageToken)}`;
+        } else {
+            // 首页同时获取消息总数
+            url += '&include_total=true';
         }
 
         const response = await fetch(url, {
@@ -410,7 +438,9 @@ async function loadMessages(conversationId, reset = true) {
         if (!messagesContainer) return;
 
         // 更新总消息数和下一页标记
-        state.messageLoadingState.totalCount = data.total || 0;
+        if (data.total !== undefined) {
+            state.messageLoadingState.totalCount = data.total;
+        }
         state.messageLoadingState.nextPageToken = data.next_page_token;
         state.messageLoadingState.hasMore = !!data.next_page_token;
 
@@ -499,6 +529,93 @@ async function loadMessages(conversationId, reset = true) {
     }
 }
 
+// 定位到指定消息（例如从搜索结果跳转），加载其前后的消息
+async function locateMessage(messageId) {
+    if (!state.currentConversation || !messageId) return;
+
+    try {
+        const conversationId = state.currentConversation._id;
+        const response = await fetch(`/api/conversations/${conversationId}/messages/locate?message_id=${encodeURIComponent(messageId)}`, {
+            headers: {
+                'X-XSRFToken': getCookie('_xsrf')
+            }
+        });
+
+        if (!response.ok) {
+            throw new Error(`服务器错误: ${response.status}`);
+        }
+
+        const data = await response.json();
+        const messagesContainer = document.getElementById('chatMessages');
+        if (!messagesContainer) return;
+
+        // 以定位结果重置加载状态，向上滚动继续加载更早的消息，向下滚动加载更新的消息
+        messagesContainer.innerHTML = '';
+        state.messageLoadingState = {
+            loading: false,
+            hasMore: !!data.next_page_token,
+            pageSize: 10,
+            totalCount: 0,
+            loadedMessages: new Set(),
+            nextPageToken: data.next_page_token,
+            prevPageToken: data.prev_page_token
+        };
+
+        data.messages.slice().reverse().forEach(message => {
+            addMessageToChat(message, null, true);
+            state.messageLoadingState.loadedMessages.add(message._id);
+        });
+
+        const target = messagesContainer.querySelector(`.message[data-id="${data.target_message_id}"]`);
+        if (target) {
+            target.classList.add('located');
+            target.scrollIntoView({ block: 'center' });
+            setTimeout(() => target.classList.remove('located'), 2000);
+        }
+    } catch (error) {
+        console.error('定位消息失败:', error);
+        showError('定位消息失败: ' + error.message);
+    }
+}
+
+// 加载比当前已显示消息更新的消息（定位消息后向下滚动时使用）
+async function loadNewerMessages(conversationId) {
+    const loadingState = state.messageLoadingState;
+    if (loadingState.loading || !loadingState.prevPageToken) return;
+
+    loadingState.loading = true;
+    try {
+        const response = await fetch(`/api/conversations/${conversationId}/messages?page_size=${loadingState.pageSize}&page_token=${encodeURIComponent(loadingState.prevPageToken)}`, {
+            headers: {
+                'X-XSRFToken': getCookie('_xsrf')
+            }
+        });
+
+        if (!response.ok) {
+            throw new Error(`服务器错误: ${response.status}`);
+        }
+
+        const data = await response.json();
+        loadingState.prevPageToken = data.prev_page_token;
+
+        const messagesContainer = document.getElementById('chatMessages');
+        const scrollTop = messagesContainer.scrollTop;
+        data.messages.slice().reverse().forEach(message => {
+            if (!loadingState.loadedMessages.has(message._id)) {
+                addMessageToChat(message, null, true);
+                loadingState.loadedMessages.add(message._id);
+            }
+        });
+        // 追加消息时保持当前阅读位置
+        messagesContainer.scrollTop = scrollTop;
+    } catch (error) {
+        console.error('加载更新的消息失败:', error);
+        showError('加载更新的消息失败: ' + error.message);
+    } finally {
+        loadingState.loading = false;
+    }
+}
+
 // 固定的模型列表
 // const AVAILABLE_MODELS = [
 //     {
@@ -697,14 +814,24 @@ function bindEventHandlers() {
             adjustTextareaHeight(messageInput);
         });
         
-        // 处理回车发送
+        // 处理回车发送，Esc 停止生成
         messageInput.addEventListener('keydown', async (e) => {
             if (e.key === 'Enter' && !e.shiftKey && !e.isComposing) {
                 e.preventDefault();
                 await sendMessage();
+            } else if (e.key === 'Escape') {
+                cancelGenerations();
             }
         });
     }
+
+    // 停止生成按钮
+    const stopGenerationBtn = document.getElementById('stopGenerationBtn');
+    if (stopGenerationBtn) {
+        stopGenerationBtn.addEventListener('click', () => {
+            cancelGenerations();
+        });
+    }
     
     // 新建会话按钮
     const newConversationBtn = document.getElementById('newConversationBtn');
@@ -923,16 +1050,50 @@ async function initializeApp() {
 
 // =============== WebSocket 相关函数 ===============
 
+// 短字段名帧协议（与 utils/frame_protocol.py 保持一致）
+const COMPACT_PROTOCOL = 'chat.compact.v1';
+const COMPACT_KEYS = {
+    t: 'type', c: 'content', m: 'message', e: 'error',
+    g: 'generation_id', q: 'seq', lq: 'last_seq', fm: 'flush_ms', fb: 'flush_bytes',
+    ra: 'retry_after'
+};
+const COMPACT_TYPES = {
+    s: 'stream', d: 'done', u: 'user', x: 'error', cfg: 'config',
+    cc: 'cancel', cd: 'cancelled', rs: 'resume', rd: 'resumed', qd: 'queued'
+};
+
+// 将短字段名的帧还原为完整字段名
+function expandFrame(frame) {
+    const data = {};
+    Object.keys(frame).forEach(key => {
+        data[COMPACT_KEYS[key] || key] = frame[key];
+    });
+    if (data.type) {
+        data.type = COMPACT_TYPES[data.type] || data.type;
+    }
+    return data;
+}
+
 // 初始化WebSocket连接
 function initWebSocket() {
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
     const wsUrl = `${protocol}//${window.location.host}/ws/chat`;
     
-    const ws = new WebSocket(wsUrl);
+    // 请求短字段名的帧协议，减少流式输出的传输量
+    const ws = new WebSocket(wsUrl, [COMPACT_PROTOCOL]);
     
     ws.onopen = () => {
         console.log('WebSocket连接已建立');
         state.ws = ws;
+        // 重连后恢复断线前未完成的生成，只补发缺失的片段
+        Object.entries(state.generations).forEach(([generationId, generation]) => {
+            generation.resuming = true;
+            ws.send(JSON.stringify({
+                type: 'resume',
+                generation_id: generationId,
+                last_seq: generation.seq
+            }));
+        });
     };
     
     ws.onclose = () => {
@@ -949,7 +1110,10 @@ function initWebSocket() {
     
     ws.onmessage = (event) => {
         try {
-            const data = JSON.parse(event.data);
+            let data = JSON.parse(event.data);
+            if (ws.protocol === COMPACT_PROTOCOL) {
+                data = expandFrame(data);
+            }
             handleWebSocketMessage(data);
         } catch (error) {
             console.error('处理WebSocket消息失败:', error);
@@ -957,79 +1121,168 @@ function initWebSocket() {
     };
 }
 
+// 取消生成，未指定 generationId 时取消全部
+function cancelGenerations(generationId = null) {
+    if (!state.ws || state.ws.readyState !== WebSocket.OPEN) return;
+    if (Object.keys(state.generations).length === 0) return;
+
+    const message = { type: 'cancel' };
+    if (generationId) {
+        message.generation_id = generationId;
+    }
+    state.ws.send(JSON.stringify(message));
+}
+
+// 根据是否有进行中的生成显示停止按钮
+function updateStopButton() {
+    const stopGenerationBtn = document.getElementById('stopGenerationBtn');
+    if (stopGenerationBtn) {
+        stopGenerationBtn.classList.toggle('d-none', Object.keys(state.generations).length === 0);
+    }
+}
+
+// 渲染流式内容
+function renderStreamContent(generation) {
+    const contentElement = generation.element.querySelector('.message-content');
+    if (!contentElement) return;
+
+    requestAnimationFrame(() => {
+        contentElement.innerHTML = marked.parse(generation.content, {
+            breaks: true,
+            gfm: true,
+            smartLists: true,
+            smartypants: true
+        })
+        .replace(/<p>\s*<\/p>/g, '')
+        .replace(/<p>\s*<br\s*\/?>\s*<\/p>/g, '')
+        .replace(/\n+$/, '')
+        .replace(/<p><\/p>\n/g, '')
+        .replace(/\n{2,}/g, '\n')
+        .trim();
+
+        // 高亮代码块
+        contentElement.querySelectorAll('pre code').forEach((block) => {
+            hljs.highlightElement(block);
+        });
+
+        // 滚动到底部
+        const messagesContainer = document.getElementById('chatMessages');
+        if (messagesContainer) {
+            messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        }
+    });
+}
+
+// 结束一次生成（完成、取消或出错）
+function finishGeneration(generationId, message = null) {
+    const generation = state.generations[generationId];
+    delete state.generations[generationId];
+    updateStopButton();
+    if (!generation || !generation.element) return;
+
+    generation.element.classList.remove('streaming');
+    if (message) {
+        generation.element.dataset.id = message._id;
+        const timeElement = generation.element.querySelector('.message-info');
+        if (timeElement) {
+            // 处理 MongoDB 格式的时间戳
+            if (message.created_at && typeof message.created_at === 'object' && message.created_at.$date) {
+                timeElement.textContent = formatTimestamp(message.created_at.$date);
+            }
+            // 处理 ISO 字符串格式的时间戳
+            else if (message.created_at && typeof message.created_at === 'string') {
+                timeElement.textContent = formatTimestamp(message.created_at);
+            }
+        }
+    } else if (!generation.content) {
+        // 没有收到任何内容，移除空的消息元素
+        generation.element.remove();
+    }
+}
+
 // 处理WebSocket消息
 function handleWebSocketMessage(data) {
     if (data.error) {
-        showError(data.error);
+        const generation = state.generations[data.generation_id];
+        if (data.generation_id) {
+            finishGeneration(data.generation_id);
+        }
+        if (generation && generation.resuming) {
+            // 生成已过期无法恢复，回答已保存在历史消息中
+            console.warn('恢复生成失败:', data.error);
+        } else {
+            showError(data.error);
+        }
         return;
     }
     
     switch (data.type) {
-        case 'stream':
-            // 处理流式内容
-            if (!state.currentAiMessage) {
+        case 'user':
+            // 服务端已保存用户消息，开始生成
+            if (data.generation_id) {
+                state.generations[data.generation_id] = { element: null, content: '', seq: 0 };
+                updateStopButton();
+            }
+            break;
+
+        case 'stream': {
+            // 处理流式内容，同一连接上可能有多个生成同时进行
+            let generation = state.generations[data.generation_id];
+            if (!generation) {
+                generation = { element: null, content: '', seq: 0 };
+                state.generations[data.generation_id] = generation;
+                updateStopButton();
+            }
+            generation.resuming = false;
+            // 忽略重复的片段（重连补发时可能与已收到的重叠）
+            if (data.seq) {
+                if (data.seq <= generation.seq) break;
+                generation.seq = data.seq;
+            }
+            if (!generation.element) {
                 // 创建新的AI消息元素
-                state.currentAiMessage = addMessageToChat({
+                generation.element = addMessageToChat({
                     role: 'assistant',
                     content: '',
                     created_at: new Date().toISOString()
                 }, null, true, true);
             }
-            
+
             // 更新内容
-            const contentElement = state.currentAiMessage.querySelector('.message-content');
-            if (contentElement) {
-                state.currentContent = (state.currentContent || '') + data.content;
-                requestAnimationFrame(() => {
-                    contentElement.innerHTML = marked.parse(state.currentContent, {
-                        breaks: true,
-                        gfm: true,
-                        smartLists: true,
-                        smartypants: true
-                    })
-                    .replace(/<p>\s*<\/p>/g, '')
-                    .replace(/<p>\s*<br\s*\/?>\s*<\/p>/g, '')
-                    .replace(/\n+$/, '')
-                    .replace(/<p><\/p>\n/g, '')
-                    .replace(/\n{2,}/g, '\n')
-                    .trim();
-                    
-                    // 高亮代码块
-                    contentElement.querySelectorAll('pre code').forEach((block) => {
-                        hljs.highlightElement(block);
-                    });
-                    
-                    // 滚动到底部
-                    const messagesContainer = document.getElementById('chatMessages');
-                    if (messagesContainer) {
-                        messagesContainer.scrollTop = messagesContainer.scrollHeight;
-                    }
-                });
-            }
+            generation.content += data.content;
+            renderStreamContent(generation);
             break;
+        }
             
+        case 'queued':
+            // 超出限流，服务端排队等待，可以随时取消
+            if (data.generation_id && !state.generations[data.generation_id]) {
+                state.generations[data.generation_id] = { element: null, content: '', seq: 0 };
+                updateStopButton();
+            }
+            console.info(`请求排队中，预计等待 ${data.retry_after} 秒`);
+            break;
+
+        case 'config':
+            // 服务端确认的流式输出合并参数
+            console.log('流式输出参数:', data);
+            break;
+
+        case 'resumed':
+            // 服务端已恢复生成，随后补发缺失的片段
+            if (state.generations[data.generation_id]) {
+                state.generations[data.generation_id].resuming = false;
+            }
+            break;
+
+        case 'cancelled':
+            // 已停止生成，部分回答已保存
+            finishGeneration(data.generation_id, data.message);
+            break;
+
         case 'done':
             // 处理完成的消息
-            if (state.currentAiMessage) {
-                state.currentAiMessage.classList.remove('streaming');
-                if (data.message) {
-                    state.currentAiMessage.dataset.id = data.message._id;
-                    const timeElement = state.currentAiMessage.querySelector('.message-info');
-                    if (timeElement) {
-                        // 处理 MongoDB 格式的时间戳
-                        if (data.message.created_at && typeof data.message.created_at === 'object' && data.message.created_at.$date) {
-                            timeElement.textContent = formatTimestamp(data.message.created_at.$date);
-                        }
-                        // 处理 ISO 字符串格式的时间戳
-                        else if (data.message.created_at && typeof data.message.created_at === 'string') {
-                            timeElement.textContent = formatTimestamp(data.message.created_at);
-                        }
-                    }
-                }
-                // 清理状态
-                state.currentAiMessage = null;
-                state.currentContent = '';
-            }
+            finishGeneration(data.generation_id, data.message);
 
             // 刷新会话列表
             loadConversations().then(() => {
@@ -1045,11 +1298,9 @@ function handleWebSocketMessage(data) {
             });
             
             break;
-
-
             
         default:
-            console.warn('未知的消��类型:', data.type);
+            console.warn('未知的消息类型:', data.type);
     }
 }
 
@@ -1107,6 +1358,13 @@ document.addEventListener('DOMContentLoaded', function() {
             const scrollHeight = messagesContainer.scrollHeight;
             const clientHeight = messagesContainer.clientHeight;
             
+            // 定位消息后，滚动到底部附近时加载更新的消息
+            if (scrollTop + clientHeight >= scrollHeight - 100 &&
+                state.messageLoadingState.prevPageToken) {
+                loadNewerMessages(state.currentConversation._id);
+                return;
+            }
+
             // 当滚动到顶部附近时加载更多消息
             if (scrollTop <= 100 && 
                 !state.messageLoadingState.loading && 
@@ -21,8 +21,8 @@ class MessageSearchManager {
         });
     }
 
-    async performSearch() {
-        const query = this.searchInput.value.trim();
+    async performSearch(loadMore = false) {
+        const query = loadMore ? this.lastQuery : this.searchInput.value.trim();
         if (!query) return;
 
         if (!state.currentConversation) {
@@ -31,7 +31,12 @@ class MessageSearchManager {
         }
 
         try {
-            const response = await fetch(`/api/conversations/${state.currentConversation._id}/search?q=${encodeURIComponent(query)}`, {
+            let url = `/api/conversations/${state.currentConversation._id}/search?q=${encodeURIComponent(query)}`;
+            if (loadMore && this.nextPageToken) {
+                url += `&page_token=${encodeURIComponent(this.nextPageToken)}`;
+            }
+
+            const response = await fetch(url, {
                 headers: {
                     'X-XSRFToken': getCookie('_xsrf')
                 }
@@ -42,37 +47,80 @@ class MessageSearchManager {
             }
 
             const data = await response.json();
-            this.displayResults(data.messages);
+            this.lastQuery = query;
+            this.nextPageToken = data.next_page_token;
+            this.displayResults(data.messages, loadMore);
         } catch (error) {
             console.error('搜索失败:', error);
             showError('搜索失败');
         }
     }
 
-    displayResults(messages) {
-        if (!messages || messages.length === 0) {
+    // 转义HTML并用 <mark> 包裹命中片段
+    renderSnippet(message) {
+        const escape = (text) => text
+            .replace(/&/g, '&amp;')
+            .replace(/</g, '&lt;')
+            .replace(/>/g, '&gt;');
+        const snippet = message.snippet || message.content || '';
+        let html = '';
+        let position = 0;
+        (message.highlights || []).forEach(([start, end]) => {
+            html += escape(snippet.slice(position, start));
+            html += `<mark>${escape(snippet.slice(start, end))}</mark>`;
+            position = end;
+        });
+        return html + escape(snippet.slice(position));
+    }
+
+    displayResults(messages, append = false) {
+        const loadMoreButton = this.resultsContainer.querySelector('.search-load-more');
+        if (loadMoreButton) {
+            loadMoreButton.remove();
+        }
+
+        if (!append && (!messages || messages.length === 0)) {
             this.resultsContainer.innerHTML = '<div class="text-center text-muted p-3">没有找到匹配的消息</div>';
             return;
         }
 
-        this.resultsContainer.innerHTML = messages.map(message => `
-            <div class="search-result-item ${message.role}">
+        const html = (messages || []).map(message => `
+            <div class="search-result-item ${message.role}" data-id="${message._id}">
                 <div class="header">
                     <span class="role">${message.role === 'user' ? '用户' : 'AI助手'}</span>
                     <span class="timestamp">${formatTimestamp(message.created_at)}</span>
                 </div>
-                <div class="content">${marked.parse(message.content)}</div>
+                <div class="content">${this.renderSnippet(message)}</div>
             </div>
         `).join('');
 
-        // 处理代码块的高亮
-        this.resultsContainer.querySelectorAll('pre code').forEach(block => {
-            hljs.highlightElement(block);
+        if (append) {
+            this.resultsContainer.insertAdjacentHTML('beforeend', html);
+        } else {
+            this.resultsContainer.innerHTML = html;
+        }
+
+        // 点击搜索结果跳转到会话中的对应位置
+        this.resultsContainer.querySelectorAll('.search-result-item:not([data-bound])').forEach(item => {
+            item.dataset.bound = 'true';
+            item.addEventListener('click', () => {
+                this.modal.hide();
+                locateMessage(item.dataset.id);
+            });
         });
+
+        if (this.nextPageToken) {
+            const button = document.createElement('button');
+            button.className = 'btn btn-link w-100 search-load-more';
+            button.textContent = '加载更多';
+            button.addEventListener('click', () => this.performSearch(true));
+            this.resultsContainer.appendChild(button);
+        }
     }
 
     show() {
         this.searchInput.value = '';
+        this.nextPageToken = null;
         this.resultsContainer.innerHTML = '';
         this.modal.show();
         this.searchInput.focus();
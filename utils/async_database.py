@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.database import Database
+from utils.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# 不需要异步化的方法（不访问数据库、只在启动时调用或返回游标生成器）
+_SYNC_ONLY = {
+    "initialize",
+    "ensure_connection",
+    "serialize_doc",
+    "serialize_message",
+    "build_message",
+    "cache_new_message",
+    "share_caches",
+    "disable_caches",
+    "on_cache_invalidated",
+    "publish_cache_change",
+    "iter_messages_newest_first",
+    "export_conversations_cursor",
+    "export_messages_cursor",
+}
+
+DB_QUERY_SECONDS = Histogram(
+    "mychat_db_query_seconds", "数据库操作在线程中的执行时间", ["method"]
+)
+DB_WAIT_SECONDS = Histogram(
+    "mychat_db_executor_wait_seconds", "数据库操作在线程池队列中的等待时间"
+)
+DB_ERRORS = Counter("mychat_db_errors_total", "失败的数据库操作", ["method"])
+
+
+class AsyncDatabase:
+    """Database 的异步门面
+
+    方法名与 Database 完全一致，调用会被提交到专用线程池中执行，
+    pymongo 的阻塞IO不会占用 IOLoop 线程。MongoClient 本身是线程安全的，
+    线程池中的各线程共享同一个连接池。
+    """
+
+    executor = None
+
+    @classmethod
+    def initialize(cls, max_workers: int) -> None:
+        """初始化线程池
+
+        Args:
+            max_workers: 同时执行数据库操作的最大线程数
+        """
+        if cls.executor is None:
+            cls.executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="database"
+            )
+            logger.info(f"数据库线程池初始化成功，线程数: {max_workers}")
+
+    @classmethod
+    def cleanup(cls) -> None:
+        """关闭线程池"""
+        if cls.executor is not None:
+            cls.executor.shutdown(wait=True)
+            cls.executor = None
+
+    @classmethod
+    async def run(cls, func, *args, **kwargs):
+        """在线程池中执行同步函数，并记录排队和执行耗时
+
+        耗时在线程中测量，回到 IOLoop 线程后再写入指标，指标本身无需加锁。
+        """
+        loop = asyncio.get_running_loop()
+        timings = [time.perf_counter()]
+
+        def call():
+            timings.append(time.perf_counter())
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings.append(time.perf_counter())
+
+        method = getattr(func, "__qualname__", "unknown")
+        try:
+            return await loop.run_in_executor(cls.executor, call)
+        except Exception:
+            DB_ERRORS.labels(method).inc()
+            raise
+        finally:
+            if len(timings) == 3:
+                submitted, started, finished = timings
+                DB_WAIT_SECONDS.observe(started - submitted)
+                DB_QUERY_SECONDS.labels(method).observe(finished - started)
+
+
+def _make_async_method(name):
+    """为 Database 的同名方法生成异步包装"""
+
+    async def method(cls, *args, **kwargs):
+        return await cls.run(getattr(Database, name), *args, **kwargs)
+
+    method.__name__ = name
+    method.__qualname__ = f"AsyncDatabase.{name}"
+    method.__doc__ = f"Database.{name} 的异步版本"
+    return classmethod(method)
+
+
+for _name, _value in list(vars(Database).items()):
+    if (
+        isinstance(_value, classmethod)
+        and not _name.startswith("_")
+        and _name not in _SYNC_ONLY
+        and not hasattr(AsyncDatabase, _name)
+    ):
+        setattr(AsyncDatabase, _name, _make_async_method(_name))
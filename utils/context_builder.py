@@ -0,0 +1,176 @@
+import logging
+import re
+from typing import List, Dict, Any, Optional
+from config.settings import OPENAI_CONFIG, SETTINGS
+from utils.database import Database
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken 为可选依赖，未安装时按字符估算
+    tiktoken = None
+
+# 模型上下文窗口大小（token），按前缀匹配，越具体的前缀越靠前
+MODEL_CONTEXT_SIZES = [
+    ("gpt-4o", 128000),
+    ("gpt-4-turbo", 128000),
+    ("gpt-4-1106", 128000),
+    ("gpt-4-0125", 128000),
+    ("gpt-4-32k", 32768),
+    ("gpt-4", 8192),
+    ("gpt-3.5-turbo-16k", 16385),
+    ("gpt-3.5-turbo-1106", 16385),
+    ("gpt-3.5-turbo-0125", 16385),
+    ("gpt-3.5-turbo", 4096),
+]
+
+# 每条消息的格式开销（role、分隔符等），以及回复的起始开销
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+# CJK 字符大致一个字一个token，其余文本大致四个字符一个token
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+
+
+class TokenCounter:
+    """token计数器，优先使用 tiktoken，未安装时使用估算"""
+
+    def __init__(self, model: str):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        # 缓存在消息上的计数需要与编码对应，编码变化时重新计算
+        self.name = self.encoding.name if self.encoding else "estimate"
+
+    def count(self, text: str) -> int:
+        """计算文本的token数量"""
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        cjk = len(_CJK_PATTERN.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+
+class ContextBuilder:
+    """会话上下文组装
+
+    从最新消息开始向前遍历历史，在模型上下文窗口扣除回复预留后的
+    token预算内尽量多地放入历史消息，最后按时间正序输出。
+    每条消息的token数量会缓存在消息文档上，后续轮次无需重新计算。
+    """
+
+    @staticmethod
+    def get_context_size(model: str) -> int:
+        """获取模型的上下文窗口大小
+
+        Args:
+            model: 模型ID
+
+        Returns:
+            int: 上下文窗口大小（token）
+        """
+        for prefix, size in MODEL_CONTEXT_SIZES:
+            if model.startswith(prefix):
+                return size
+        return OPENAI_CONFIG["context"]["default_context_size"]
+
+    @staticmethod
+    def format_message(message: Dict[str, Any]) -> Dict[str, Any]:
+        """格式化消息，只保留 OpenAI API 所需的字段"""
+        formatted = {"role": message["role"], "content": message["content"]}
+
+        # 如果有 name 字段（用于 function calling），也保留它
+        if "name" in message:
+            formatted["name"] = message["name"]
+
+        return formatted
+
+    @staticmethod
+    def _iter_history(conversation_id: str):
+        """从新到旧遍历历史消息
+
+        先读取缓存的最近消息，不够时再从数据库继续向前读取。
+        """
+        recent = Database.get_recent_messages(conversation_id)
+        yield from recent
+
+        if len(recent) < SETTINGS["cache"]["recent_messages"]:
+            return
+        oldest = recent[-1]
+        yield from Database.iter_messages_newest_first(
+            conversation_id,
+            OPENAI_CONFIG["context"]["batch_size"],
+            before=(oldest["created_at"], oldest["_id"]),
+        )
+
+    @classmethod
+    def build(
+        cls, conversation_id: str, model: str, system_prompt: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """组装发送给模型的消息列表（同步执行，会访问数据库）
+
+        Args:
+            conversation_id: 会话ID
+            model: 模型ID，用于确定上下文窗口和token编码
+            system_prompt: 系统提示词
+
+        Returns:
+            List[Dict[str, Any]]: 按时间正序排列的消息列表
+        """
+        context_config = OPENAI_CONFIG["context"]
+        counter = TokenCounter(model)
+        budget = (
+            cls.get_context_size(model)
+            - context_config["reserve_tokens"]
+            - TOKENS_PER_REPLY
+        )
+
+        system_message = None
+        if system_prompt:
+            system_message = {"role": "system", "content": system_prompt}
+            budget -= counter.count(system_prompt) + TOKENS_PER_MESSAGE
+
+        history = []
+        new_counts = {}
+        for message in cls._iter_history(conversation_id):
+            if (
+                message.get("token_encoding") == counter.name
+                and "token_count" in message
+            ):
+                tokens = message["token_count"]
+            else:
+                tokens = counter.count(message["content"])
+                new_counts[message["_id"]] = tokens
+                # 同步更新缓存中的消息文档
+                message["token_count"] = tokens
+                message["token_encoding"] = counter.name
+
+            cost = tokens + TOKENS_PER_MESSAGE
+            # 最新的一条消息总是保留，其余消息超出预算即停止
+            if history and cost > budget:
+                break
+            budget -= cost
+            history.append(cls.format_message(message))
+            if len(history) >= context_config["max_messages"]:
+                break
+
+        try:
+            Database.set_message_token_counts(new_counts, counter.name)
+        except Exception:
+            # 缓存失败已记录日志，不影响本轮对话
+            pass
+
+        history.reverse()
+        if system_message:
+            history.insert(0, system_message)
+
+        logger.info(
+            f"组装上下文: 会话 {conversation_id}, 模型 {model}, "
+            f"消息 {len(history)} 条, 剩余预算 {budget} tokens"
+        )
+        return history
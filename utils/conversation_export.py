@@ -0,0 +1,300 @@
+import json
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+from bson import ObjectId, json_util
+from bson.json_util import RELAXED_JSON_OPTIONS
+from config.settings import SETTINGS
+from utils.database import Database, utc_now
+from utils.async_database import AsyncDatabase
+from utils.metrics import Counter
+from utils.search import index_tokens
+
+logger = logging.getLogger(__name__)
+
+# 导出文件的格式版本，写在第一行的 header 中
+EXPORT_VERSION = 1
+# 导入时单行的最大字节数（单个文档不超过 BSON 的 16MB 上限）
+MAX_LINE_BYTES = 32 * 1024 * 1024
+
+EXPORTED_DOCUMENTS = Counter(
+    "mychat_export_documents_total", "导出的会话和消息数", ["type"]
+)
+IMPORTED_DOCUMENTS = Counter(
+    "mychat_import_documents_total", "导入的会话和消息数", ["type"]
+)
+
+# 导入时不从文件中读取、由服务端重新生成的字段
+CONVERSATION_IMPORT_IGNORED = (
+    "_id",
+    "user_id",
+    "archived",
+    "archived_at",
+    "lifecycle_lease",
+)
+MESSAGE_IMPORT_IGNORED = ("_id", "conversation_id", "search_tokens")
+
+
+def export_line(kind: str, document: Dict[str, Any]) -> bytes:
+    """一行 NDJSON：{"type": kind, kind: document}
+
+    使用 Extended JSON（relaxed），ObjectId 和时间在导入时可以还原。
+    """
+    line = json_util.dumps(
+        {"type": kind, kind: document},
+        ensure_ascii=False,
+        json_options=RELAXED_JSON_OPTIONS,
+    )
+    return (line + "\n").encode("utf-8")
+
+
+async def iter_export(
+    user_id: str, conversation_id: str = None, batch_size: int = None
+) -> AsyncIterator[bytes]:
+    """按批生成导出内容
+
+    第一行是 header，之后每个会话一行，紧跟该会话按时间排列的消息（已归档的会话
+    从归档块中解压）。会话和消息都通过游标在线程池中分批读取，每次产出一批拼接好的
+    NDJSON 行，内存占用只与 batch_size 有关，与导出的总量无关。
+
+    Args:
+        user_id: 用户ID
+        conversation_id: 只导出该会话，为空表示用户的全部会话
+        batch_size: 每批的文档数，默认读取配置
+
+    Yields:
+        bytes: 若干完整的 NDJSON 行
+    """
+    batch_size = batch_size or SETTINGS["export"]["batch_size"]
+    yield export_line(
+        "header",
+        {
+            "version": EXPORT_VERSION,
+            "exported_at": utc_now(),
+            "conversation_id": conversation_id,
+        },
+    )
+
+    conversations = Database.export_conversations_cursor(
+        user_id, conversation_id, batch_size
+    )
+    try:
+        while True:
+            batch = await AsyncDatabase.fetch_batch(conversations, batch_size)
+            if not batch:
+                break
+            for conversation in batch:
+                yield export_line("conversation", conversation)
+                EXPORTED_DOCUMENTS.labels("conversation").inc()
+                async for chunk in _iter_messages(conversation, batch_size):
+                    yield chunk
+    finally:
+        await AsyncDatabase.close_cursor(conversations)
+
+
+async def _iter_messages(
+    conversation: Dict[str, Any], batch_size: int
+) -> AsyncIterator[bytes]:
+    """按批生成一个会话的消息行"""
+    cursor = Database.export_messages_cursor(
+        conversation["_id"], bool(conversation.get("archived")), batch_size
+    )
+    try:
+        while True:
+            # 已归档的会话在线程池中逐块解压，每次最多解压一块
+            batch = await AsyncDatabase.fetch_batch(cursor, batch_size)
+            if not batch:
+                break
+            yield b"".join(export_line("message", message) for message in batch)
+            EXPORTED_DOCUMENTS.labels("message").inc(len(batch))
+    finally:
+        await AsyncDatabase.close_cursor(cursor)
+
+
+class ConversationImporter:
+    """把导出的 NDJSON 导入到指定用户
+
+    以任意大小的数据块调用 feed，按行解析后攒够 batch_size 个文档
+    用一次 insert_many 写入，最后调用 close。会话和消息都生成新的 _id
+    （导入文件中的会话ID只用于把消息对应到新会话），同一文件可以重复导入为副本，
+    也不会覆盖任何已有数据。消息必须出现在所属会话之后，否则跳过。
+    """
+
+    def __init__(self, user_id: str, batch_size: int = None):
+        if not ObjectId.is_valid(user_id):
+            raise ValueError("无效的用户ID")
+        self.user_id = ObjectId(user_id)
+        self.batch_size = batch_size or SETTINGS["export"]["import_batch_size"]
+        # 导入文件中的会话ID -> 新会话ID
+        self.conversation_ids: Dict[Any, ObjectId] = {}
+        # 新会话ID -> 已写入的消息数
+        self.message_counts: Dict[ObjectId, int] = {}
+        self.conversations: List[Dict[str, Any]] = []
+        self.messages: List[Dict[str, Any]] = []
+        # 尚未读到换行的当前行（数据块列表）及其字节数
+        self.partial: List[bytes] = []
+        self.partial_bytes = 0
+        self.line_number = 0
+        self.stats = {"conversations": 0, "messages": 0, "skipped": 0}
+
+    async def feed(self, data: bytes) -> None:
+        """接收一段数据，解析其中完整的行，攒够一批时写入数据库
+
+        只在新数据中查找换行，未完成的行按数据块暂存，到换行时才拼接一次，
+        很长的行分成许多小块到达时耗时也与行长成正比。
+
+        Raises:
+            ValueError: 某一行不是有效的导出记录或超过 MAX_LINE_BYTES
+        """
+        start = 0
+        while True:
+            end = data.find(b"\n", start)
+            if end < 0:
+                break
+            line = self._take_line(data[start:end])
+            start = end + 1
+            self._parse_line(line)
+            if len(self.conversations) + len(self.messages) >= self.batch_size:
+                await self.flush()
+        if start < len(data):
+            self._append_partial(data[start:])
+
+    async def close(self, discard: bool = False) -> Dict[str, int]:
+        """处理最后一行，写入剩余的文档和已写入会话的消息数
+
+        Args:
+            discard: 丢弃尚未写入的文档（导入出错或中断时），已写入的批次保留
+
+        Returns:
+            Dict[str, int]: conversations、messages 和 skipped（找不到会话的消息数）
+        """
+        if discard:
+            self.conversations, self.messages = [], []
+        elif self.partial:
+            self._parse_line(self._take_line(b""))
+        self.partial, self.partial_bytes = [], 0
+        if not discard:
+            await self.flush()
+        await AsyncDatabase.set_message_counts(self.message_counts)
+        return dict(self.stats)
+
+    async def flush(self) -> None:
+        """写入已解析的一批文档"""
+        if not self.conversations and not self.messages:
+            return
+        conversations, messages = self.conversations, self.messages
+        self.conversations, self.messages = [], []
+        await AsyncDatabase.import_documents(conversations, messages)
+        for conversation in conversations:
+            self.message_counts[conversation["_id"]] = 0
+        for message in messages:
+            self.message_counts[message["conversation_id"]] += 1
+        self.stats["conversations"] += len(conversations)
+        self.stats["messages"] += len(messages)
+        IMPORTED_DOCUMENTS.labels("conversation").inc(len(conversations))
+        IMPORTED_DOCUMENTS.labels("message").inc(len(messages))
+
+    def _append_partial(self, data: bytes) -> None:
+        """暂存未完成的行，超过长度上限时立即报错"""
+        self.partial_bytes += len(data)
+        if self.partial_bytes > MAX_LINE_BYTES:
+            raise ValueError(f"第 {self.line_number + 1} 行过长")
+        self.partial.append(data)
+
+    def _take_line(self, tail: bytes) -> bytes:
+        """以 tail 结束当前行，返回完整的一行"""
+        if not self.partial:
+            if len(tail) > MAX_LINE_BYTES:
+                raise ValueError(f"第 {self.line_number + 1} 行过长")
+            return tail
+        self._append_partial(tail)
+        line = b"".join(self.partial)
+        self.partial, self.partial_bytes = [], 0
+        return line
+
+    def _parse_line(self, line: bytes) -> None:
+        """解析一行导出记录，转为待写入的文档"""
+        self.line_number += 1
+        line = line.strip()
+        if not line:
+            return
+        try:
+            record = json_util.loads(line, json_options=RELAXED_JSON_OPTIONS)
+        except (ValueError, json.JSONDecodeError):
+            raise ValueError(f"第 {self.line_number} 行不是有效的 JSON")
+        kind = record.get("type") if isinstance(record, dict) else None
+        document = record.get(kind) if isinstance(kind, str) else None
+        if kind not in ("header", "conversation", "message") or not isinstance(
+            document, dict
+        ):
+            raise ValueError(f"第 {self.line_number} 行不是有效的导出记录")
+
+        if kind == "header":
+            version = document.get("version", EXPORT_VERSION)
+            if (
+                not isinstance(version, int)
+                or isinstance(version, bool)
+                or version > EXPORT_VERSION
+            ):
+                raise ValueError(f"不支持的导出版本: {version!r}")
+        elif kind == "conversation":
+            self.conversations.append(self._conversation(document))
+        else:
+            message = self._message(document)
+            if message is None:
+                self.stats["skipped"] += 1
+            else:
+                self.messages.append(message)
+
+    def _source_id(self, value: Any) -> Any:
+        """导入文件中的会话ID（只用作字典的键）
+
+        Raises:
+            ValueError: 不是 ObjectId、字符串或整数
+        """
+        if value is not None and not isinstance(value, (ObjectId, str, int)):
+            raise ValueError(f"第 {self.line_number} 行的会话ID无效")
+        return value
+
+    def _conversation(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """导入的会话：新的 _id，属于当前用户"""
+        conversation = {
+            key: value
+            for key, value in document.items()
+            if key not in CONVERSATION_IMPORT_IGNORED
+        }
+        conversation_id = ObjectId()
+        self.conversation_ids[self._source_id(document.get("_id"))] = conversation_id
+
+        now = utc_now()
+        conversation["_id"] = conversation_id
+        conversation["user_id"] = self.user_id
+        conversation.setdefault("title", "导入的会话")
+        for key in ("created_at", "updated_at", "last_message_at"):
+            if not isinstance(conversation.get(key), datetime):
+                conversation[key] = now
+        return conversation
+
+    def _message(self, document: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """导入的消息：新的 _id，对应到新会话并重新生成索引词"""
+        conversation_id = self.conversation_ids.get(
+            self._source_id(document.get("conversation_id"))
+        )
+        if conversation_id is None:
+            return None
+        role, content = document.get("role"), document.get("content")
+        if not isinstance(role, str) or not isinstance(content, str):
+            raise ValueError(f"第 {self.line_number} 行的消息缺少 role 或 content")
+
+        message = {
+            key: value
+            for key, value in document.items()
+            if key not in MESSAGE_IMPORT_IGNORED
+        }
+        message["_id"] = ObjectId()
+        message["conversation_id"] = conversation_id
+        if not isinstance(message.get("created_at"), datetime):
+            message["created_at"] = utc_now()
+        message.setdefault("updated_at", message["created_at"])
+        message["search_tokens"] = index_tokens(content)
+        return message
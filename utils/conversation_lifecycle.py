@@ -0,0 +1,275 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from tornado.ioloop import IOLoop, PeriodicCallback
+from config.settings import SETTINGS
+from utils.database import utc_now
+from utils.async_database import AsyncDatabase
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# 后台任务的租约（秒），每删除一批消息续期一次
+JOB_LEASE = 300
+# 其他进程正在归档或恢复同一会话时，重试恢复的间隔（秒）
+RESTORE_RETRY_INTERVAL = 0.5
+
+LIFECYCLE_CONVERSATIONS = Counter(
+    "mychat_conversation_lifecycle_total",
+    "删除、归档和恢复的会话数",
+    ["operation"],
+)
+LIFECYCLE_MESSAGES = Counter(
+    "mychat_conversation_lifecycle_messages_total",
+    "删除（inline / background）、归档和恢复的消息数",
+    ["operation"],
+)
+ARCHIVE_BYTES = Counter(
+    "mychat_message_archive_bytes_total",
+    "归档消息的字节数（raw 为压缩前，stored 为压缩后）",
+    ["kind"],
+)
+
+
+class ConversationLifecycle:
+    """会话的删除、批量操作和归档
+
+    删除会话时级联删除其消息和归档：消息不多时在请求中用一次 delete_many 完成，
+    大会话的消息转为 lifecycle_jobs 中的后台任务，由本类定期领取并分批删除。
+    归档把会话的消息压缩成按会话分块的二进制文档（message_archives），
+    浏览和搜索已归档的会话时直接从归档块读取，继续对话（写入新消息）时才恢复。
+    开启 archive_after_days 后，长期没有新消息的会话会在后台自动归档。
+    """
+
+    stats = {
+        "deleted": 0,
+        "archived": 0,
+        "restored": 0,
+        "jobs": 0,
+        "background_messages": 0,
+        "failures": 0,
+    }
+    _periodic = None
+    _running = None
+
+    @classmethod
+    def initialize(cls, interval: float = None) -> None:
+        """开始定期执行后台任务
+
+        Args:
+            interval: 执行间隔（秒），默认读取配置
+        """
+        if cls._periodic is not None:
+            return
+
+        interval = interval or SETTINGS["lifecycle"]["job_interval"]
+        cls._periodic = PeriodicCallback(cls.run, interval * 1000)
+        cls._periodic.start()
+        logger.info(f"会话生命周期任务初始化成功，执行间隔: {interval}s")
+
+    @classmethod
+    def cleanup(cls) -> None:
+        """停止定期执行（未完成的任务在租约到期后由其他进程继续）"""
+        if cls._periodic is not None:
+            cls._periodic.stop()
+            cls._periodic = None
+
+    @classmethod
+    async def delete(
+        cls,
+        user_id: str,
+        conversation_ids: Optional[List[str]] = None,
+        before: Optional[datetime] = None,
+    ) -> Dict[str, Any]:
+        """删除用户的会话及其消息，参数和返回值见 Database.delete_conversations"""
+        result = await AsyncDatabase.delete_conversations(
+            user_id, conversation_ids, before
+        )
+        cls.stats["deleted"] += result["conversations"]
+        LIFECYCLE_CONVERSATIONS.labels("delete").inc(result["conversations"])
+        LIFECYCLE_MESSAGES.labels("delete_inline").inc(result["messages"])
+        if result["background"]:
+            # 不等下一个周期，立即开始后台删除
+            IOLoop.current().add_callback(cls.run)
+        return result
+
+    @classmethod
+    async def archive(
+        cls,
+        user_id: str,
+        conversation_ids: Optional[List[str]] = None,
+        before: Optional[datetime] = None,
+    ) -> Dict[str, int]:
+        """归档用户的会话
+
+        Args:
+            user_id: 用户ID
+            conversation_ids: 会话ID列表
+            before: 只归档最后消息时间早于该时间的会话
+
+        Returns:
+            Dict[str, int]: conversations、messages、raw_bytes 和 stored_bytes
+        """
+        conversation_ids = await AsyncDatabase.select_conversations(
+            user_id, conversation_ids, before, archived=False
+        )
+        return await cls._archive_all(conversation_ids)
+
+    @classmethod
+    async def restore(
+        cls,
+        user_id: str,
+        conversation_ids: Optional[List[str]] = None,
+        before: Optional[datetime] = None,
+    ) -> Dict[str, int]:
+        """恢复用户已归档的会话
+
+        Args:
+            user_id: 用户ID
+            conversation_ids: 会话ID列表
+            before: 只恢复最后消息时间早于该时间的会话
+
+        Returns:
+            Dict[str, int]: conversations 和 messages
+        """
+        conversation_ids = await AsyncDatabase.select_conversations(
+            user_id, conversation_ids, before, archived=True
+        )
+        result = {"conversations": 0, "messages": 0}
+        for conversation_id in conversation_ids:
+            result["messages"] += await cls._restore_one(conversation_id)
+            result["conversations"] += 1
+        return result
+
+    @classmethod
+    async def ensure_restored(cls, conversation: Dict[str, Any]) -> Dict[str, Any]:
+        """会话已归档时先恢复其消息（写入新消息前调用）
+
+        Args:
+            conversation: get_conversation 返回的会话
+
+        Returns:
+            Dict[str, Any]: 未归档的会话
+        """
+        if not conversation.get("archived"):
+            return conversation
+        await cls._restore_one(conversation["_id"])
+        conversation = dict(conversation)
+        conversation.pop("archived", None)
+        conversation.pop("archived_at", None)
+        return conversation
+
+    @classmethod
+    async def _restore_one(cls, conversation_id: str) -> int:
+        """恢复一个会话，返回恢复的消息数
+
+        其他进程（或同一进程中的并发请求）正在归档或恢复该会话时，等待其完成后
+        重试，最多等待一个租约的时间。
+
+        Raises:
+            RuntimeError: 等待超时
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SETTINGS["lifecycle"]["archive_lease"]
+        while True:
+            restored = await AsyncDatabase.restore_conversation(conversation_id)
+            if restored is not None:
+                break
+            if loop.time() >= deadline:
+                raise RuntimeError(f"会话 {conversation_id} 正在归档或恢复，请稍后重试")
+            await asyncio.sleep(RESTORE_RETRY_INTERVAL)
+        cls.stats["restored"] += 1
+        LIFECYCLE_CONVERSATIONS.labels("restore").inc()
+        LIFECYCLE_MESSAGES.labels("restore").inc(restored)
+        logger.info(f"会话 {conversation_id} 已恢复 {restored} 条归档消息")
+        return restored
+
+    @classmethod
+    async def _archive_all(cls, conversation_ids: List[str]) -> Dict[str, int]:
+        """逐个归档会话并汇总结果"""
+        result = {"conversations": 0, "messages": 0, "raw_bytes": 0, "stored_bytes": 0}
+        for conversation_id in conversation_ids:
+            archived = await AsyncDatabase.archive_conversation(conversation_id)
+            if archived is None:
+                # 已被其他进程（或同时进行的批量归档）归档
+                continue
+            result["conversations"] += 1
+            for key in ("messages", "raw_bytes", "stored_bytes"):
+                result[key] += archived[key]
+            cls.stats["archived"] += 1
+            LIFECYCLE_CONVERSATIONS.labels("archive").inc()
+            LIFECYCLE_MESSAGES.labels("archive").inc(archived["messages"])
+            ARCHIVE_BYTES.labels("raw").inc(archived["raw_bytes"])
+            ARCHIVE_BYTES.labels("stored").inc(archived["stored_bytes"])
+        return result
+
+    @classmethod
+    async def run(cls) -> None:
+        """执行一轮后台任务：分批删除大会话的消息，然后自动归档闲置会话"""
+        if cls._running is not None:
+            # 上一轮还没结束
+            return
+        cls._running = asyncio.ensure_future(cls._run_once())
+        try:
+            await cls._running
+        except Exception as e:
+            cls.stats["failures"] += 1
+            logger.error(f"会话生命周期任务失败: {str(e)}")
+        finally:
+            cls._running = None
+
+    @classmethod
+    async def _run_once(cls) -> None:
+        await cls.run_jobs()
+        days = SETTINGS["lifecycle"]["archive_after_days"]
+        if days > 0:
+            conversation_ids = await AsyncDatabase.find_idle_conversations(
+                utc_now() - timedelta(days=days),
+                SETTINGS["lifecycle"]["archive_batch"],
+            )
+            if conversation_ids:
+                result = await cls._archive_all(conversation_ids)
+                logger.info(
+                    f"自动归档 {result['conversations']} 个会话、"
+                    f"{result['messages']} 条消息，"
+                    f"{result['raw_bytes']} -> {result['stored_bytes']} 字节"
+                )
+
+    @classmethod
+    async def run_jobs(cls) -> None:
+        """领取并执行全部后台删除任务
+
+        每批消息是一次独立的数据库调用，期间线程池可以处理其他请求。
+        """
+        batch_size = SETTINGS["lifecycle"]["delete_batch_size"]
+        while True:
+            job = await AsyncDatabase.claim_lifecycle_job(JOB_LEASE)
+            if job is None:
+                return
+            deleted = 0
+            while True:
+                count = await AsyncDatabase.delete_message_batch(
+                    job["_id"], job["conversation_ids"], batch_size, JOB_LEASE
+                )
+                deleted += count
+                LIFECYCLE_MESSAGES.labels("delete_background").inc(count)
+                if count < batch_size:
+                    break
+            await AsyncDatabase.finish_lifecycle_job(
+                job["_id"], job["conversation_ids"]
+            )
+            cls.stats["jobs"] += 1
+            cls.stats["background_messages"] += deleted
+            logger.info(
+                f"后台删除完成: {len(job['conversation_ids'])} 个会话，"
+                f"{deleted} 条消息"
+            )
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """生命周期统计"""
+        return {
+            **cls.stats,
+            "archive_after_days": SETTINGS["lifecycle"]["archive_after_days"],
+        }
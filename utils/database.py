@@ -1,17 +1,96 @@
 import logging
 import json
-from datetime import datetime
-from typing import List, Dict, Any, Optional
-from bson import ObjectId
-from pymongo import MongoClient
+import heapq
+import zlib
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import List, Dict, Any, Optional, Iterator, Tuple, Callable
+import bson
+from bson import Binary, ObjectId
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from config.settings import SETTINGS
+from utils.cache import LRUCache
+from utils.indexes import ensure_indexes
+from utils.pagination import encode_page_token, decode_page_token, keyset_filter
+from utils.search import index_tokens, query_tokens, score, highlight
 import hashlib
 
 logger = logging.getLogger(__name__)
 
+# 组装上下文时需要的消息字段
+CONTEXT_FIELDS = {
+    "role": 1,
+    "content": 1,
+    "name": 1,
+    "created_at": 1,
+    "token_count": 1,
+    "token_encoding": 1,
+}
+
+
+def utc_now() -> datetime:
+    """当前UTC时间，截断到毫秒
+
+    MongoDB 只保存毫秒精度，截断后内存中的时间与数据库中的一致，
+    可直接用作范围查询的边界。
+    """
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+# 返回给前端的消息不包含搜索索引词
+MESSAGE_PROJECTION = {"search_tokens": 0}
+
+# 会话列表默认返回的字段（不包含较长的系统提示词）
+CONVERSATION_LIST_FIELDS = (
+    "title",
+    "model_id",
+    "created_at",
+    "updated_at",
+    "last_message_at",
+    "message_count",
+    "last_message_preview",
+    "last_message_role",
+)
+# 会话列表可以通过 fields 参数请求的字段
+CONVERSATION_SELECTABLE_FIELDS = CONVERSATION_LIST_FIELDS + (
+    "system_prompt",
+    "cache_responses",
+    "archived_at",
+)
+
+# 归档块的编码：依次拼接的 BSON 消息文档，整体 zlib 压缩
+ARCHIVE_CODEC = "bson+zlib"
+# 多进程部署时广播缓存失效的频道
+CACHE_CHANNEL = "caches"
+
+
+def message_preview(content: Optional[str]) -> str:
+    """会话列表中显示的最后一条消息摘要"""
+    limit = SETTINGS["conversations"]["preview_chars"]
+    content = " ".join((content or "").split())
+    return content if len(content) <= limit else content[:limit] + "…"
+
 
 class Database:
     client = None
     db = None
+    # 会话文档缓存：会话ID -> 序列化后的会话
+    conversation_cache = LRUCache(
+        SETTINGS["cache"]["max_conversations"], SETTINGS["cache"]["ttl"]
+    )
+    # 最近消息缓存：会话ID -> 从新到旧排列的原始消息文档（仅上下文字段）
+    recent_messages_cache = LRUCache(
+        SETTINGS["cache"]["max_conversations"], SETTINGS["cache"]["ttl"]
+    )
+    # 消息总数缓存：会话ID -> 消息数量
+    message_count_cache = LRUCache(
+        SETTINGS["cache"]["max_conversations"], SETTINGS["cache"]["ttl"]
+    )
+    # 多进程部署时广播缓存失效的函数和本进程的标识（见 share_caches）
+    cache_publisher = None
+    cache_source = None
 
     @classmethod
     def initialize(cls, mongodb_uri: str, database_name: str) -> None:
@@ -27,11 +106,22 @@ class Database:
                 cls.db = cls.client[database_name]
                 # 测试连接
                 cls.db.command("ping")
+                # 创建热点查询所需的索引（幂等）
+                ensure_indexes(cls.db)
                 logger.info("数据库连接初始化成功")
         except Exception as e:
             logger.error(f"数据库连接初始化失败: {str(e)}")
             raise
 
+    @classmethod
+    def cleanup(cls) -> None:
+        """关闭数据库连接"""
+        if cls.client is not None:
+            cls.client.close()
+            cls.client = None
+            cls.db = None
+            logger.info("数据库连接已关闭")
+
     @classmethod
     def ensure_connection(cls):
         """确保数据库连接存在"""
@@ -146,6 +236,7 @@ class Database:
         try:
             db = cls.ensure_connection()
             db[collection_name].delete_many({})
+            cls.invalidate_cache(collection_name)
         except Exception as e:
             logger.error(f"清空集合 {collection_name} 失败: {str(e)}")
             raise
@@ -166,6 +257,7 @@ class Database:
             result = db[collection_name].delete_one({"_id": ObjectId(document_id)})
             if result.deleted_count == 0:
                 raise ValueError("文档不存在")
+            cls.invalidate_cache(collection_name, document_id)
 
         except Exception as e:
             logger.error(f"删除文档失败: {str(e)}")
@@ -197,6 +289,7 @@ class Database:
 
             if result.matched_count == 0:
                 raise ValueError("文档不存在")
+            cls.invalidate_cache(collection_name, document_id)
 
         except Exception as e:
             logger.error(f"更新文档失败: {str(e)}")
@@ -208,15 +301,28 @@ class Database:
         conversation_id: str,
         page_size: int = 10,
         page_token: str = None,
-        target_message_id: str = None,
+        direction: str = "older",
+        include_total: bool = False,
+        archived: bool = False,
     ) -> Dict[str, Any]:
         """获取会话的消息列表
 
+        分页基于 (created_at, _id) 键：分页标记中直接编码了边界消息的
+        created_at 和 _id，每页只需一次命中复合索引的范围查询，
+        created_at 相同的消息也不会重复或遗漏。
+
         Args:
             conversation_id: 会话ID
             page_size: 每页消息数量
-            page_token: 分页标记，为消息ID，如果提供则获取该消息之前的消息
-            target_message_id: 目标消息ID，如果提供则返回包含该消息的一页数据
+            page_token: 分页标记，由上一页的 next_page_token 或 prev_page_token 给出
+            direction: 没有分页标记时的起点，older 从最新消息开始，
+                newer 从最早的消息开始
+            include_total: 是否返回消息总数（使用缓存）
+            archived: 会话已归档，直接从归档块读取（不恢复）
+
+        Returns:
+            Dict[str, Any]: messages 按时间倒序排列；next_page_token 用于获取
+                更早的消息，prev_page_token 用于获取更新的消息
         """
         try:
             db = cls.ensure_connection()
@@ -225,76 +331,464 @@ class Database:
                 logger.error(f"无效的会话ID: {conversation_id}")
                 return {"messages": [], "total": 0, "next_page_token": None}
 
-            # 获取消息总数
-            total = db.messages.count_documents(
-                {"conversation_id": ObjectId(conversation_id)}
+            # 常规分页逻辑
+            position = decode_page_token(page_token)
+            if position:
+                direction = position.get("d", "older")
+            newer = direction == "newer"
+
+            messages = cls._message_window(
+                db,
+                ObjectId(conversation_id),
+                (
+                    (position["t"], position["i"])
+                    if position and "t" in position
+                    else None
+                ),
+                newer,
+                page_size + 1,  # 多获取一条用于判断是否还有更多
+                archived,
             )
 
-            # 如果指定了目标消息ID
-            if target_message_id and ObjectId.is_valid(target_message_id):
-                # 获取目标消息
-                target_message = db.messages.find_one(
-                    {"_id": ObjectId(target_message_id)}
-                )
-                if target_message:
-                    # 获取目标消息前后的消息
-                    messages = list(
-                        db.messages.find(
-                            {
-                                "conversation_id": ObjectId(conversation_id),
-                                "created_at": {"$lte": target_message["created_at"]},
-                            }
-                        )
-                        .sort("created_at", -1)
-                        .limit(page_size)
-                    )
+            # 判断是否还有更多消息
+            has_more = len(messages) > page_size
+            messages = messages[:page_size]
+            if newer:
+                # 统一按时间倒序返回
+                messages.reverse()
+
+            next_page_token = None
+            prev_page_token = None
+            if messages:
+                # 向旧的方向：本页是从更新的位置翻过来的，或者还有更旧的消息
+                if (not newer and has_more) or (newer and position):
+                    next_page_token = cls._message_page_token(messages[-1], "older")
+                if (newer and has_more) or (not newer and position):
+                    prev_page_token = cls._message_page_token(messages[0], "newer")
+
+            result = {
+                "messages": [cls.serialize_doc(msg) for msg in messages],
+                "next_page_token": next_page_token,
+                "prev_page_token": prev_page_token,
+            }
+            if include_total:
+                result["total"] = cls.count_messages(conversation_id, archived)
+            return result
+        except Exception as e:
+            logger.error(f"获取消息列表失败: {str(e)}")
+            raise
 
-                    # 判断是否还有更多消息
-                    has_more = len(messages) == page_size
-                    next_page_token = str(messages[-1]["_id"]) if has_more else None
+    @classmethod
+    def locate_message(
+        cls,
+        conversation_id: str,
+        message_id: str,
+        window: int = 10,
+        archived: bool = False,
+    ) -> Dict[str, Any]:
+        """定位消息：返回目标消息及其前后各 window 条消息
 
-                    # 序列化消息
-                    serialized_messages = [cls.serialize_doc(msg) for msg in messages]
+        目标消息通过 _id 查找，前后的消息各用一次 (created_at, _id)
+        复合索引上的范围查询获取，耗时与会话的消息总数无关。
 
-                    return {
-                        "messages": serialized_messages,
-                        "total": total,
-                        "next_page_token": next_page_token,
-                        "target_message_id": target_message_id,
-                    }
+        Args:
+            conversation_id: 会话ID
+            message_id: 目标消息ID
+            window: 目标消息前后各返回的消息数量
+            archived: 会话已归档，直接从归档块读取（不恢复）
 
-            # 常规分页逻辑
-            query = {"conversation_id": ObjectId(conversation_id)}
-            if page_token and ObjectId.is_valid(page_token):
-                last_message = db.messages.find_one({"_id": ObjectId(page_token)})
-                if last_message:
-                    query["created_at"] = {"$lt": last_message["created_at"]}
-
-            # 获取消息并按时间倒序排序
-            messages = list(
-                db.messages.find(query)
-                .sort("created_at", -1)  # -1 表示降序，最新的消息在前
-                .limit(page_size + 1)  # 多获取一条用于判断是否还有更多
-            )
+        Returns:
+            Dict[str, Any]: messages 按时间倒序排列，并带有向两个方向继续
+                翻页的 next_page_token（更早）和 prev_page_token（更新）；
+                找不到消息时返回 error
+        """
+        try:
+            db = cls.ensure_connection()
 
-            # 判断是否还有更多消息
-            has_more = len(messages) > page_size
-            if has_more:
-                messages = messages[:page_size]
-                next_page_token = str(messages[-1]["_id"])
+            if not ObjectId.is_valid(conversation_id) or not ObjectId.is_valid(
+                message_id
+            ):
+                return {"error": "无效的会话ID或消息ID"}
+
+            conversation_oid = ObjectId(conversation_id)
+            message_oid = ObjectId(message_id)
+            if archived:
+                # 归档块中没有 _id 索引，按时间顺序查找
+                target = next(
+                    (
+                        message
+                        for message in cls._iter_archived_messages(
+                            db, conversation_oid, True
+                        )
+                        if message["_id"] == message_oid
+                    ),
+                    None,
+                )
             else:
-                next_page_token = None
+                target = db.messages.find_one(
+                    {"_id": message_oid, "conversation_id": conversation_oid},
+                    MESSAGE_PROJECTION,
+                )
+            if not target:
+                return {"error": "消息不存在"}
+
+            key = (target["created_at"], target["_id"])
+            older = cls._message_window(
+                db, conversation_oid, key, False, window + 1, archived
+            )
+            newer = cls._message_window(
+                db, conversation_oid, key, True, window + 1, archived
+            )
 
-            # 序列化消息
-            serialized_messages = [cls.serialize_doc(msg) for msg in messages]
+            has_older = len(older) > window
+            has_newer = len(newer) > window
+            messages = newer[:window][::-1] + [target] + older[:window]
 
             return {
-                "messages": serialized_messages,
-                "total": total,
-                "next_page_token": next_page_token,
+                "messages": [cls.serialize_doc(msg) for msg in messages],
+                "target_message_id": message_id,
+                "next_page_token": (
+                    cls._message_page_token(messages[-1], "older")
+                    if has_older
+                    else None
+                ),
+                "prev_page_token": (
+                    cls._message_page_token(messages[0], "newer") if has_newer else None
+                ),
             }
         except Exception as e:
-            logger.error(f"获取消息列表失败: {str(e)}")
+            logger.error(f"定位消息失败: {str(e)}")
+            raise
+
+    @classmethod
+    def _message_window(
+        cls,
+        db,
+        conversation_id: ObjectId,
+        position: Optional[Tuple[datetime, ObjectId]],
+        newer: bool,
+        limit: int,
+        archived: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """从 position 开始向一个方向读取最多 limit 条消息
+
+        Args:
+            db: pymongo Database
+            conversation_id: 会话ID
+            position: (created_at, _id)，不包含该位置本身；为空时从最新（或最早）开始
+            newer: True 按时间正序读取更新的消息，False 按时间倒序读取更早的消息
+            limit: 最多读取的消息数
+            archived: 会话已归档，从归档块读取
+
+        Returns:
+            List[Dict[str, Any]]: 按读取方向排列的消息
+        """
+        if archived:
+            return list(
+                islice(
+                    cls._iter_archived_messages(db, conversation_id, newer, position),
+                    limit,
+                )
+            )
+        query = {"conversation_id": conversation_id}
+        if position:
+            query.update(
+                keyset_filter("created_at", *position, "$gt" if newer else "$lt")
+            )
+        order = 1 if newer else -1
+        return list(
+            db.messages.find(query, MESSAGE_PROJECTION)
+            .sort([("created_at", order), ("_id", order)])
+            .limit(limit)
+        )
+
+    @classmethod
+    def _iter_archived_messages(
+        cls,
+        db,
+        conversation_id: ObjectId,
+        newer: bool,
+        position: Optional[Tuple[datetime, ObjectId]] = None,
+        inclusive: bool = False,
+    ) -> Iterator[Dict[str, Any]]:
+        """按时间顺序读取已归档会话的消息，不恢复到 messages 集合
+
+        归档块按 seq 顺序逐块解压，用块的 first_created_at / last_created_at
+        跳过 position 之前的块，只需解压用到的块。归档后仍留在 messages 集合中的
+        消息（如归档过程中写入的消息、恢复到一半的块）按时间合并进结果。
+
+        Args:
+            db: pymongo Database
+            conversation_id: 会话ID
+            newer: True 从旧到新读取，False 从新到旧读取
+            position: (created_at, _id)，只返回读取方向上该位置之后的消息
+            inclusive: 是否包含 position 本身
+
+        Yields:
+            Dict[str, Any]: 消息（不含 search_tokens）
+        """
+        order = 1 if newer else -1
+        chunk_query = {"conversation_id": conversation_id}
+        message_query = {"conversation_id": conversation_id}
+        if position:
+            if newer:
+                chunk_query["last_created_at"] = {"$gte": position[0]}
+            else:
+                chunk_query["first_created_at"] = {"$lte": position[0]}
+            operator = "$gt" if newer else "$lt"
+            message_query.update(
+                keyset_filter(
+                    "created_at",
+                    *position,
+                    operator,
+                    operator + "e" if inclusive else operator,
+                )
+            )
+
+        def after(key):
+            if position is None or (inclusive and key == position):
+                return True
+            return key > position if newer else key < position
+
+        def archived_messages():
+            for archive in db.message_archives.find(chunk_query).sort("seq", order):
+                messages = cls.decode_archive(archive)
+                if not newer:
+                    messages.reverse()
+                for message in messages:
+                    if after((message["created_at"], message["_id"])):
+                        yield message
+
+        remaining = db.messages.find(message_query, MESSAGE_PROJECTION).sort(
+            [("created_at", order), ("_id", order)]
+        )
+        return heapq.merge(
+            archived_messages(),
+            remaining,
+            key=lambda message: (message["created_at"], message["_id"]),
+            reverse=not newer,
+        )
+
+    @staticmethod
+    def _message_page_token(message: Dict[str, Any], direction: str) -> str:
+        """生成以指定消息为边界的分页标记"""
+        return encode_page_token(
+            {"t": message["created_at"], "i": message["_id"], "d": direction}
+        )
+
+    @classmethod
+    def count_messages(cls, conversation_id: str, archived: bool = False) -> int:
+        """获取会话的消息总数（优先读缓存）
+
+        Args:
+            conversation_id: 会话ID
+            archived: 会话已归档，累加归档块中的消息数（不缓存）
+
+        Returns:
+            int: 消息数量
+        """
+        if archived:
+            db = cls.ensure_connection()
+            if not ObjectId.is_valid(conversation_id):
+                return 0
+            object_id = ObjectId(conversation_id)
+            return sum(
+                archive["count"]
+                for archive in db.message_archives.find(
+                    {"conversation_id": object_id}, {"count": 1}
+                )
+            ) + db.messages.count_documents({"conversation_id": object_id})
+
+        count = cls.message_count_cache.get(conversation_id)
+        if count is None:
+            db = cls.ensure_connection()
+            if not ObjectId.is_valid(conversation_id):
+                return 0
+            count = db.messages.count_documents(
+                {"conversation_id": ObjectId(conversation_id)}
+            )
+            cls.message_count_cache.set(conversation_id, count)
+        return count
+
+    @classmethod
+    def iter_messages_newest_first(
+        cls,
+        conversation_id: str,
+        batch_size: int = 50,
+        before: Optional[Tuple[datetime, ObjectId]] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """从新到旧遍历会话消息，供上下文组装使用
+
+        只返回组装上下文所需的字段，调用方读够后即可停止迭代，
+        游标按 batch_size 分批从数据库拉取。
+
+        Args:
+            conversation_id: 会话ID
+            batch_size: 每批拉取的消息数量
+            before: (created_at, _id)，只返回排在该位置之前（更旧）的消息
+
+        Returns:
+            Iterator[Dict[str, Any]]: 原始消息文档
+        """
+        db = cls.ensure_connection()
+
+        if not ObjectId.is_valid(conversation_id):
+            logger.error(f"无效的会话ID: {conversation_id}")
+            return
+
+        query = {"conversation_id": ObjectId(conversation_id)}
+        if before:
+            query.update(keyset_filter("created_at", *before, "$lt"))
+
+        cursor = (
+            db.messages.find(query, CONTEXT_FIELDS)
+            .sort([("created_at", -1), ("_id", -1)])
+            .batch_size(batch_size)
+        )
+        try:
+            yield from cursor
+        finally:
+            cursor.close()
+
+    @classmethod
+    def get_recent_messages(cls, conversation_id: str) -> List[Dict[str, Any]]:
+        """获取会话最近的消息（优先读缓存）
+
+        Args:
+            conversation_id: 会话ID
+
+        Returns:
+            List[Dict[str, Any]]: 从新到旧排列的原始消息文档，
+                最多 SETTINGS["cache"]["recent_messages"] 条
+        """
+        messages = cls.recent_messages_cache.get(conversation_id)
+        if messages is None:
+            limit = SETTINGS["cache"]["recent_messages"]
+            messages = []
+            for message in cls.iter_messages_newest_first(conversation_id, limit):
+                messages.append(message)
+                if len(messages) >= limit:
+                    break
+            if ObjectId.is_valid(conversation_id):
+                cls.recent_messages_cache.set(conversation_id, messages)
+        return list(messages)
+
+    @classmethod
+    def invalidate_cache(cls, collection_name: str, document_id: str = None) -> None:
+        """通过数据库管理接口直接修改数据后使缓存失效（多进程部署时包括其他进程）
+
+        Args:
+            collection_name: 集合名称
+            document_id: 文档ID，为空表示整个集合
+        """
+        if collection_name == "conversations" and document_id:
+            cls._drop_cached(document_id)
+            cls.publish_cache_change(document_id)
+        elif collection_name in ("conversations", "messages"):
+            # 无法得知受影响的会话，直接清空
+            cls._drop_cached()
+            cls.publish_cache_change()
+
+    @classmethod
+    def share_caches(
+        cls, publisher: Callable[[Dict[str, Any]], None], source: str
+    ) -> None:
+        """多进程部署：本进程的写入使其他进程的缓存失效
+
+        缓存是进程内的，写穿只更新写入所在进程的缓存。设置后写入消息、修改或
+        删除会话时都通过 publisher 广播会话ID，其他进程收到后删除对应条目
+        （on_cache_invalidated），下次读取时重新从数据库加载。
+
+        Args:
+            publisher: 广播消息的函数，会在线程池中调用，需线程安全
+            source: 本进程的标识，用于忽略自己发出的消息
+        """
+        cls.cache_publisher = publisher
+        cls.cache_source = source
+
+    @classmethod
+    def disable_caches(cls) -> None:
+        """无法在进程间广播缓存失效时（多进程但广播后端为 local）不使用缓存"""
+        for cache in (
+            cls.conversation_cache,
+            cls.recent_messages_cache,
+            cls.message_count_cache,
+        ):
+            cache.maxsize = 0
+            cache.clear()
+
+    @classmethod
+    def on_cache_invalidated(cls, message: Dict[str, Any]) -> None:
+        """处理其他进程广播的缓存失效
+
+        Args:
+            message: 包含 source 和 conversation_id（为空表示全部）的消息
+        """
+        if message.get("source") == cls.cache_source:
+            return
+        cls._drop_cached(message.get("conversation_id"))
+
+    @classmethod
+    def _drop_cached(cls, conversation_id: Optional[str] = None) -> None:
+        """删除本进程中会话的缓存条目，会话ID为空时清空"""
+        for cache in (
+            cls.conversation_cache,
+            cls.recent_messages_cache,
+            cls.message_count_cache,
+        ):
+            if conversation_id:
+                cache.delete(conversation_id)
+            else:
+                cache.clear()
+
+    @classmethod
+    def publish_cache_change(cls, conversation_id: Optional[str] = None) -> None:
+        """通知其他进程会话的缓存已失效（未调用 share_caches 时不做任何事）"""
+        if cls.cache_publisher is None:
+            return
+        try:
+            cls.cache_publisher(
+                {"source": cls.cache_source, "conversation_id": conversation_id}
+            )
+        except Exception as e:
+            # 数据已经写入，广播失败时其他进程最多在缓存有效期内读到旧数据
+            logger.error(f"广播缓存失效失败: {str(e)}")
+
+    @classmethod
+    def get_cache_stats(cls) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        return {
+            "conversations": cls.conversation_cache.stats(),
+            "recent_messages": cls.recent_messages_cache.stats(),
+            "message_counts": cls.message_count_cache.stats(),
+        }
+
+    @classmethod
+    def set_message_token_counts(
+        cls, token_counts: Dict[ObjectId, int], encoding: str
+    ) -> None:
+        """批量缓存消息的token数量
+
+        Args:
+            token_counts: 消息ID到token数量的映射
+            encoding: 计算token时使用的编码名称
+        """
+        try:
+            if not token_counts:
+                return
+            db = cls.ensure_connection()
+            db.messages.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": message_id},
+                        {"$set": {"token_count": count, "token_encoding": encoding}},
+                    )
+                    for message_id, count in token_counts.items()
+                ],
+                ordered=False,
+            )
+        except Exception as e:
+            logger.error(f"缓存消息token数量失败: {str(e)}")
             raise
 
     @classmethod
@@ -318,31 +812,85 @@ class Database:
         return serialized
 
     @classmethod
-    def get_conversations(cls, user_id: str) -> List[Dict[str, Any]]:
-        """获取用户的所有会话
+    def get_conversations(
+        cls,
+        user_id: str,
+        page_size: int = None,
+        page_token: str = None,
+        fields: Optional[List[str]] = None,
+        archived: bool = False,
+    ) -> Dict[str, Any]:
+        """分页获取用户的会话列表（按最后消息时间倒序）
+
+        分页基于 (last_message_at, _id) 键，每页是一次命中
+        user_last_message_at_id 索引的范围查询。消息数和最后一条消息摘要
+        在写入消息时维护在会话文档中，不需要再查询消息集合。
 
         Args:
             user_id: 用户ID
+            page_size: 每页会话数，默认读取配置
+            page_token: 分页标记，由上一页的 next_page_token 给出
+            fields: 返回的字段（_id 总会返回），默认为 CONVERSATION_LIST_FIELDS
+            archived: 为True时只返回已归档的会话，否则只返回未归档的会话
 
         Returns:
-            List[Dict[str, Any]]: 会话列表
+            Dict[str, Any]: conversations 和 next_page_token（没有更多时为None）
+
+        Raises:
+            ValueError: 请求了不支持的字段
         """
         try:
             db = cls.ensure_connection()
 
             if not ObjectId.is_valid(user_id):
                 logger.error(f"无效的用户ID: {user_id}")
-                return []
+                return {"conversations": [], "next_page_token": None}
 
-            # 使用同步方法获取会话列表
-            conversations = list(
-                db.conversations.find({"user_id": ObjectId(user_id)}).sort(
-                    "last_message_at", -1
+            config = SETTINGS["conversations"]
+            page_size = min(
+                max(page_size or config["page_size"], 1), config["max_page_size"]
+            )
+            fields = fields or CONVERSATION_LIST_FIELDS
+            unknown = set(fields) - set(CONVERSATION_SELECTABLE_FIELDS)
+            if unknown:
+                raise ValueError(f"不支持的字段: {', '.join(sorted(unknown))}")
+            # 分页键总是需要读取
+            projection = dict.fromkeys(fields, 1)
+            projection["last_message_at"] = 1
+
+            query = {
+                "user_id": ObjectId(user_id),
+                "archived": True if archived else {"$ne": True},
+            }
+            position = decode_page_token(page_token)
+            if position and "t" in position and "i" in position:
+                query.update(
+                    keyset_filter(
+                        "last_message_at", position["t"], position["i"], "$lt"
+                    )
                 )
+
+            conversations = list(
+                db.conversations.find(query, projection)
+                .sort([("last_message_at", -1), ("_id", -1)])
+                .limit(page_size + 1)  # 多获取一条用于判断是否还有更多
             )
 
-            # 序列化文档
-            return [cls.serialize_doc(conv) for conv in conversations]
+            next_page_token = None
+            if len(conversations) > page_size:
+                conversations = conversations[:page_size]
+                last = conversations[-1]
+                next_page_token = encode_page_token(
+                    {"t": last["last_message_at"], "i": last["_id"]}
+                )
+            if "last_message_at" not in fields:
+                for conversation in conversations:
+                    conversation.pop("last_message_at", None)
+
+            return {
+                "conversations": [cls.serialize_doc(conv) for conv in conversations],
+                "next_page_token": next_page_token,
+            }
         except Exception as e:
             logger.error(f"获取会话列表失败: {str(e)}")
             raise
@@ -358,6 +906,10 @@ class Database:
             Optional[Dict[str, Any]]: 会话信息
         """
         try:
+            cached = cls.conversation_cache.get(conversation_id)
+            if cached is not None:
+                return dict(cached)
+
             db = cls.ensure_connection()
 
             if not ObjectId.is_valid(conversation_id):
@@ -366,25 +918,64 @@ class Database:
 
             conversation = db.conversations.find_one({"_id": ObjectId(conversation_id)})
             if conversation:
-                return cls.serialize_doc(conversation)
+                conversation = cls.serialize_doc(conversation)
+                cls.conversation_cache.set(conversation_id, conversation)
+                return dict(conversation)
             return None
         except Exception as e:
             logger.error(f"获取会话详情失败: {str(e)}")
             raise
 
     @classmethod
-    def create_message(
-        cls, conversation_id: str, role: str, content: str
+    def create_conversation(
+        cls, user_id: str, title: str, system_prompt: str, model_id: str
     ) -> Dict[str, Any]:
-        """创建新的消息
+        """创建新的会话
 
         Args:
-            conversation_id: 会话ID
-            role: 消息角色
-            content: 消息内容
+            user_id: 用户ID
+            title: 会话标题
+            system_prompt: 系统提示词
+            model_id: 模型ID
 
         Returns:
-            Dict[str, Any]: 创建的消息
+            Dict[str, Any]: 创建的会话
+        """
+        try:
+            db = cls.ensure_connection()
+
+            if not ObjectId.is_valid(user_id):
+                logger.error(f"无效的用户ID: {user_id}")
+                raise ValueError("无效的用户ID")
+
+            now = datetime.utcnow()
+            conversation = {
+                "user_id": ObjectId(user_id),
+                "title": title,
+                "system_prompt": system_prompt,
+                "model_id": model_id,
+                "created_at": now,
+                "updated_at": now,
+                "last_message_at": now,
+                # 会话列表的摘要字段，写入消息时维护
+                "message_count": 0,
+                "last_message_preview": "",
+                "last_message_role": None,
+            }
+            result = db.conversations.insert_one(conversation)
+            conversation["_id"] = result.inserted_id
+            return cls.serialize_doc(conversation)
+        except Exception as e:
+            logger.error(f"创建会话失败: {str(e)}")
+            raise
+
+    @classmethod
+    def update_conversation(cls, conversation_id: str, data: Dict[str, Any]) -> None:
+        """更新会话信息
+
+        Args:
+            conversation_id: 会话ID
+            data: 更新的字段
         """
         try:
             db = cls.ensure_connection()
@@ -393,67 +984,1199 @@ class Database:
                 logger.error(f"无效的会话ID: {conversation_id}")
                 raise ValueError("无效的会话ID")
 
-            # 创建消息文档
-            message = {
-                "conversation_id": ObjectId(conversation_id),
-                "role": role,
-                "content": content,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow(),
-            }
-
-            # 插入消息
-            result = db.messages.insert_one(message)
-            message["_id"] = result.inserted_id
-
-            # 更新会话的最后消息时间
             db.conversations.update_one(
-                {"_id": ObjectId(conversation_id)},
-                {"$set": {"last_message_at": datetime.utcnow()}},
+                {"_id": ObjectId(conversation_id)}, {"$set": data}
             )
 
-            # 序列化并返回消息
-            return cls.serialize_doc(message)
+            # 写穿缓存
+            changes = cls.serialize_doc(data)
+            cls.conversation_cache.update(
+                conversation_id, lambda conversation: {**conversation, **changes}
+            )
+            cls.publish_cache_change(conversation_id)
         except Exception as e:
-            logger.error(f"创建消息失败: {str(e)}")
+            logger.error(f"更新会话失败: {str(e)}")
             raise
 
+    @staticmethod
+    def _conversation_selector(
+        user_id: str,
+        conversation_ids: Optional[List[str]] = None,
+        before: Optional[datetime] = None,
+    ) -> Dict[str, Any]:
+        """批量操作选中会话的查询条件（按会话ID列表和/或最后消息时间）"""
+        if not ObjectId.is_valid(user_id):
+            logger.error(f"无效的用户ID: {user_id}")
+            raise ValueError("无效的用户ID")
+        if conversation_ids is None and before is None:
+            raise ValueError("需要指定会话ID或时间范围")
+
+        query = {"user_id": ObjectId(user_id)}
+        if conversation_ids is not None:
+            query["_id"] = {
+                "$in": [
+                    ObjectId(conversation_id)
+                    for conversation_id in conversation_ids
+                    if ObjectId.is_valid(conversation_id)
+                ]
+            }
+        if before is not None:
+            query["last_message_at"] = {"$lt": before}
+        return query
+
     @classmethod
-    def search_messages(cls, conversation_id: str, query: str) -> List[Dict[str, Any]]:
-        """搜索会话中的消息
+    def select_conversations(
+        cls,
+        user_id: str,
+        conversation_ids: Optional[List[str]] = None,
+        before: Optional[datetime] = None,
+        archived: Optional[bool] = None,
+    ) -> List[str]:
+        """选出用户的一批会话（最多 max_bulk 个）
 
         Args:
-            conversation_id: 会话ID
-            query: 搜索关键词
+            user_id: 用户ID（只会选中该用户的会话）
+            conversation_ids: 会话ID列表
+            before: 只选最后消息时间早于该时间的会话
+            archived: 为True/False时只选已归档/未归档的会话
 
         Returns:
-            List[Dict[str, Any]]: 匹配的消息列表
+            List[str]: 会话ID列表
+
+        Raises:
+            ValueError: 用户ID无效或没有指定会话
         """
         try:
             db = cls.ensure_connection()
+            query = cls._conversation_selector(user_id, conversation_ids, before)
+            if archived is not None:
+                query["archived"] = True if archived else {"$ne": True}
+            cursor = db.conversations.find(query, {"_id": 1}).limit(
+                SETTINGS["lifecycle"]["max_bulk"]
+            )
+            return [str(conversation["_id"]) for conversation in cursor]
+        except Exception as e:
+            logger.error(f"选择会话失败: {str(e)}")
+            raise
 
-            if not ObjectId.is_valid(conversation_id):
-                logger.error(f"无效的会话ID: {conversation_id}")
-                return []
+    @classmethod
+    def delete_conversations(
+        cls,
+        user_id: str,
+        conversation_ids: Optional[List[str]] = None,
+        before: Optional[datetime] = None,
+    ) -> Dict[str, Any]:
+        """删除用户的会话（最多 max_bulk 个）及其消息和归档
+
+        待删除的消息数（会话文档中维护的 message_count）不超过
+        background_delete_threshold 时，用一次 delete_many 删除全部消息，再删除会话；
+        否则先写入 lifecycle_jobs 任务再删除会话，消息由 ConversationLifecycle
+        在后台分批删除，不会在一个请求中长时间占用数据库。
+
+        Args:
+            user_id: 用户ID（只删除该用户的会话）
+            conversation_ids: 会话ID列表
+            before: 只删除最后消息时间早于该时间的会话
 
-            if not query:
-                return []
+        Returns:
+            Dict[str, Any]: conversations（删除的会话数）、messages（已删除的消息数）
+                和 background（是否有消息转入后台删除）
 
-            # 使用正则表达式进行模糊搜索
-            regex_pattern = {"$regex": query, "$options": "i"}
-            messages = list(
-                db.messages.find(
+        Raises:
+            ValueError: 用户ID无效或没有指定会话
+        """
+        try:
+            db = cls.ensure_connection()
+            config = SETTINGS["lifecycle"]
+            query = cls._conversation_selector(user_id, conversation_ids, before)
+            conversations = list(
+                db.conversations.find(query, {"message_count": 1, "archived": 1}).limit(
+                    config["max_bulk"]
+                )
+            )
+            result = {"conversations": 0, "messages": 0, "background": False}
+            if not conversations:
+                return result
+
+            ids = [conversation["_id"] for conversation in conversations]
+            selector = {"conversation_id": {"$in": ids}}
+            # 已归档会话的消息在归档块中；升级前的会话没有 message_count，按大会话处理
+            threshold = config["background_delete_threshold"]
+            pending = sum(
+                (
+                    0
+                    if conversation.get("archived")
+                    else conversation.get("message_count", threshold + 1)
+                )
+                for conversation in conversations
+            )
+            if pending > threshold:
+                db.lifecycle_jobs.insert_one(
                     {
-                        "conversation_id": ObjectId(conversation_id),
-                        "content": regex_pattern,
+                        "type": "delete_messages",
+                        "conversation_ids": ids,
+                        "created_at": utc_now(),
                     }
-                ).sort("created_at", -1)
+                )
+                result["background"] = True
+            else:
+                # 先删消息和归档再删会话，中途失败时会话仍在，可以重新删除
+                result["messages"] = db.messages.delete_many(selector).deleted_count
+                db.message_archives.delete_many(selector)
+            result["conversations"] = db.conversations.delete_many(
+                {"_id": {"$in": ids}}
+            ).deleted_count
+
+            for conversation_id in ids:
+                cls.invalidate_cache("conversations", str(conversation_id))
+            return result
+        except Exception as e:
+            logger.error(f"删除会话失败: {str(e)}")
+            raise
+
+    @classmethod
+    def claim_lifecycle_job(cls, lease: float) -> Optional[Dict[str, Any]]:
+        """领取最早的一个后台任务
+
+        领取时设置租约，到期前其他工作进程不会再领取；执行中的进程退出后
+        任务在租约到期后被重新领取（任务本身可以重复执行）。
+
+        Args:
+            lease: 租约时长（秒）
+
+        Returns:
+            Optional[Dict[str, Any]]: 任务文档，没有可领取的任务时为None
+        """
+        try:
+            db = cls.ensure_connection()
+            now = utc_now()
+            return db.lifecycle_jobs.find_one_and_update(
+                {
+                    "$or": [
+                        {"leased_until": {"$exists": False}},
+                        {"leased_until": {"$lt": now}},
+                    ]
+                },
+                {
+                    "$set": {"leased_until": now + timedelta(seconds=lease)},
+                    "$inc": {"attempts": 1},
+                },
+                sort=[("created_at", 1)],
+                return_document=ReturnDocument.AFTER,
             )
+        except Exception as e:
+            logger.error(f"领取后台任务失败: {str(e)}")
+            raise
+
+    @classmethod
+    def delete_message_batch(
+        cls,
+        job_id: ObjectId,
+        conversation_ids: List[ObjectId],
+        batch_size: int,
+        lease: float,
+    ) -> int:
+        """删除任务中会话的一批消息，并续期任务的租约
 
-            # 序列化消息
-            return [cls.serialize_doc(msg) for msg in messages]
+        Args:
+            job_id: 任务ID
+            conversation_ids: 已删除的会话ID
+            batch_size: 本批最多删除的消息数
+            lease: 续期的租约时长（秒）
+
+        Returns:
+            int: 删除的消息数，小于 batch_size 时表示已删完
+        """
+        try:
+            db = cls.ensure_connection()
+            message_ids = [
+                message["_id"]
+                for message in db.messages.find(
+                    {"conversation_id": {"$in": conversation_ids}}, {"_id": 1}
+                ).limit(batch_size)
+            ]
+            deleted = 0
+            if message_ids:
+                deleted = db.messages.delete_many(
+                    {"_id": {"$in": message_ids}}
+                ).deleted_count
+            db.lifecycle_jobs.update_one(
+                {"_id": job_id},
+                {"$set": {"leased_until": utc_now() + timedelta(seconds=lease)}},
+            )
+            return deleted
         except Exception as e:
-            logger.error(f"搜索消息失败: {str(e)}")
+            logger.error(f"分批删除消息失败: {str(e)}")
+            raise
+
+    @classmethod
+    def finish_lifecycle_job(
+        cls, job_id: ObjectId, conversation_ids: List[ObjectId]
+    ) -> None:
+        """删除任务中会话的归档，然后删除任务
+
+        Args:
+            job_id: 任务ID
+            conversation_ids: 已删除的会话ID
+        """
+        try:
+            db = cls.ensure_connection()
+            db.message_archives.delete_many(
+                {"conversation_id": {"$in": conversation_ids}}
+            )
+            db.lifecycle_jobs.delete_one({"_id": job_id})
+        except Exception as e:
+            logger.error(f"完成后台任务失败: {str(e)}")
+            raise
+
+    @classmethod
+    def find_idle_conversations(cls, before: datetime, limit: int) -> List[str]:
+        """最后消息时间早于 before 且未归档的会话（最旧的在前）
+
+        Args:
+            before: 最后消息时间上限
+            limit: 最多返回的会话数
+
+        Returns:
+            List[str]: 会话ID列表
+        """
+        try:
+            db = cls.ensure_connection()
+            cursor = (
+                db.conversations.find(
+                    {"archived": {"$ne": True}, "last_message_at": {"$lt": before}},
+                    {"_id": 1},
+                )
+                .sort("last_message_at", 1)
+                .limit(limit)
+            )
+            return [str(conversation["_id"]) for conversation in cursor]
+        except Exception as e:
+            logger.error(f"查找闲置会话失败: {str(e)}")
+            raise
+
+    @classmethod
+    def archive_conversation(cls, conversation_id: str) -> Optional[Dict[str, int]]:
+        """把会话的消息压缩归档到 message_archives 集合
+
+        消息按时间顺序分块，每块是依次拼接的 BSON 文档（不含 search_tokens，
+        恢复时重新生成）经 zlib 压缩后存为一个文档，以 (conversation_id, seq) 为键。
+        先用一次 findAndModify 把会话标记为已归档并领取租约，自动归档和批量归档
+        并发处理同一会话时只有一个进程执行；之后逐块写入归档并删除块中的消息。
+        归档块用 insert_one 写入，(conversation_id, seq) 唯一索引拒绝重复的块，
+        写入失败时块中的消息不会被删除。
+
+        Args:
+            conversation_id: 会话ID
+
+        Returns:
+            Optional[Dict[str, int]]: messages、chunks、raw_bytes（压缩前）和
+                stored_bytes（压缩后）；会话已归档或正被其他进程处理时返回None
+        """
+        try:
+            db = cls.ensure_connection()
+
+            if not ObjectId.is_valid(conversation_id):
+                logger.error(f"无效的会话ID: {conversation_id}")
+                raise ValueError("无效的会话ID")
+
+            object_id = ObjectId(conversation_id)
+            lease = cls._claim_conversation(
+                db,
+                object_id,
+                {"archived": {"$ne": True}},
+                {"archived": True, "archived_at": utc_now()},
+            )
+            if lease is None:
+                return None
+            cls.invalidate_cache("conversations", conversation_id)
+
+            try:
+                last = db.message_archives.find_one(
+                    {"conversation_id": object_id}, {"seq": 1}, sort=[("seq", -1)]
+                )
+                seq = last["seq"] + 1 if last else 0
+                result = {
+                    "messages": 0,
+                    "chunks": 0,
+                    "raw_bytes": 0,
+                    "stored_bytes": 0,
+                }
+                chunk_bytes = SETTINGS["lifecycle"]["archive_chunk_bytes"]
+
+                chunk, size = [], 0
+                cursor = (
+                    db.messages.find({"conversation_id": object_id}, MESSAGE_PROJECTION)
+                    .sort([("created_at", 1), ("_id", 1)])
+                    .batch_size(1000)
+                )
+                for message in cursor:
+                    encoded = bson.encode(message)
+                    if chunk and size + len(encoded) > chunk_bytes:
+                        lease = cls._renew_lease(db, object_id, lease)
+                        cls._write_archive_chunk(db, object_id, seq, chunk, result)
+                        seq += 1
+                        chunk, size = [], 0
+                    chunk.append((message, encoded))
+                    size += len(encoded)
+                if chunk:
+                    lease = cls._renew_lease(db, object_id, lease)
+                    cls._write_archive_chunk(db, object_id, seq, chunk, result)
+            finally:
+                cls._release_lease(db, object_id, lease)
+            return result
+        except Exception as e:
+            logger.error(f"归档会话失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def _write_archive_chunk(
+        db,
+        conversation_id: ObjectId,
+        seq: int,
+        chunk: List[Tuple[Dict[str, Any], bytes]],
+        result: Dict[str, int],
+    ) -> None:
+        """写入一个归档块并删除其中的消息
+
+        Raises:
+            DuplicateKeyError: 该 seq 的归档块已存在，消息不会被删除
+        """
+        raw = b"".join(encoded for _, encoded in chunk)
+        data = zlib.compress(raw, SETTINGS["lifecycle"]["compression_level"])
+        db.message_archives.insert_one(
+            {
+                "conversation_id": conversation_id,
+                "seq": seq,
+                "codec": ARCHIVE_CODEC,
+                "count": len(chunk),
+                "first_created_at": chunk[0][0]["created_at"],
+                "last_created_at": chunk[-1][0]["created_at"],
+                "raw_bytes": len(raw),
+                "data": Binary(data),
+                "created_at": utc_now(),
+            }
+        )
+        db.messages.delete_many(
+            {"_id": {"$in": [message["_id"] for message, _ in chunk]}}
+        )
+        result["messages"] += len(chunk)
+        result["chunks"] += 1
+        result["raw_bytes"] += len(raw)
+        result["stored_bytes"] += len(data)
+
+    @staticmethod
+    def _claim_conversation(
+        db,
+        conversation_id: ObjectId,
+        condition: Dict[str, Any],
+        update: Dict[str, Any] = None,
+    ) -> Optional[datetime]:
+        """领取会话的归档/恢复租约
+
+        Args:
+            db: pymongo Database
+            conversation_id: 会话ID
+            condition: 会话需满足的条件（如未归档）
+            update: 领取租约时同时设置的字段
+
+        Returns:
+            Optional[datetime]: 租约到期时间，会话不满足条件或租约被其他进程持有时为None
+        """
+        now = utc_now()
+        lease = now + timedelta(seconds=SETTINGS["lifecycle"]["archive_lease"])
+        claimed = db.conversations.find_one_and_update(
+            {
+                "_id": conversation_id,
+                **condition,
+                "$or": [
+                    {"lifecycle_lease": {"$exists": False}},
+                    {"lifecycle_lease": {"$lt": now}},
+                ],
+            },
+            {"$set": {**(update or {}), "lifecycle_lease": lease}},
+            {"_id": 1},
+        )
+        return lease if claimed else None
+
+    @staticmethod
+    def _renew_lease(db, conversation_id: ObjectId, lease: datetime) -> datetime:
+        """续期租约，返回新的到期时间
+
+        Raises:
+            RuntimeError: 租约已过期并被其他进程领取
+        """
+        renewed = utc_now() + timedelta(seconds=SETTINGS["lifecycle"]["archive_lease"])
+        result = db.conversations.update_one(
+            {"_id": conversation_id, "lifecycle_lease": lease},
+            {"$set": {"lifecycle_lease": renewed}},
+        )
+        if not result.matched_count:
+            raise RuntimeError(f"会话 {conversation_id} 的归档租约已失效")
+        return renewed
+
+    @staticmethod
+    def _release_lease(
+        db, conversation_id: ObjectId, lease: datetime, unset: Tuple[str, ...] = ()
+    ) -> bool:
+        """释放租约（只在仍由自己持有时），可同时删除其他字段
+
+        Returns:
+            bool: 租约是否仍由自己持有
+        """
+        result = db.conversations.update_one(
+            {"_id": conversation_id, "lifecycle_lease": lease},
+            {"$unset": dict.fromkeys(("lifecycle_lease",) + unset, "")},
+        )
+        return result.matched_count > 0
+
+    @classmethod
+    def restore_conversation(cls, conversation_id: str) -> Optional[int]:
+        """把归档的消息恢复到 messages 集合并取消会话的归档标记
+
+        先领取会话的租约，同一会话同时只有一个进程恢复，消息不会被重复插入；
+        之后按顺序逐块解压、重新生成搜索索引词后批量插入，插入后删除该块。
+        重复的 _id 会被忽略，中途失败后可以重新恢复。
+
+        Args:
+            conversation_id: 会话ID
+
+        Returns:
+            Optional[int]: 恢复的消息数，会话未归档时为0；
+                其他进程正在归档或恢复该会话时返回None
+        """
+        try:
+            db = cls.ensure_connection()
+
+            if not ObjectId.is_valid(conversation_id):
+                logger.error(f"无效的会话ID: {conversation_id}")
+                raise ValueError("无效的会话ID")
+
+            object_id = ObjectId(conversation_id)
+            lease = cls._claim_conversation(db, object_id, {"archived": True})
+            if lease is None:
+                conversation = db.conversations.find_one(
+                    {"_id": object_id}, {"archived": 1}
+                )
+                return None if conversation and conversation.get("archived") else 0
+
+            restored = 0
+            try:
+                for archive in db.message_archives.find(
+                    {"conversation_id": object_id}
+                ).sort("seq", 1):
+                    lease = cls._renew_lease(db, object_id, lease)
+                    messages = cls.decode_archive(archive)
+                    for message in messages:
+                        message["search_tokens"] = index_tokens(
+                            message.get("content") or ""
+                        )
+                    if messages:
+                        cls._insert_messages(db, messages)
+                    db.message_archives.delete_one({"_id": archive["_id"]})
+                    restored += len(messages)
+            except Exception:
+                cls._release_lease(db, object_id, lease)
+                raise
+
+            if not cls._release_lease(
+                db, object_id, lease, ("archived", "archived_at")
+            ):
+                raise RuntimeError(f"会话 {conversation_id} 的归档租约已失效")
+            cls.invalidate_cache("conversations", conversation_id)
+            return restored
+        except Exception as e:
+            logger.error(f"恢复会话失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def decode_archive(archive: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """解压一个归档块，返回其中按时间顺序排列的消息"""
+        return bson.decode_all(zlib.decompress(archive["data"]))
+
+    @classmethod
+    def export_conversations_cursor(
+        cls, user_id: str, conversation_id: str = None, batch_size: int = None
+    ):
+        """导出用的会话游标（按 _id 顺序，不包含 user_id 和归档租约）
+
+        只创建游标，第一次取数据时才查询，可以在 IOLoop 线程中调用；
+        数据用 fetch_batch 在线程池中分批读取。
+
+        Args:
+            user_id: 用户ID
+            conversation_id: 只导出该会话，为空表示用户的全部会话
+            batch_size: 每次从服务器读取的文档数
+
+        Returns:
+            Cursor: pymongo 游标
+        """
+        db = cls.ensure_connection()
+        if not ObjectId.is_valid(user_id):
+            raise ValueError("无效的用户ID")
+        query = {"user_id": ObjectId(user_id)}
+        if conversation_id is not None:
+            if not ObjectId.is_valid(conversation_id):
+                raise ValueError("无效的会话ID")
+            query["_id"] = ObjectId(conversation_id)
+        batch_size = batch_size or SETTINGS["export"]["batch_size"]
+        return (
+            db.conversations.find(query, {"user_id": 0, "lifecycle_lease": 0})
+            .sort("_id", 1)
+            .batch_size(batch_size)
+        )
+
+    @classmethod
+    def export_messages_cursor(
+        cls, conversation_id: ObjectId, archived: bool = False, batch_size: int = None
+    ):
+        """导出用的消息游标，按时间顺序（同 export_conversations_cursor，只创建游标）
+
+        Args:
+            conversation_id: 会话ID
+            archived: 会话已归档时按时间顺序逐块解压归档块，并合并仍在 messages
+                集合中的消息（同 _iter_archived_messages）
+            batch_size: 每次从服务器读取的文档数
+
+        Returns:
+            Iterator[Dict[str, Any]]: pymongo 游标或归档消息的迭代器，
+                用 fetch_batch 读取、close_cursor 关闭
+        """
+        db = cls.ensure_connection()
+        if archived:
+            return cls._iter_archived_messages(db, conversation_id, True)
+        batch_size = batch_size or SETTINGS["export"]["batch_size"]
+        return (
+            db.messages.find({"conversation_id": conversation_id}, MESSAGE_PROJECTION)
+            .sort([("created_at", 1), ("_id", 1)])
+            .batch_size(batch_size)
+        )
+
+    @classmethod
+    def fetch_batch(cls, cursor, size: int) -> List[Dict[str, Any]]:
+        """从游标中读取最多 size 个文档，读完时返回空列表
+
+        同一个游标的各批可以在线程池的不同线程中依次读取（不能并发）。
+        """
+        try:
+            return list(islice(cursor, size))
+        except Exception as e:
+            logger.error(f"读取游标失败: {str(e)}")
+            raise
+
+    @classmethod
+    def close_cursor(cls, cursor) -> None:
+        """关闭游标或迭代器，释放服务器端的游标（导出中途断开时调用）"""
+        cursor.close()
+
+    @classmethod
+    def import_documents(
+        cls, conversations: List[Dict[str, Any]], messages: List[Dict[str, Any]]
+    ) -> None:
+        """批量写入导入的会话和消息（已生成新的 _id）
+
+        Args:
+            conversations: 会话文档
+            messages: 消息文档，包含搜索索引词
+        """
+        try:
+            db = cls.ensure_connection()
+            if conversations:
+                db.conversations.insert_many(conversations, ordered=False)
+            if messages:
+                cls._insert_messages(db, messages)
+        except Exception as e:
+            logger.error(f"导入会话失败: {str(e)}")
+            raise
+
+    @classmethod
+    def set_message_counts(cls, counts: Dict[ObjectId, int]) -> None:
+        """导入完成后写入各会话的消息数
+
+        Args:
+            counts: 会话ID -> 消息数
+        """
+        try:
+            if not counts:
+                return
+            db = cls.ensure_connection()
+            db.conversations.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": conversation_id}, {"$set": {"message_count": count}}
+                    )
+                    for conversation_id, count in counts.items()
+                ],
+                ordered=False,
+            )
+        except Exception as e:
+            logger.error(f"写入会话消息数失败: {str(e)}")
+            raise
+
+    @classmethod
+    def build_message(
+        cls, conversation_id: str, role: str, content: str
+    ) -> Dict[str, Any]:
+        """构造待插入的消息文档（在客户端生成 _id，可用于批量写入）
+
+        Args:
+            conversation_id: 会话ID
+            role: 消息角色
+            content: 消息内容
+
+        Returns:
+            Dict[str, Any]: 消息文档，包含搜索索引词
+        """
+        if not ObjectId.is_valid(conversation_id):
+            logger.error(f"无效的会话ID: {conversation_id}")
+            raise ValueError("无效的会话ID")
+
+        now = utc_now()
+        return {
+            "_id": ObjectId(),
+            "conversation_id": ObjectId(conversation_id),
+            "role": role,
+            "content": content,
+            "created_at": now,
+            "updated_at": now,
+            "search_tokens": index_tokens(content),
+        }
+
+    @classmethod
+    def create_message(
+        cls, conversation_id: str, role: str, content: str
+    ) -> Dict[str, Any]:
+        """创建新的消息
+
+        Args:
+            conversation_id: 会话ID
+            role: 消息角色
+            content: 消息内容
+
+        Returns:
+            Dict[str, Any]: 创建的消息
+        """
+        try:
+            db = cls.ensure_connection()
+
+            # 插入消息
+            message = cls.build_message(conversation_id, role, content)
+            db.messages.insert_one(message)
+
+            # 更新会话的最后消息时间和摘要字段
+            last_message_at = utc_now()
+            db.conversations.update_one(
+                {"_id": ObjectId(conversation_id)},
+                {
+                    "$set": {
+                        "last_message_at": last_message_at,
+                        "last_message_preview": message_preview(content),
+                        "last_message_role": role,
+                    },
+                    "$inc": {"message_count": 1},
+                },
+            )
+
+            cls.cache_new_message(conversation_id, message, last_message_at)
+            cls.publish_cache_change(conversation_id)
+            return cls.serialize_message(message)
+        except Exception as e:
+            logger.error(f"创建消息失败: {str(e)}")
+            raise
+
+    @classmethod
+    def write_messages(
+        cls,
+        messages: List[Dict[str, Any]],
+        last_message_at: Dict[str, datetime],
+    ) -> None:
+        """批量写入消息并更新各会话的最后消息时间和摘要字段
+
+        消息用 insert_many 一次写入（重试时已写入的 _id 重复会被忽略），
+        每个会话只产生一条更新：累加消息数，只有该批次的最后一条消息比会话中
+        记录的更新时才覆盖最后消息时间和摘要（更新管道中比较，并发写入不会回退）。
+
+        Args:
+            messages: build_message 构造的消息文档
+            last_message_at: 会话ID -> 该批次中最后一条消息的时间
+        """
+        try:
+            db = cls.ensure_connection()
+            if messages:
+                cls._insert_messages(db, messages)
+            if last_message_at:
+                # 每个会话在该批次中的消息数和最后一条消息
+                counts, latest = {}, {}
+                for message in messages:
+                    conversation_id = str(message["conversation_id"])
+                    counts[conversation_id] = counts.get(conversation_id, 0) + 1
+                    current = latest.get(conversation_id)
+                    if (
+                        current is None
+                        or message["created_at"] >= current["created_at"]
+                    ):
+                        latest[conversation_id] = message
+                db.conversations.bulk_write(
+                    [
+                        UpdateOne(
+                            {"_id": ObjectId(conversation_id)},
+                            cls._summary_update(
+                                timestamp,
+                                counts.get(conversation_id, 0),
+                                latest.get(conversation_id),
+                            ),
+                        )
+                        for conversation_id, timestamp in last_message_at.items()
+                    ],
+                    ordered=False,
+                )
+        except Exception as e:
+            logger.error(f"批量写入消息失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def _insert_messages(db, messages: List[Dict[str, Any]]) -> None:
+        """批量插入消息，忽略重复的 _id（重试时上一次写入已经成功）"""
+        try:
+            db.messages.insert_many(messages, ordered=False)
+        except BulkWriteError as e:
+            # 11000: 重复的 _id
+            errors = [
+                error
+                for error in e.details.get("writeErrors", [])
+                if error.get("code") != 11000
+            ]
+            if errors or e.details.get("writeConcernErrors"):
+                raise
+
+    @staticmethod
+    def _summary_update(
+        timestamp: datetime, count: int, message: Optional[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """会话摘要字段的更新管道"""
+        newer = {"$gte": [timestamp, {"$ifNull": ["$last_message_at", timestamp]}]}
+        fields = {
+            "message_count": {"$add": [{"$ifNull": ["$message_count", 0]}, count]},
+            "last_message_at": {"$max": ["$last_message_at", timestamp]},
+        }
+        if message is not None:
+            fields["last_message_preview"] = {
+                "$cond": [
+                    newer,
+                    {"$literal": message_preview(message.get("content"))},
+                    "$last_message_preview",
+                ]
+            }
+            fields["last_message_role"] = {
+                "$cond": [newer, {"$literal": message["role"]}, "$last_message_role"]
+            }
+        return [{"$set": fields}]
+
+    @classmethod
+    def cache_new_message(
+        cls, conversation_id: str, message: Dict[str, Any], last_message_at: datetime
+    ) -> None:
+        """新消息写穿缓存：会话最后消息时间和摘要字段、最近消息和消息数
+
+        只更新本进程的缓存，消息写入数据库后由调用方 publish_cache_change
+        """
+        cls.conversation_cache.update(
+            conversation_id,
+            lambda conversation: {
+                **conversation,
+                "last_message_at": last_message_at.isoformat(),
+                "message_count": conversation.get("message_count", 0) + 1,
+                "last_message_preview": message_preview(message.get("content")),
+                "last_message_role": message["role"],
+            },
+        )
+        cached_message = {
+            key: value for key, value in message.items() if key in CONTEXT_FIELDS
+        }
+        cached_message["_id"] = message["_id"]
+        limit = SETTINGS["cache"]["recent_messages"]
+        cls.recent_messages_cache.update(
+            conversation_id,
+            lambda messages: ([cached_message] + messages)[:limit],
+        )
+        cls.message_count_cache.update(conversation_id, lambda count: count + 1)
+
+    @classmethod
+    def serialize_message(cls, message: Dict[str, Any]) -> Dict[str, Any]:
+        """序列化返回给前端的消息（不包含搜索索引词）"""
+        return cls.serialize_doc(
+            {key: value for key, value in message.items() if key != "search_tokens"}
+        )
+
+    @classmethod
+    def search_messages(
+        cls,
+        conversation_id: str,
+        query: str,
+        page_size: int = None,
+        page_token: str = None,
+        archived: bool = False,
+    ) -> Dict[str, Any]:
+        """搜索会话中的消息
+
+        Args:
+            conversation_id: 会话ID
+            query: 搜索关键词
+            page_size: 每页数量
+            page_token: 分页标记
+            archived: 会话已归档，在归档块中搜索（不恢复）
+
+        Returns:
+            Dict[str, Any]: 按相关度排序的消息（带摘要和高亮位置）及下一页标记
+        """
+        try:
+            if not ObjectId.is_valid(conversation_id):
+                logger.error(f"无效的会话ID: {conversation_id}")
+                return {"messages": [], "next_page_token": None}
+
+            return cls._search(
+                {"conversation_id": ObjectId(conversation_id)},
+                query,
+                page_size,
+                page_token,
+                archived,
+            )
+        except Exception as e:
+            logger.error(f"搜索消息失败: {str(e)}")
+            raise
+
+    @classmethod
+    def search_user_messages(
+        cls,
+        user_id: str,
+        query: str,
+        page_size: int = None,
+        page_token: str = None,
+    ) -> Dict[str, Any]:
+        """在用户的所有会话中搜索消息
+
+        Args:
+            user_id: 用户ID
+            query: 搜索关键词
+            page_size: 每页数量
+            page_token: 分页标记
+
+        Returns:
+            Dict[str, Any]: 按相关度排序的消息（带会话标题、摘要和高亮位置）
+                及下一页标记
+        """
+        try:
+            db = cls.ensure_connection()
+
+            if not ObjectId.is_valid(user_id):
+                logger.error(f"无效的用户ID: {user_id}")
+                return {"messages": [], "next_page_token": None}
+
+            titles = {
+                conversation["_id"]: conversation.get("title")
+                for conversation in db.conversations.find(
+                    {"user_id": ObjectId(user_id)}, {"title": 1}
+                )
+            }
+            result = cls._search(
+                {"conversation_id": {"$in": list(titles)}},
+                query,
+                page_size,
+                page_token,
+            )
+            for message in result["messages"]:
+                message["conversation_title"] = titles.get(
+                    ObjectId(message["conversation_id"])
+                )
+            return result
+        except Exception as e:
+            logger.error(f"搜索用户消息失败: {str(e)}")
+            raise
+
+    @classmethod
+    def _search(
+        cls,
+        scope: Dict[str, Any],
+        query: str,
+        page_size: int = None,
+        page_token: str = None,
+        archived: bool = False,
+    ) -> Dict[str, Any]:
+        """按索引词查找消息并按相关度排序分页
+
+        所有查询词都需出现在消息的 search_tokens 中（走多键索引，不使用正则）。
+        候选集取最新的 max_candidates 条匹配消息，计分排序后按偏移分页；
+        分页标记记录首次查询时最新候选的位置，翻页时新消息不会打乱顺序。
+        已归档会话的消息没有 search_tokens，从新到旧解压归档块并即时生成索引词匹配。
+
+        Args:
+            scope: 限定范围的查询条件（会话或会话列表）
+            query: 搜索关键词
+            page_size: 每页数量
+            page_token: 分页标记
+            archived: scope 是一个已归档的会话
+        """
+        db = cls.ensure_connection()
+        search_config = SETTINGS["search"]
+        page_size = min(
+            page_size or search_config["page_size"], search_config["max_page_size"]
+        )
+
+        tokens = query_tokens(query)
+        if not tokens:
+            return {"messages": [], "next_page_token": None}
+
+        position = decode_page_token(page_token) or {}
+        if archived:
+            matches = (
+                message
+                for message in cls._iter_archived_messages(
+                    db,
+                    scope["conversation_id"],
+                    False,
+                    (position["t"], position["i"]) if "t" in position else None,
+                    inclusive=True,
+                )
+                if set(tokens) <= set(index_tokens(message.get("content") or ""))
+            )
+            candidates = list(islice(matches, search_config["max_candidates"]))
+        else:
+            filter_ = {**scope, "search_tokens": {"$all": tokens}}
+            if "t" in position and "i" in position:
+                # 包含首次查询时最新的候选本身
+                filter_.update(
+                    keyset_filter(
+                        "created_at", position["t"], position["i"], "$lt", "$lte"
+                    )
+                )
+            candidates = list(
+                db.messages.find(filter_, MESSAGE_PROJECTION)
+                .sort([("created_at", -1), ("_id", -1)])
+                .limit(search_config["max_candidates"])
+            )
+        if not candidates:
+            return {"messages": [], "next_page_token": None}
+
+        ranked = sorted(
+            candidates,
+            key=lambda message: (
+                score(message["content"], query),
+                message["created_at"],
+                message["_id"],
+            ),
+            reverse=True,
+        )
+
+        offset = position.get("o", 0)
+        page = ranked[offset : offset + page_size]
+        messages = []
+        for message in page:
+            serialized = cls.serialize_doc(message)
+            serialized.update(highlight(message["content"], query))
+            messages.append(serialized)
+
+        next_page_token = None
+        if offset + page_size < len(ranked):
+            newest = candidates[0]
+            next_page_token = encode_page_token(
+                {
+                    "o": offset + page_size,
+                    "t": position.get("t", newest["created_at"]),
+                    "i": position.get("i", newest["_id"]),
+                }
+            )
+
+        return {
+            "messages": messages,
+            "next_page_token": next_page_token,
+            # 匹配数超过候选上限时，更早的匹配消息不参与排序
+            "truncated": len(candidates) >= search_config["max_candidates"],
+        }
+
+    @classmethod
+    def rollup_usage(cls, rows: List[Dict[str, Any]]) -> None:
+        """把内存中累加的用量汇总到 usage 集合
+
+        每行对应一个（小时, 用户, 会话, 模型），计数字段用 $inc 累加，
+        最大值字段用 $max，一次 bulk_write 写入。
+
+        Args:
+            rows: UsageTracker 生成的汇总行
+        """
+        try:
+            db = cls.ensure_connection()
+            operations = []
+            for row in rows:
+                key = {
+                    "hour": row["hour"],
+                    "user_id": row["user_id"],
+                    "conversation_id": row["conversation_id"],
+                    "model": row["model"],
+                }
+                increments = {
+                    field: value
+                    for field, value in row.items()
+                    if field not in key
+                    and field not in ("ttft_max", "duration_max", "statuses")
+                }
+                for code, count in row["statuses"].items():
+                    increments[f"statuses.{code}"] = count
+                operations.append(
+                    UpdateOne(
+                        key,
+                        {
+                            "$inc": increments,
+                            "$max": {
+                                "ttft_max": row["ttft_max"],
+                                "duration_max": row["duration_max"],
+                            },
+                        },
+                        upsert=True,
+                    )
+                )
+            if operations:
+                db.usage.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"汇总用量失败: {str(e)}")
+            raise
+
+    @classmethod
+    def get_usage_summary(
+        cls,
+        group_by: str,
+        since: datetime,
+        user_id: str = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """按用户、模型或会话汇总用量
+
+        Args:
+            group_by: 分组字段（user_id、model 或 conversation_id）
+            since: 起始时间
+            user_id: 只统计该用户
+            limit: 最多返回的分组数
+
+        Returns:
+            List[Dict[str, Any]]: 按总 token 数倒序的各分组用量
+        """
+        try:
+            db = cls.ensure_connection()
+            match = {"hour": {"$gte": since}}
+            if user_id:
+                match["user_id"] = user_id
+
+            fields = (
+                "requests",
+                "errors",
+                "cancelled",
+                "cached",
+                "estimated",
+                "prompt_tokens",
+                "completion_tokens",
+                "ttft_total",
+                "ttft_count",
+                "duration_total",
+            )
+            group = {"_id": f"${group_by}"}
+            group.update({field: {"$sum": f"${field}"} for field in fields})
+            group["ttft_max"] = {"$max": "$ttft_max"}
+            group["duration_max"] = {"$max": "$duration_max"}
+            group["last_hour"] = {"$max": "$hour"}
+
+            rows = list(
+                db.usage.aggregate(
+                    [
+                        {"$match": match},
+                        {"$group": group},
+                        {
+                            "$addFields": {
+                                "total_tokens": {
+                                    "$add": ["$prompt_tokens", "$completion_tokens"]
+                                }
+                            }
+                        },
+                        {"$sort": {"total_tokens": -1, "_id": 1}},
+                        {"$limit": limit},
+                    ]
+                )
+            )
+
+            usernames = {}
+            if group_by == "user_id":
+                user_ids = [
+                    ObjectId(row["_id"])
+                    for row in rows
+                    if ObjectId.is_valid(row["_id"])
+                ]
+                usernames = {
+                    str(user["_id"]): user["username"]
+                    for user in db.users.find(
+                        {"_id": {"$in": user_ids}}, {"username": 1}
+                    )
+                }
+
+            summary = []
+            for row in rows:
+                key = row.pop("_id")
+                ttft_total = row.pop("ttft_total")
+                ttft_count = row.pop("ttft_count")
+                duration_total = row.pop("duration_total")
+                summary.append(
+                    {
+                        group_by: key,
+                        **row,
+                        "avg_ttft": (ttft_total / ttft_count if ttft_count else None),
+                        "avg_duration": (
+                            duration_total / row["requests"]
+                            if row["requests"]
+                            else None
+                        ),
+                        **(
+                            {"username": usernames.get(key)}
+                            if group_by == "user_id"
+                            else {}
+                        ),
+                    }
+                )
+            return summary
+        except Exception as e:
+            logger.error(f"获取用量汇总失败: {str(e)}")
+            raise
+
+    @classmethod
+    def get_cached_response(cls, key: str) -> Optional[Dict[str, Any]]:
+        """查询回答缓存
+
+        Args:
+            key: 缓存键（ResponseCache.make_key）
+
+        Returns:
+            Optional[Dict[str, Any]]: 包含 content 和 model 的缓存条目，
+            不存在或已过期（TTL 索引尚未删除）时返回None
+        """
+        try:
+            db = cls.ensure_connection()
+            return db.response_cache.find_one(
+                {"_id": key, "expires_at": {"$gt": utc_now()}},
+                {"_id": 0, "content": 1, "model": 1},
+            )
+        except Exception as e:
+            logger.error(f"查询回答缓存失败: {str(e)}")
+            raise
+
+    @classmethod
+    def set_cached_response(cls, key: str, document: Dict[str, Any]) -> None:
+        """写入回答缓存（同一个键覆盖旧条目）
+
+        Args:
+            key: 缓存键
+            document: 缓存条目（content、model、created_at、expires_at）
+        """
+        try:
+            db = cls.ensure_connection()
+            db.response_cache.replace_one({"_id": key}, document, upsert=True)
+        except Exception as e:
+            logger.error(f"写入回答缓存失败: {str(e)}")
             raise
 
     @classmethod
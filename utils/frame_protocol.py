@@ -0,0 +1,127 @@
+import json
+from typing import Any, Dict, Optional, Union
+
+try:
+    import msgpack
+except ImportError:  # msgpack 为可选依赖
+    msgpack = None
+
+# 默认协议：完整字段名的 JSON 文本帧
+JSON_PROTOCOL = None
+# 短字段名的 JSON 文本帧
+COMPACT_PROTOCOL = "chat.compact.v1"
+# 短字段名的 msgpack 二进制帧（需要安装 msgpack）
+MSGPACK_PROTOCOL = "chat.msgpack.v1"
+
+# 短字段名映射，只作用于最外层字段；嵌套的消息文档保持原样
+SHORT_KEYS = {
+    "type": "t",
+    "content": "c",
+    "message": "m",
+    "error": "e",
+    "generation_id": "g",
+    "seq": "q",
+    "last_seq": "lq",
+    "flush_ms": "fm",
+    "flush_bytes": "fb",
+    "retry_after": "ra",
+}
+SHORT_TYPES = {
+    "stream": "s",
+    "done": "d",
+    "user": "u",
+    "error": "x",
+    "config": "cfg",
+    "cancel": "cc",
+    "cancelled": "cd",
+    "resume": "rs",
+    "resumed": "rd",
+    "queued": "qd",
+}
+
+
+class FrameError(ValueError):
+    """客户端发来的帧无法解析"""
+
+
+_LONG_KEYS = {short: key for key, short in SHORT_KEYS.items()}
+_LONG_TYPES = {short: key for key, short in SHORT_TYPES.items()}
+
+
+def supported_protocols():
+    """服务端支持的子协议，按优先级排列"""
+    protocols = [COMPACT_PROTOCOL]
+    if msgpack is not None:
+        protocols.insert(0, MSGPACK_PROTOCOL)
+    return protocols
+
+
+def select_protocol(requested) -> Optional[str]:
+    """从客户端请求的子协议中按客户端给出的顺序选择第一个支持的
+
+    Args:
+        requested: 客户端在 Sec-WebSocket-Protocol 中列出的子协议
+
+    Returns:
+        Optional[str]: 选中的子协议，都不支持时返回None（使用默认JSON）
+    """
+    supported = supported_protocols()
+    for protocol in requested:
+        if protocol in supported:
+            return protocol
+    return None
+
+
+def _shorten(message: Dict[str, Any]) -> Dict[str, Any]:
+    compact = {SHORT_KEYS.get(key, key): value for key, value in message.items()}
+    if "t" in compact:
+        compact["t"] = SHORT_TYPES.get(compact["t"], compact["t"])
+    return compact
+
+
+def _expand(message: Dict[str, Any]) -> Dict[str, Any]:
+    expanded = {_LONG_KEYS.get(key, key): value for key, value in message.items()}
+    if "type" in expanded:
+        expanded["type"] = _LONG_TYPES.get(expanded["type"], expanded["type"])
+    return expanded
+
+
+def encode(message: Dict[str, Any], protocol: Optional[str]) -> Union[str, bytes]:
+    """按子协议编码发给客户端的消息
+
+    Args:
+        message: 消息（完整字段名），嵌套内容需可 JSON 序列化
+        protocol: 协商得到的子协议
+
+    Returns:
+        Union[str, bytes]: 文本帧或二进制帧（msgpack）
+    """
+    if protocol == MSGPACK_PROTOCOL:
+        return msgpack.packb(_shorten(message), use_bin_type=True)
+    if protocol == COMPACT_PROTOCOL:
+        return json.dumps(_shorten(message), ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(message)
+
+
+def decode(frame: Union[str, bytes], protocol: Optional[str]) -> Dict[str, Any]:
+    """解码客户端发来的消息，统一还原为完整字段名
+
+    客户端在任何子协议下都可以发送完整字段名的 JSON 文本帧。
+
+    Raises:
+        FrameError: 帧内容无法解析
+    """
+    try:
+        if isinstance(frame, bytes):
+            if protocol != MSGPACK_PROTOCOL:
+                raise FrameError("当前协议不支持二进制帧")
+            data = msgpack.unpackb(frame, raw=False)
+        else:
+            data = json.loads(frame)
+    except FrameError:
+        raise
+    except Exception as e:
+        raise FrameError(str(e)) from e
+    if not isinstance(data, dict):
+        raise FrameError("消息格式错误")
+    return _expand(data) if protocol else data
@@ -0,0 +1,208 @@
+import logging
+from typing import Any, Dict, Optional
+from tornado.ioloop import IOLoop
+from config.settings import SETTINGS
+from utils.pubsub import PubSub
+
+logger = logging.getLogger(__name__)
+
+# 取消、恢复等请求的广播频道，由持有生成的工作进程处理
+GENERATIONS_CHANNEL = "generations"
+
+
+class Generation:
+    """一次生成的输出缓冲
+
+    每个流式片段分配递增的序号（从1开始）并保存在内存中，生成任务只向缓冲
+    写入，由缓冲转发给当前连接。客户端断线重连后发送
+    resume(generation_id, last_seq) 重新挂接，只补发缺失的片段，
+    不会重新请求上游。
+
+    Args:
+        generation_id: 生成ID
+        user_id: 发起生成的用户ID
+        conversation_id: 会话ID
+    """
+
+    def __init__(self, generation_id: str, user_id: str, conversation_id: str):
+        self.generation_id = generation_id
+        self.user_id = user_id
+        self.conversation_id = conversation_id
+        self.chunks = []
+        self.final = None  # 结束消息（done / cancelled / error）
+        self.handler = None  # 当前挂接的 ChatWebSocket 或 RemoteConnection
+        self.task = None
+        self._cancel_timer = None
+
+    @property
+    def seq(self) -> int:
+        """最后一个片段的序号"""
+        return len(self.chunks)
+
+    @property
+    def finished(self) -> bool:
+        """生成是否已结束"""
+        return self.final is not None
+
+    def attach(self, handler) -> None:
+        """挂接到连接，取消断线后的延迟取消"""
+        if self._cancel_timer is not None:
+            IOLoop.current().remove_timeout(self._cancel_timer)
+            self._cancel_timer = None
+        self.handler = handler
+
+    def detach(self, grace: float) -> None:
+        """与连接分离，grace 秒内没有重新挂接则取消生成
+
+        Args:
+            grace: 等待重连的秒数，不大于0时立即取消
+        """
+        self.handler = None
+        if self.finished or self.task is None:
+            return
+        if grace <= 0:
+            self.task.cancel()
+        elif self._cancel_timer is None:
+            self._cancel_timer = IOLoop.current().call_later(grace, self.task.cancel)
+
+    def send(self, message: Dict[str, Any]):
+        """发送消息给当前连接，未挂接时丢弃
+
+        Returns:
+            Optional[Future]: 写入完成的 Future
+        """
+        message["generation_id"] = self.generation_id
+        if self.handler is None:
+            return None
+        return self.handler.write_message(message)
+
+    def append(self, content: str):
+        """记录一个流式片段并发送
+
+        Returns:
+            Optional[Future]: 写入完成的 Future
+        """
+        self.chunks.append(content)
+        return self.send({"type": "stream", "content": content, "seq": self.seq})
+
+    def finish(self, message: Dict[str, Any]) -> None:
+        """记录并发送结束消息"""
+        self.final = message
+        self.send(message)
+
+    def resume(self, handler, last_seq: int) -> None:
+        """挂接到新的连接并补发缺失的片段
+
+        同一生成只挂接到一个连接（如另一个标签页或重连后的新连接接管）。
+
+        Args:
+            handler: ChatWebSocket 或 RemoteConnection
+            last_seq: 客户端已收到的最后一个片段序号
+        """
+        previous = self.handler
+        if previous is not None and previous is not handler:
+            previous.generations.pop(self.generation_id, None)
+        self.attach(handler)
+        if not self.finished:
+            handler.generations[self.generation_id] = self
+        self.send({"type": "resumed", "seq": self.seq})
+        self.replay(last_seq)
+
+    def replay(self, last_seq: int) -> None:
+        """补发 last_seq 之后的片段（合并为一帧）以及结束消息
+
+        Args:
+            last_seq: 客户端已收到的最后一个片段序号
+        """
+        last_seq = min(max(last_seq, 0), self.seq)
+        if last_seq < self.seq:
+            self.send(
+                {
+                    "type": "stream",
+                    "content": "".join(self.chunks[last_seq:]),
+                    "seq": self.seq,
+                }
+            )
+        if self.final is not None:
+            self.send(dict(self.final))
+
+
+class RemoteConnection:
+    """其他工作进程上的连接的代理
+
+    生成在本进程中进行、客户端连接在另一个进程上时，
+    发给该连接的消息通过广播频道转发给对应进程。
+
+    Args:
+        worker_id: 连接所在的工作进程
+        connection_id: 连接ID
+    """
+
+    def __init__(self, worker_id: str, connection_id: str):
+        self.worker_id = worker_id
+        self.connection_id = connection_id
+        self.generations = {}
+
+    def write_message(self, message: Dict[str, Any]) -> None:
+        """转发消息给连接所在的进程"""
+        PubSub.publish(
+            PubSub.worker_channel(self.worker_id),
+            {"op": "frame", "connection_id": self.connection_id, "message": message},
+        )
+
+
+class GenerationRegistry:
+    """进程内的生成缓冲登记表
+
+    生成结束后缓冲继续保留 resume_ttl_seconds 秒，
+    让稍后重连的客户端仍能取到剩余片段和最终结果。
+    """
+
+    generations: Dict[str, Generation] = {}
+
+    @classmethod
+    def create(
+        cls, generation_id: str, user_id: str, conversation_id: str
+    ) -> Generation:
+        """登记新的生成"""
+        generation = Generation(generation_id, user_id, conversation_id)
+        cls.generations[generation_id] = generation
+        return generation
+
+    @classmethod
+    def get(cls, generation_id: str, user_id: str) -> Optional[Generation]:
+        """获取属于该用户的生成，不存在或已过期时返回None"""
+        generation = cls.generations.get(generation_id)
+        if generation is None or generation.user_id != user_id:
+            return None
+        return generation
+
+    @classmethod
+    def on_remote_request(cls, request: Dict[str, Any]) -> None:
+        """处理其他工作进程转发的取消、恢复和分离请求
+
+        只有持有该生成的进程会处理，其他进程忽略。
+        """
+        generation = cls.get(request.get("generation_id"), request.get("user_id"))
+        if generation is None:
+            return
+
+        op = request.get("op")
+        if op == "cancel":
+            if not generation.finished:
+                generation.task.cancel()
+        elif op == "resume":
+            handler = RemoteConnection(request["worker_id"], request["connection_id"])
+            generation.resume(handler, request.get("last_seq", 0))
+        elif op == "detach":
+            handler = generation.handler
+            if isinstance(
+                handler, RemoteConnection
+            ) and handler.connection_id == request.get("connection_id"):
+                generation.detach(SETTINGS["websocket"]["resume_grace_seconds"])
+
+    @classmethod
+    def release(cls, generation_id: str) -> None:
+        """生成结束后延迟移除缓冲"""
+        ttl = SETTINGS["websocket"]["resume_ttl_seconds"]
+        IOLoop.current().call_later(ttl, cls.generations.pop, generation_id, None)
@@ -0,0 +1,216 @@
+import logging
+import time
+from tornado.httpclient import AsyncHTTPClient
+from config.settings import OPENAI_CONFIG
+from utils.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pycurl
+except ImportError:  # pycurl 为可选依赖
+    pycurl = None
+
+
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "mychat_upstream_request_seconds",
+    "上游请求耗时（流式请求为整个回答的时间）",
+    ["outcome"],
+)
+UPSTREAM_FIRST_BYTE_SECONDS = Histogram(
+    "mychat_upstream_first_byte_seconds", "上游首字节延迟（仅 curl 后端）"
+)
+UPSTREAM_CONNECTIONS = Counter(
+    "mychat_upstream_connections_total", "上游请求使用的连接", ["type"]
+)
+UPSTREAM_IN_FLIGHT = Gauge("mychat_upstream_in_flight", "进行中的上游请求数")
+
+
+class UpstreamAborted(Exception):
+    """上游请求被主动中止"""
+
+
+class HTTPPool:
+    """进程级共享的上游HTTP连接池
+
+    安装了 pycurl 时使用 CurlAsyncHTTPClient：连接在请求之间保持复用
+    （HTTP keep-alive），可限制每个主机的连接数并可选启用 HTTP/2；
+    否则退回 Tornado 自带的 SimpleAsyncHTTPClient（不支持连接复用）。
+    OpenAIClient 与 ModelsHandler 都通过这里发起上游请求。
+    """
+
+    backend = None
+    http2 = False
+    max_clients = 0
+    stats = {
+        "requests": 0,
+        "in_flight": 0,
+        "errors": 0,
+        "aborted": 0,
+        "new_connections": 0,
+        "reused_connections": 0,
+        "connect_time_total": 0.0,
+        "first_byte_time_total": 0.0,
+    }
+
+    @classmethod
+    def initialize(
+        cls,
+        max_clients: int = None,
+        max_host_connections: int = None,
+        http2: bool = None,
+    ) -> None:
+        """配置进程内共享的 AsyncHTTPClient
+
+        Args:
+            max_clients: 同时进行的请求数上限
+            max_host_connections: 每个主机的最大连接数（仅 curl 后端）
+            http2: 是否启用 HTTP/2（仅 curl 后端）
+        """
+        pool_config = OPENAI_CONFIG["pool"]
+        cls.max_clients = max_clients or pool_config["max_clients"]
+        max_host_connections = (
+            max_host_connections or pool_config["max_host_connections"]
+        )
+        cls.http2 = pool_config["http2"] if http2 is None else http2
+
+        if pycurl is not None:
+            AsyncHTTPClient.configure(
+                "tornado.curl_httpclient.CurlAsyncHTTPClient",
+                max_clients=cls.max_clients,
+            )
+            cls.backend = "curl"
+            multi = getattr(AsyncHTTPClient(), "_multi", None)
+            if multi is not None:
+                multi.setopt(pycurl.M_MAX_HOST_CONNECTIONS, max_host_connections)
+                if cls.http2:
+                    multi.setopt(pycurl.M_PIPELINING, pycurl.PIPE_MULTIPLEX)
+        else:
+            AsyncHTTPClient.configure(None, max_clients=cls.max_clients)
+            cls.backend = "simple"
+            logger.warning("未安装 pycurl，上游请求无法复用连接")
+
+        logger.info(
+            f"上游连接池初始化成功: backend={cls.backend}, "
+            f"max_clients={cls.max_clients}, http2={cls.http2}"
+        )
+
+    @classmethod
+    def _prepare_curl(cls, curl) -> None:
+        """为每个 curl 句柄开启 TCP keep-alive 及 HTTP/2"""
+        curl.setopt(pycurl.TCP_KEEPALIVE, 1)
+        if cls.http2:
+            curl.setopt(pycurl.HTTP_VERSION, pycurl.CURL_HTTP_VERSION_2TLS)
+
+    @classmethod
+    def fetch(cls, request, abort=None, **kwargs):
+        """通过共享客户端发起请求，并记录连接池统计
+
+        Args:
+            request: tornado.httpclient.HTTPRequest
+            abort: 可选的无参函数，返回 True 时中止请求并关闭上游连接。
+                curl 后端通过进度回调检查（至少每秒一次），
+                simple 后端在收到下一个数据块时检查（需要 streaming_callback）
+            **kwargs: 透传给 AsyncHTTPClient.fetch 的参数
+
+        Returns:
+            Future: 请求结果
+        """
+        if cls.backend is None:
+            cls.initialize()
+
+        if cls.backend == "curl":
+
+            def prepare_curl(curl):
+                cls._prepare_curl(curl)
+                if abort is not None:
+                    # 进度回调返回非0值时 curl 中止传输
+                    curl.setopt(pycurl.NOPROGRESS, 0)
+                    curl.setopt(pycurl.XFERINFOFUNCTION, lambda *_: int(abort()))
+                else:
+                    # curl 句柄在请求之间复用且不会 reset，清除上一个请求的进度回调
+                    curl.setopt(pycurl.NOPROGRESS, 1)
+                    curl.unsetopt(pycurl.XFERINFOFUNCTION)
+
+            request.prepare_curl_callback = prepare_curl
+        elif abort is not None and request.streaming_callback is not None:
+            streaming_callback = request.streaming_callback
+
+            def abortable_callback(chunk):
+                if abort():
+                    # 回调中抛出异常会使 simple 客户端关闭连接
+                    raise UpstreamAborted("上游请求已中止")
+                streaming_callback(chunk)
+
+            request.streaming_callback = abortable_callback
+
+        cls.stats["requests"] += 1
+        cls.stats["in_flight"] += 1
+        start = time.perf_counter()
+        future = AsyncHTTPClient().fetch(request, **kwargs)
+        future.add_done_callback(lambda f: cls._on_done(f, abort, start))
+        return future
+
+    @classmethod
+    def _on_done(cls, future, abort=None, start=None) -> None:
+        """请求完成时更新统计"""
+        cls.stats["in_flight"] -= 1
+        error = future.exception()
+        response = getattr(error, "response", None) if error else future.result()
+        outcome = "ok"
+        if error is not None:
+            if abort is not None and abort():
+                cls.stats["aborted"] += 1
+                outcome = "aborted"
+            else:
+                cls.stats["errors"] += 1
+                outcome = "error"
+        if start is not None:
+            UPSTREAM_REQUEST_SECONDS.labels(outcome).observe(
+                time.perf_counter() - start
+            )
+        if response is None or not response.time_info:
+            return
+
+        # curl 复用已有连接时 connect 阶段耗时为 0
+        time_info = response.time_info
+        if time_info.get("connect", 0) > 0:
+            cls.stats["new_connections"] += 1
+            # 使用 TLS 时 appconnect 包含握手时间
+            connect_time = time_info.get("appconnect") or time_info["connect"]
+            cls.stats["connect_time_total"] += connect_time
+            UPSTREAM_CONNECTIONS.labels("new").inc()
+        else:
+            cls.stats["reused_connections"] += 1
+            UPSTREAM_CONNECTIONS.labels("reused").inc()
+        cls.stats["first_byte_time_total"] += time_info.get("starttransfer", 0)
+        if "starttransfer" in time_info:
+            UPSTREAM_FIRST_BYTE_SECONDS.observe(time_info["starttransfer"])
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        """获取连接池统计信息"""
+        stats = dict(cls.stats)
+        measured = stats["new_connections"] + stats["reused_connections"]
+        stats.update(
+            {
+                "backend": cls.backend,
+                "http2": cls.http2,
+                "max_clients": cls.max_clients,
+                "reuse_ratio": (
+                    stats["reused_connections"] / measured if measured else None
+                ),
+                "avg_connect_time": (
+                    stats["connect_time_total"] / stats["new_connections"]
+                    if stats["new_connections"]
+                    else None
+                ),
+                "avg_first_byte_time": (
+                    stats["first_byte_time_total"] / measured if measured else None
+                ),
+            }
+        )
+        return stats
+
+
+UPSTREAM_IN_FLIGHT.set_function(lambda: HTTPPool.stats["in_flight"])
@@ -0,0 +1,289 @@
+import logging
+from typing import List, Dict, Any
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from config.settings import SETTINGS
+from utils.pagination import keyset_filter
+
+logger = logging.getLogger(__name__)
+
+# 热点查询所需的索引，集合名 -> 索引列表
+INDEXES = {
+    "messages": [
+        # get_messages / 上下文组装 / count_documents：按会话取消息并按时间排序
+        IndexModel(
+            [
+                ("conversation_id", ASCENDING),
+                ("created_at", ASCENDING),
+                ("_id", ASCENDING),
+            ],
+            name="conversation_created_at",
+        ),
+        # search_messages：会话内按索引词查找（search_tokens 为数组，多键索引）
+        IndexModel(
+            [("conversation_id", ASCENDING), ("search_tokens", ASCENDING)],
+            name="conversation_search_tokens",
+        ),
+    ],
+    "conversations": [
+        # get_conversations：按用户取会话，按 (最后消息时间, _id) 倒序分页
+        IndexModel(
+            [
+                ("user_id", ASCENDING),
+                ("last_message_at", DESCENDING),
+                ("_id", DESCENDING),
+            ],
+            name="user_last_message_at_id",
+        ),
+        # ConversationLifecycle 自动归档：按最后消息时间查找未归档的闲置会话
+        IndexModel(
+            [("archived", ASCENDING), ("last_message_at", ASCENDING)],
+            name="archived_last_message_at",
+        ),
+    ],
+    "message_archives": [
+        # archive_conversation / restore_conversation 及已归档会话的读取：按会话顺序读写归档块
+        IndexModel(
+            [("conversation_id", ASCENDING), ("seq", ASCENDING)],
+            name="conversation_seq",
+            unique=True,
+        ),
+    ],
+    "lifecycle_jobs": [
+        # claim_lifecycle_job：领取最早的任务
+        IndexModel([("created_at", ASCENDING)], name="created_at"),
+    ],
+    "usage": [
+        # rollup_usage：按（小时, 用户, 会话, 模型）upsert；过期的汇总自动删除
+        IndexModel(
+            [
+                ("hour", ASCENDING),
+                ("user_id", ASCENDING),
+                ("conversation_id", ASCENDING),
+                ("model", ASCENDING),
+            ],
+            name="hour_user_conversation_model",
+            unique=True,
+        ),
+        IndexModel(
+            [("hour", ASCENDING)],
+            name="hour_ttl",
+            expireAfterSeconds=SETTINGS["usage"]["retention_days"] * 86400,
+        ),
+        # get_usage_summary：按用户筛选
+        IndexModel([("user_id", ASCENDING), ("hour", ASCENDING)], name="user_hour"),
+    ],
+    "rate_limits": [
+        # MongoBucketStore：空闲到补满的令牌桶自动删除
+        IndexModel(
+            [("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0
+        ),
+    ],
+    "response_cache": [
+        # ResponseCache：过期的回答自动删除
+        IndexModel(
+            [("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0
+        ),
+    ],
+    "users": [
+        # get_user / create_user：按用户名查找
+        IndexModel([("username", ASCENDING)], name="username", unique=True),
+    ],
+}
+
+
+def ensure_indexes(db) -> None:
+    """创建热点查询所需的索引
+
+    create_indexes 对已存在且定义相同的索引不做任何操作，可在每次启动时调用。
+    单个集合创建失败（如已有同名但定义不同的索引）只记录日志，不影响启动。
+
+    Args:
+        db: pymongo Database 实例
+    """
+    for collection_name, indexes in INDEXES.items():
+        try:
+            names = db[collection_name].create_indexes(indexes)
+            logger.info(f"集合 {collection_name} 索引就绪: {', '.join(names)}")
+        except OperationFailure as e:
+            logger.error(f"集合 {collection_name} 创建索引失败: {str(e)}")
+
+
+def hot_queries(sample: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Database 各方法对应的热点查询，用于 explain 检查
+
+    Args:
+        sample: 样例数据，包含 user_id、username、password、
+            conversation_id、message_id、created_at、search_tokens
+
+    Returns:
+        List[Dict[str, Any]]: 每项包含方法名和 explain 命令
+    """
+    conversation_filter = {"conversation_id": sample["conversation_id"]}
+    # 以样例消息作为分页边界，条件与 Database 的分页查询相同
+    position = (sample["created_at"], sample["message_id"])
+    page_limit = SETTINGS["messages"]["page_size"] + 1
+    return [
+        {
+            "method": "get_messages",
+            "command": {
+                "find": "messages",
+                "filter": {
+                    **conversation_filter,
+                    **keyset_filter("created_at", *position, "$lt"),
+                },
+                "sort": {"created_at": -1, "_id": -1},
+                "limit": page_limit,
+            },
+        },
+        {
+            "method": "get_messages(newer)",
+            "command": {
+                "find": "messages",
+                "filter": {
+                    **conversation_filter,
+                    **keyset_filter("created_at", *position, "$gt"),
+                },
+                "sort": {"created_at": 1, "_id": 1},
+                "limit": page_limit,
+            },
+        },
+        {
+            "method": "get_messages(count)",
+            "command": {"count": "messages", "query": conversation_filter},
+        },
+        {
+            "method": "iter_messages_newest_first",
+            "command": {
+                "find": "messages",
+                "filter": conversation_filter,
+                "sort": {"created_at": -1, "_id": -1},
+                "batchSize": 50,
+            },
+        },
+        {
+            "method": "search_messages",
+            "command": {
+                "find": "messages",
+                "filter": {
+                    **conversation_filter,
+                    "search_tokens": {"$all": sample["search_tokens"]},
+                    **keyset_filter("created_at", *position, "$lt", "$lte"),
+                },
+                "sort": {"created_at": -1, "_id": -1},
+                "limit": SETTINGS["search"]["max_candidates"],
+            },
+        },
+        {
+            "method": "get_conversations",
+            "command": {
+                "find": "conversations",
+                "filter": {
+                    "user_id": sample["user_id"],
+                    "archived": {"$ne": True},
+                    **keyset_filter(
+                        "last_message_at",
+                        sample["created_at"],
+                        sample["conversation_id"],
+                        "$lt",
+                    ),
+                },
+                "projection": {"title": 1, "last_message_at": 1},
+                "sort": {"last_message_at": -1, "_id": -1},
+                "limit": SETTINGS["conversations"]["page_size"] + 1,
+            },
+        },
+        {
+            "method": "find_idle_conversations",
+            "command": {
+                "find": "conversations",
+                "filter": {
+                    "archived": {"$ne": True},
+                    "last_message_at": {"$lt": sample["created_at"]},
+                },
+                "projection": {"_id": 1},
+                "sort": {"last_message_at": 1},
+                "limit": SETTINGS["lifecycle"]["archive_batch"],
+            },
+        },
+        {
+            "method": "get_conversation",
+            "command": {
+                "find": "conversations",
+                "filter": {"_id": sample["conversation_id"]},
+                "limit": 1,
+            },
+        },
+        {
+            "method": "get_user",
+            "command": {
+                "find": "users",
+                "filter": {
+                    "username": sample["username"],
+                    "password": sample["password"],
+                },
+                "limit": 1,
+            },
+        },
+        {
+            "method": "get_user_by_id",
+            "command": {
+                "find": "users",
+                "filter": {"_id": sample["user_id"]},
+                "limit": 1,
+            },
+        },
+    ]
+
+
+def _collect_stages(plan: Dict[str, Any], stages: List[str]) -> List[str]:
+    """递归收集执行计划中的所有阶段名"""
+    if "stage" in plan:
+        stages.append(plan["stage"])
+    # 新版本（SBE）的计划放在 queryPlan 中
+    for key in ("queryPlan", "inputStage"):
+        if key in plan:
+            _collect_stages(plan[key], stages)
+    for child in plan.get("inputStages", []):
+        _collect_stages(child, stages)
+    return stages
+
+
+def _collect_index_names(plan: Dict[str, Any], names: List[str]) -> List[str]:
+    """递归收集执行计划中使用的索引名"""
+    if "indexName" in plan:
+        names.append(plan["indexName"])
+    for key in ("queryPlan", "inputStage"):
+        if key in plan:
+            _collect_index_names(plan[key], names)
+    for child in plan.get("inputStages", []):
+        _collect_index_names(child, names)
+    return names
+
+
+def explain_hot_queries(db, sample: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """对热点查询执行 explain，返回各查询使用的执行计划
+
+    Args:
+        db: pymongo Database 实例
+        sample: 样例数据，见 hot_queries
+
+    Returns:
+        List[Dict[str, Any]]: 每项包含方法名、阶段列表、使用的索引以及是否全表扫描
+    """
+    results = []
+    for query in hot_queries(sample):
+        explain = db.command("explain", query["command"], verbosity="queryPlanner")
+        winning_plan = explain["queryPlanner"]["winningPlan"]
+        stages = _collect_stages(winning_plan, [])
+        index_names = _collect_index_names(winning_plan, [])
+        results.append(
+            {
+                "method": query["method"],
+                "collection": next(iter(query["command"].values())),
+                "stages": stages,
+                "indexes": index_names,
+                "collscan": "COLLSCAN" in stages,
+            }
+        )
+    return results
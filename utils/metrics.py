@@ -0,0 +1,266 @@
+import bisect
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# 默认的延迟分桶（秒），覆盖从毫秒级的数据库查询到分钟级的流式回答
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+
+def _format_value(value: float) -> str:
+    """按文本格式输出数值"""
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    """转义标签值"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return f"{{{pairs}}}"
+
+
+class Metric:
+    """指标基类：按标签值缓存子指标
+
+    所有更新都应在 IOLoop 线程中进行（线程池中的耗时在返回 IOLoop 后再记录），
+    因此不加锁，一次更新只是几次属性运算。
+    """
+
+    type = None
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: "Registry" = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values):
+        """获取（必要时创建）对应标签值的子指标"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    f"指标 {self.name} 需要 {len(self.labelnames)} 个标签值"
+                )
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> Iterable[str]:
+        """输出文本格式的样本行"""
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Counter(Metric):
+    """只增不减的计数"""
+
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._default.value += amount
+
+    def collect(self):
+        for values, child in self._children.items():
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}{labels} {_format_value(child.value)}"
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """导出时调用 function 取值（用于已有的统计，如缓存条目数）"""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(Metric):
+    """可增可减的当前值"""
+
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._default.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self._default.value -= amount
+
+    def set(self, value: float) -> None:
+        self._default.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._default.function = function
+
+    def collect(self):
+        for values, child in self._children.items():
+            value = child.get()
+            if value is None:
+                continue
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # 每个桶单独计数，导出时再累加，observe 只需一次二分查找
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> "_Timer":
+        """计时上下文管理器，退出时记录耗时"""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+class Histogram(Metric):
+    """分桶统计（延迟等）"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: "Registry" = None,
+    ):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def time(self) -> _Timer:
+        return _Timer(self._default)
+
+    def collect(self):
+        # le 标签值只格式化一次
+        bounds = [_format_value(bound) for bound in self.bounds + (math.inf,)]
+        for values, child in self._children.items():
+            labels = _format_labels(self.labelnames, values)
+            prefix = f"{self.name}_bucket{{{labels[1:-1]}{',' if labels else ''}le="
+            cumulative = 0
+            for bound, count in zip(bounds, child.counts):
+                cumulative += count
+                yield f'{prefix}"{bound}"}} {cumulative}'
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {child.count}"
+
+
+class Registry:
+    """指标注册表，按文本格式导出全部指标"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> None:
+        if metric.name in self.metrics:
+            raise ValueError(f"指标已存在: {metric.name}")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """生成 /metrics 的响应体"""
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.collect())
+        lines.append("")
+        return "\n".join(lines)
+
+
+REGISTRY = Registry()
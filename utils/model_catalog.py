@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+from tornado.ioloop import PeriodicCallback
+from config.settings import OPENAI_CONFIG
+from utils.openai_client import OpenAIClient
+
+logger = logging.getLogger(__name__)
+
+
+class ModelCatalog:
+    """模型目录缓存（stale-while-revalidate）
+
+    上游模型列表在后台定期刷新，接口直接返回预先序列化好的分组视图和简单视图
+    及其 ETag，不在请求路径上访问上游。缓存过期后仍先返回旧数据，同时在后台
+    重新获取；上游失败时保留上一次成功的结果，从未成功过则使用配置中的默认列表。
+    """
+
+    models: List[Dict[str, Any]] = []
+    views: Dict[str, Tuple[bytes, str]] = {}
+    source = None  # upstream 或 default
+    fetched_at = 0.0
+    _refreshing = None
+    _periodic = None
+
+    @classmethod
+    def initialize(cls, refresh_interval: float = None) -> None:
+        """加载默认列表并开始后台刷新
+
+        Args:
+            refresh_interval: 刷新间隔（秒），默认读取配置
+        """
+        if cls._periodic is not None:
+            return
+
+        refresh_interval = (
+            refresh_interval or OPENAI_CONFIG["catalog"]["refresh_interval"]
+        )
+        cls._publish(OPENAI_CONFIG["models"], "default")
+        cls.fetched_at = 0.0
+        cls._periodic = PeriodicCallback(cls.revalidate, refresh_interval * 1000)
+        cls._periodic.start()
+        cls.revalidate()
+        logger.info(f"模型目录初始化成功，刷新间隔: {refresh_interval}s")
+
+    @classmethod
+    def cleanup(cls) -> None:
+        """停止后台刷新"""
+        if cls._periodic is not None:
+            cls._periodic.stop()
+            cls._periodic = None
+
+    @classmethod
+    async def get_view(cls, name: str) -> Tuple[bytes, str]:
+        """获取预先序列化的视图
+
+        Args:
+            name: grouped（按提供商分组）或 simple（下拉框用的简单列表）
+
+        Returns:
+            Tuple[bytes, str]: JSON 响应体及其 ETag
+        """
+        if cls._periodic is None:
+            cls.initialize()
+
+        interval = OPENAI_CONFIG["catalog"]["refresh_interval"]
+        if time.monotonic() - cls.fetched_at > interval:
+            refreshing = cls.revalidate()
+            # 还没有从上游取到过列表时（刚启动），短暂等待第一次刷新
+            if cls.source != "upstream":
+                try:
+                    await asyncio.wait_for(
+                        asyncio.shield(refreshing),
+                        OPENAI_CONFIG["catalog"]["cold_wait"],
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        return cls.views[name]
+
+    @classmethod
+    def revalidate(cls) -> asyncio.Future:
+        """在后台刷新模型列表，已在刷新时不重复请求
+
+        Returns:
+            asyncio.Future: 本次刷新
+        """
+        if cls._refreshing is None or cls._refreshing.done():
+            cls._refreshing = asyncio.ensure_future(cls.refresh())
+        return cls._refreshing
+
+    @classmethod
+    async def refresh(cls) -> None:
+        """从上游获取模型列表，失败时保留当前数据"""
+        try:
+            models = await OpenAIClient().get_available_models()
+            if not models:
+                raise ValueError("上游返回的模型列表为空")
+            cls._publish(models, "upstream")
+            logger.info(f"模型目录已刷新: {len(cls.models)} 个模型")
+        except Exception as e:
+            logger.error(f"刷新模型目录失败，继续使用{cls.source}列表: {str(e)}")
+            # 失败后等到下一个刷新周期再重试，避免每个请求都触发
+            cls.fetched_at = time.monotonic()
+
+    @classmethod
+    def _publish(cls, raw_models: List[Dict[str, Any]], source: str) -> None:
+        """整理模型列表并预先生成各视图"""
+        models = [
+            {
+                "id": model["id"],
+                "name": model["id"].replace("-", " ").title(),
+                "owned_by": model.get("owned_by", "unknown"),
+                "created": model.get("created"),
+                "object": model.get("object"),
+                "permission": model.get("permission"),
+            }
+            for model in raw_models
+            if isinstance(model, dict) and model.get("id")
+        ]
+
+        # 按 owned_by 分组（用于模型管理页面）
+        grouped_models = defaultdict(list)
+        for model in models:
+            grouped_models[model["owned_by"]].append(model)
+        grouped = {
+            "success": True,
+            "model_groups": [
+                {"provider": provider, "models": models_list}
+                for provider, models_list in grouped_models.items()
+            ],
+        }
+
+        # 简单列表格式（用于聊天页面的下拉框）
+        simple = {
+            "success": True,
+            "models": [
+                {
+                    "id": model["id"],
+                    "name": model["name"],
+                    "owned_by": model["owned_by"],
+                }
+                for model in models
+            ],
+        }
+
+        cls.views = {
+            "grouped": cls._serialize(grouped),
+            "simple": cls._serialize(simple),
+        }
+        cls.models = models
+        cls.source = source
+        cls.fetched_at = time.monotonic()
+
+    @staticmethod
+    def _serialize(view: Dict[str, Any]) -> Tuple[bytes, str]:
+        """序列化视图并计算 ETag（内容不变时 ETag 不变）"""
+        body = json.dumps(view, ensure_ascii=False).encode("utf-8")
+        return body, f'"{hashlib.sha1(body).hexdigest()}"'
@@ -1,16 +1,26 @@
 import json
 import logging
-import requests
 from datetime import datetime
+from tornado.httpclient import HTTPRequest
+from tornado.queues import Queue
 from config.settings import OPENAI_CONFIG
+from utils.http_pool import HTTPPool
+from utils.sse import SSEDecoder, parse_chat_event
 
 logger = logging.getLogger(__name__)
 
 
 class OpenAIClient:
-    def __init__(self):
-        self.api_key = OPENAI_CONFIG["api_key"]
-        self.base_url = OPENAI_CONFIG["base_url"]
+    """单个 OpenAI 兼容上游的客户端
+
+    Args:
+        base_url: 上游地址，默认读取配置（多个上游时由 ProviderRouter 指定）
+        api_key: 上游的 API Key，默认读取配置
+    """
+
+    def __init__(self, base_url: str = None, api_key: str = None):
+        self.api_key = api_key or OPENAI_CONFIG["api_key"]
+        self.base_url = (base_url or OPENAI_CONFIG["base_url"]).rstrip("/")
         self.model = "gpt-3.5-turbo"
 
     def _convert_to_serializable(self, obj):
@@ -31,50 +41,55 @@ class OpenAIClient:
         else:
             return str(obj) if hasattr(obj, "__str__") else obj
 
-    def _parse_sse_line(self, line):
-        """解析 SSE 格式的数据行"""
-        if not line:
-            return None
-        if line.startswith("data: "):
-            try:
-                data = json.loads(line[6:])  # 去掉 'data: ' 前缀
-                if data.get("choices") and len(data["choices"]) > 0:
-                    delta = data["choices"][0].get("delta", {})
-                    return delta.get("content", "")
-            except json.JSONDecodeError as e:
-                logger.error(f"解析 SSE 数据失败: {str(e)}, line: {line}")
-        return None
-
-    def get_available_models(self):
-        """获取可用模型列表"""
-        try:
-            url = f"{self.base_url}/v1/models"
-            headers = {"Authorization": f"Bearer {self.api_key}"}
+    async def get_available_models(self):
+        """从上游获取可用模型列表
 
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
+        Returns:
+            list: 上游 /v1/models 返回的 data 字段
 
-            return response.json()
+        Raises:
+            Exception: 请求失败或响应格式不正确（由 ModelCatalog 处理回退）
+        """
+        request = HTTPRequest(
+            f"{self.base_url}/v1/models",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            connect_timeout=OPENAI_CONFIG["connect_timeout"],
+            request_timeout=OPENAI_CONFIG["catalog"]["request_timeout"],
+        )
+        response = await HTTPPool.fetch(request)
 
-        except Exception as e:
-            logger.error(f"获取模型列表失败: {str(e)}")
-            # 如果API调用失败，返回配置中的默认模型列表
-            return {
-                "object": "list",
-                "data": [
-                    {"id": "gpt-4", "object": "model", "owned_by": "openai"},
-                    {"id": "gpt-4-32k", "object": "model", "owned_by": "openai"},
-                    {"id": "gpt-3.5-turbo", "object": "model", "owned_by": "openai"},
-                    {
-                        "id": "gpt-3.5-turbo-16k",
-                        "object": "model",
-                        "owned_by": "openai",
-                    },
-                ],
-            }
+        data = json.loads(response.body)
+        if not isinstance(data, dict) or not isinstance(data.get("data"), list):
+            raise ValueError("API响应格式不正确")
+        return data["data"]
+
+    async def chat_stream(self, messages, model=None):
+        """流式对话（异步生成器），只输出回复内容
 
-    def chat_stream(self, messages, model=None):
-        """流式对话"""
+        Yields:
+            str: 回复内容片段
+        """
+        events = self.chat_events(messages, model)
+        try:
+            async for delta in events:
+                if delta.content:
+                    yield delta.content
+        finally:
+            # 调用方提前结束时关闭内层生成器，使其中止上游请求
+            await events.aclose()
+
+    async def chat_events(self, messages, model=None):
+        """流式对话（异步生成器），输出结构化的增量
+
+        使用 AsyncHTTPClient 的 streaming_callback 接收上游数据块，
+        数据块通过队列交给增量 SSE 解码器，整个过程不会阻塞 IOLoop。
+        调用方提前结束迭代（任务被取消或关闭生成器）时会中止上游请求。
+
+        Yields:
+            ChatDelta: 包含 content、finish_reason、usage 等字段的增量
+        """
+        response_future = None
+        stream_state = {"finished": False, "aborted": False}
         try:
             url = f"{self.base_url}/v1/chat/completions"
             headers = {
@@ -87,20 +102,60 @@ class OpenAIClient:
                 "messages": messages,
                 "stream": True,
             }
+            if OPENAI_CONFIG["stream_usage"]:
+                # 让上游在最后一个事件中返回 token 用量
+                data["stream_options"] = {"include_usage": True}
+
+            chunks = Queue()
+            request = HTTPRequest(
+                url,
+                method="POST",
+                headers=headers,
+                body=json.dumps(data),
+                streaming_callback=chunks.put_nowait,
+                connect_timeout=OPENAI_CONFIG["connect_timeout"],
+                request_timeout=OPENAI_CONFIG["request_timeout"],
+            )
+            response_future = HTTPPool.fetch(
+                request, abort=lambda: stream_state["aborted"]
+            )
+            # 请求结束（成功或失败）后放入 None 作为结束标记
+            response_future.add_done_callback(lambda _: chunks.put_nowait(None))
+
+            decoder = SSEDecoder()
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    # 上游请求结束，如有异常（如HTTP错误状态码）在此抛出
+                    stream_state["finished"] = True
+                    response_future.result()
+                    events = decoder.close()
+                else:
+                    events = decoder.feed(chunk)
 
-            response = requests.post(url, headers=headers, json=data, stream=True)
-            response.raise_for_status()
+                for event in events:
+                    try:
+                        delta = parse_chat_event(event)
+                    except ValueError as e:
+                        logger.error(f"解析 SSE 数据失败: {str(e)}, data: {event.data}")
+                        continue
+                    if delta is None:
+                        # [DONE]
+                        stream_state["finished"] = True
+                        return
+                    yield delta
 
-            for line in response.iter_lines():
-                if line:
-                    line = line.decode("utf-8")
-                    if line.startswith("data: "):
-                        if line.startswith("data: [DONE]"):
-                            break
-                        content = self._parse_sse_line(line)
-                        if content:
-                            yield content
+                if chunk is None:
+                    break
 
         except Exception as e:
             logger.error(f"调用OpenAI API失败: {str(e)}")
             raise
+        finally:
+            if response_future is not None:
+                # 回答未结束就停止迭代，说明生成被取消，中止上游请求
+                if not stream_state["finished"]:
+                    stream_state["aborted"] = True
+                # 收到 [DONE] 时上游请求可能尚未完成，
+                # 取走其结果以免产生“异常未被获取”的日志
+                response_future.add_done_callback(lambda f: f.exception())
@@ -0,0 +1,119 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional
+from bson import ObjectId, json_util
+
+# 分页标记中允许出现的字段及其校验：t 为边界的时间，i 为边界的 _id，
+# o 为搜索结果的偏移，d 为消息分页的方向
+PAGE_TOKEN_FIELDS = {
+    "t": lambda value: isinstance(value, datetime),
+    "i": lambda value: isinstance(value, ObjectId),
+    "o": lambda value: isinstance(value, int)
+    and not isinstance(value, bool)
+    and value >= 0,
+    "d": lambda value: value in ("older", "newer"),
+}
+
+
+def keyset_filter(
+    field: str, value: Any, object_id: ObjectId, operator: str, id_operator: str = None
+) -> Dict[str, Any]:
+    """(field, _id) 复合分页键的范围条件
+
+    field 相同的文档再按 _id 比较，配合 (..., field, _id) 复合索引，
+    每一页都是一次索引范围扫描。Database 的分页查询和 indexes.hot_queries
+    都通过这里构造条件，explain 检查的就是实际执行的查询形状。
+
+    Args:
+        field: 排序字段，如 created_at、last_message_at
+        value: 边界文档的 field 值
+        object_id: 边界文档的 _id
+        operator: field 的比较操作符，$lt 或 $gt
+        id_operator: field 相同时 _id 的比较操作符，默认与 operator 相同
+
+    Returns:
+        Dict[str, Any]: 可合并进查询条件的 $or 条件
+    """
+    return {
+        "$or": [
+            {field: {operator: value}},
+            {field: value, "_id": {id_operator or operator: object_id}},
+        ]
+    }
+
+
+def encode_page_token(data: Dict[str, Any]) -> str:
+    """将分页位置编码为不透明的分页标记
+
+    标记本身携带查询所需的全部信息（如 created_at 和 _id），
+    解析时无需再查数据库。
+
+    Args:
+        data: 分页位置，可包含 ObjectId 和 datetime
+
+    Returns:
+        str: URL安全的base64字符串
+    """
+    raw = json_util.dumps(data, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_page_token(token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """解析并校验分页标记
+
+    标记的内容会直接拼进查询条件，只接受 PAGE_TOKEN_FIELDS 中的字段和类型，
+    t 和 i 必须同时出现，防止客户端构造的标记注入查询操作符。
+
+    Args:
+        token: encode_page_token 生成的分页标记
+
+    Returns:
+        Optional[Dict[str, Any]]: 分页位置，标记为空时返回None
+
+    Raises:
+        ValueError: 分页标记无效
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        data = json_util.loads(raw.decode("utf-8"))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError("无效的分页标记")
+    if (
+        not isinstance(data, dict)
+        or any(
+            key not in PAGE_TOKEN_FIELDS or not PAGE_TOKEN_FIELDS[key](value)
+            for key, value in data.items()
+        )
+        or ("t" in data) != ("i" in data)
+    ):
+        raise ValueError("无效的分页标记")
+    return data
+
+
+def parse_page_size(value: Optional[str], default: int, maximum: int) -> int:
+    """解析请求参数中的每页数量
+
+    Args:
+        value: 请求参数的原始值，为空时使用默认值
+        default: 默认每页数量
+        maximum: 每页数量上限，超过时按上限处理
+
+    Returns:
+        int: 1 到 maximum 之间的每页数量
+
+    Raises:
+        ValueError: 参数不是正整数
+    """
+    if value is None or value == "":
+        return min(default, maximum)
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"无效的每页数量: {value}")
+    if page_size < 1:
+        raise ValueError(f"无效的每页数量: {value}")
+    return min(page_size, maximum)
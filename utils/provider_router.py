@@ -0,0 +1,424 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+from tornado.httpclient import HTTPClientError
+from config.settings import OPENAI_CONFIG
+from utils.openai_client import OpenAIClient
+from utils.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_ATTEMPTS = Counter(
+    "mychat_upstream_attempts_total",
+    "各上游的请求结果（ok / error / hedge_lost）",
+    ["endpoint", "outcome"],
+)
+UPSTREAM_TTFT_SECONDS = Histogram(
+    "mychat_upstream_ttft_seconds", "各上游的首个片段延迟", ["endpoint"]
+)
+UPSTREAM_RETRIES = Counter("mychat_upstream_retries_total", "首字前失败后的重试次数")
+UPSTREAM_HEDGES = Counter(
+    "mychat_upstream_hedges_total", "对冲请求（won / lost）", ["outcome"]
+)
+UPSTREAM_CIRCUIT_STATE = Gauge(
+    "mychat_upstream_circuit_state",
+    "各上游的熔断状态（0 closed / 1 open / 2 half_open）",
+    ["endpoint"],
+)
+
+# 请求本身有问题，换一个上游也会失败：不重试，也不计入上游的失败
+NON_RETRYABLE_CODES = (400, 413, 422)
+
+
+class UpstreamUnavailable(Exception):
+    """没有可用的上游（都已熔断或没有服务该模型的上游）"""
+
+
+class CircuitBreaker:
+    """上游的熔断器
+
+    closed：正常放行；连续失败 failures 次，或最近 window 次请求的错误率达到
+    error_rate 时转为 open，拒绝请求；cooldown 秒后转为 half_open，
+    只放行一个试探请求，成功则恢复 closed，失败则重新 open。
+
+    Args:
+        failures: 连续失败次数阈值
+        error_rate: 错误率阈值
+        window: 计算错误率的最近请求数
+        cooldown: open 之后等待的秒数
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failures: int, error_rate: float, window: int, cooldown: float):
+        self.failures = failures
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.outcomes = deque(maxlen=window)  # True 表示失败
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def available(self) -> bool:
+        """是否可以放行请求（不改变状态）"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return not self.trial_in_flight
+
+    def acquire(self) -> None:
+        """请求被放行时调用：open 冷却结束后转为 half_open 并占用试探名额"""
+        if self.state == self.OPEN:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            self.trial_in_flight = True
+
+    def release(self) -> None:
+        """被放行的请求没有结果（被取消或对冲落败）时归还试探名额"""
+        self.trial_in_flight = False
+
+    def on_success(self) -> None:
+        self.consecutive_failures = 0
+        self.outcomes.append(False)
+        self.trial_in_flight = False
+        if self.state != self.CLOSED:
+            logger.info("上游熔断恢复")
+            self.state = self.CLOSED
+            self.outcomes.clear()
+
+    def on_failure(self) -> None:
+        self.consecutive_failures += 1
+        self.outcomes.append(True)
+        self.trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.should_trip():
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def should_trip(self) -> bool:
+        if self.consecutive_failures >= self.failures:
+            return True
+        # 样本太少时错误率没有意义
+        return (
+            len(self.outcomes) >= self.outcomes.maxlen // 2
+            and self.get_error_rate() >= self.error_rate
+        )
+
+    def get_error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class Endpoint:
+    """一个上游：地址、密钥、服务的模型，以及延迟样本和熔断器
+
+    Args:
+        name: 名称（用于日志和指标）
+        base_url: 上游地址
+        api_key: API Key
+        models: 只服务这些模型，为空时服务所有模型
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        api_key: str = None,
+        models: Optional[List[str]] = None,
+    ):
+        router_config = OPENAI_CONFIG["router"]
+        self.name = name
+        self.client = OpenAIClient(base_url, api_key)
+        self.models = set(models) if models else None
+        self.breaker = CircuitBreaker(
+            router_config["breaker_failures"],
+            router_config["breaker_error_rate"],
+            router_config["breaker_window"],
+            router_config["breaker_cooldown"],
+        )
+        self.ttfts = deque(maxlen=router_config["latency_window"])
+        self.stats = {"requests": 0, "errors": 0, "hedges": 0}
+        UPSTREAM_CIRCUIT_STATE.labels(name).set_function(
+            lambda: ("closed", "open", "half_open").index(self.breaker.state)
+        )
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or model in self.models
+
+    def observe_ttft(self, ttft: float) -> None:
+        self.ttfts.append(ttft)
+        UPSTREAM_TTFT_SECONDS.labels(self.name).observe(ttft)
+
+    def ttft_percentile(self, percentile: float) -> Optional[float]:
+        """首个片段延迟的分位数，样本不足时返回None"""
+        if len(self.ttfts) < 20:
+            return None
+        ordered = sorted(self.ttfts)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+    def hedge_delay(self) -> float:
+        """等待首个片段多久后发出对冲请求"""
+        config = OPENAI_CONFIG["router"]
+        delay = self.ttft_percentile(config["hedge_percentile"])
+        if delay is None:
+            return config["hedge_max_delay"]
+        return min(max(delay, config["hedge_min_delay"]), config["hedge_max_delay"])
+
+    def get_stats(self) -> Dict[str, Any]:
+        ordered = sorted(self.ttfts)
+        return {
+            "name": self.name,
+            "base_url": self.client.base_url,
+            "models": sorted(self.models) if self.models else None,
+            **self.stats,
+            "circuit": self.breaker.state,
+            "error_rate": self.breaker.get_error_rate(),
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "ttft_p50": ordered[len(ordered) // 2] if ordered else None,
+            "ttft_p95": self.ttft_percentile(0.95),
+        }
+
+
+class _Attempt:
+    """对一个上游的一次流式请求，创建后立即开始等待第一个增量"""
+
+    def __init__(self, endpoint: Endpoint, messages, model):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.stream = endpoint.client.chat_events(messages, model)
+        self.first = asyncio.ensure_future(self.stream.__anext__())
+        endpoint.stats["requests"] += 1
+        endpoint.breaker.acquire()
+
+    async def close(self) -> None:
+        """中止请求（关闭生成器使其中止上游请求）"""
+        if not self.first.done():
+            self.first.cancel()
+        # 等待任务结束后才能关闭生成器，异常已由调用方处理或不再需要
+        await asyncio.wait([self.first])
+        if not self.first.cancelled():
+            self.first.exception()
+        await self.stream.aclose()
+
+
+class ProviderRouter:
+    """在多个上游之间路由流式对话请求
+
+    - 按配置顺序选择服务该模型、未熔断的上游（配置在前的为主上游）；
+    - 收到第一个增量之前失败（连接失败、HTTP 错误等）时按指数退避重试，
+      优先换一个没试过的上游；收到第一个增量之后失败直接抛出，
+      已输出的内容不能撤回；
+    - 开启对冲时，首个增量迟迟不到（超过该上游首字延迟的分位数）就向另一个
+      上游再发一次，先返回的胜出，另一个被中止。对冲会增加上游请求量，默认关闭。
+
+    没有配置 providers 时只有一个使用 base_url / api_key 的上游。
+    """
+
+    endpoints: List[Endpoint] = []
+    stats = {"requests": 0, "retries": 0, "hedges": 0, "hedges_won": 0}
+
+    @classmethod
+    def initialize(cls, providers: Optional[List[Dict[str, Any]]] = None) -> None:
+        """根据配置创建上游列表
+
+        Args:
+            providers: 上游配置列表（name、base_url、api_key、models），默认读取配置
+        """
+        if providers is None:
+            providers = OPENAI_CONFIG["providers"] or [
+                {
+                    "name": "default",
+                    "base_url": OPENAI_CONFIG["base_url"],
+                    "api_key": OPENAI_CONFIG["api_key"],
+                }
+            ]
+        cls.endpoints = [
+            Endpoint(
+                provider.get("name") or f"provider{index}",
+                provider["base_url"],
+                provider.get("api_key"),
+                provider.get("models"),
+            )
+            for index, provider in enumerate(providers)
+        ]
+        logger.info(
+            f"上游路由初始化成功: {[endpoint.name for endpoint in cls.endpoints]}"
+        )
+
+    @classmethod
+    def choose(
+        cls, model: str, tried: List[Endpoint], allow_tried: bool = True
+    ) -> Optional[Endpoint]:
+        """选择上游：优先没有试过的，其次按配置顺序
+
+        Args:
+            model: 模型ID
+            tried: 本次对话已经请求过的上游
+            allow_tried: 没有其他可用上游时是否可以再次选择已请求过的上游
+
+        Returns:
+            Optional[Endpoint]: 选中的上游，没有可用上游时返回None
+        """
+        serving = [endpoint for endpoint in cls.endpoints if endpoint.serves(model)]
+        # 没有上游声明服务该模型时，交给所有上游尝试
+        candidates = [
+            endpoint
+            for endpoint in (serving or cls.endpoints)
+            if endpoint.breaker.available() and (allow_tried or endpoint not in tried)
+        ]
+        if not candidates:
+            return None
+        return min(
+            candidates,
+            key=lambda endpoint: (endpoint in tried, cls.endpoints.index(endpoint)),
+        )
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """换一个上游或稍后重试是否可能成功"""
+        return not (
+            isinstance(error, HTTPClientError) and error.code in NON_RETRYABLE_CODES
+        )
+
+    @classmethod
+    def backoff(cls, retry: int) -> float:
+        """第 retry 次重试前等待的秒数（指数退避，带随机抖动）"""
+        base = OPENAI_CONFIG["router"]["retry_backoff"] * 2 ** (retry - 1)
+        return base * random.uniform(0.5, 1.5)
+
+    @classmethod
+    async def chat_events(cls, messages, model):
+        """流式对话（异步生成器），与 OpenAIClient.chat_events 的输出相同
+
+        Yields:
+            ChatDelta: 增量
+
+        Raises:
+            UpstreamUnavailable: 没有可用的上游
+            Exception: 重试次数用完后最后一次失败的异常
+        """
+        if not cls.endpoints:
+            cls.initialize()
+
+        config = OPENAI_CONFIG["router"]
+        cls.stats["requests"] += 1
+        attempts: List[_Attempt] = []
+        tried: List[Endpoint] = []
+        winner = None
+        failures = 0
+        hedged = not config["hedge"]
+        last_error = None
+        try:
+            # 等待第一个增量：失败时重试，超时时对冲
+            while winner is None:
+                if not attempts:
+                    if failures >= config["max_attempts"]:
+                        raise last_error
+                    if failures:
+                        cls.stats["retries"] += 1
+                        UPSTREAM_RETRIES.inc()
+                        await asyncio.sleep(cls.backoff(failures))
+                    endpoint = cls.choose(model, tried)
+                    if endpoint is None:
+                        raise last_error or UpstreamUnavailable("没有可用的上游服务")
+                    tried.append(endpoint)
+                    attempts.append(_Attempt(endpoint, messages, model))
+
+                timeout = None
+                if not hedged:
+                    primary = attempts[0]
+                    timeout = max(
+                        0.0,
+                        primary.endpoint.hedge_delay()
+                        - (time.perf_counter() - primary.start),
+                    )
+                done, _ = await asyncio.wait(
+                    [attempt.first for attempt in attempts],
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+
+                if not done:
+                    # 首个增量超时：向另一个上游发出对冲请求
+                    hedged = True
+                    endpoint = cls.choose(model, tried, allow_tried=False)
+                    if endpoint is not None:
+                        logger.info(
+                            f"上游 {attempts[0].endpoint.name} 首字超时，"
+                            f"对冲请求 {endpoint.name}"
+                        )
+                        cls.stats["hedges"] += 1
+                        endpoint.stats["hedges"] += 1
+                        tried.append(endpoint)
+                        attempts.append(_Attempt(endpoint, messages, model))
+                    continue
+
+                for attempt in list(attempts):
+                    if attempt.first not in done:
+                        continue
+                    error = attempt.first.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        winner = attempt
+                        break
+                    attempts.remove(attempt)
+                    await attempt.stream.aclose()
+                    failures += 1
+                    last_error = error
+                    if not cls.is_retryable(error):
+                        attempt.endpoint.breaker.release()
+                        raise error
+                    cls._record_failure(attempt.endpoint, error)
+
+            # 其他请求（对冲落败的）中止
+            for attempt in attempts:
+                if attempt is not winner:
+                    await attempt.close()
+                    attempt.endpoint.breaker.release()
+                    UPSTREAM_ATTEMPTS.labels(attempt.endpoint.name, "hedge_lost").inc()
+            if len(attempts) > 1:
+                won = winner is not attempts[0]
+                cls.stats["hedges_won"] += won
+                UPSTREAM_HEDGES.labels("won" if won else "lost").inc()
+            attempts = [winner]
+
+            endpoint = winner.endpoint
+            endpoint.observe_ttft(time.perf_counter() - winner.start)
+            if winner.first.exception() is None:
+                yield winner.first.result()
+                try:
+                    async for delta in winner.stream:
+                        yield delta
+                except Exception as e:
+                    # 已经输出了内容，不能再换上游
+                    cls._record_failure(endpoint, e)
+                    raise
+            endpoint.breaker.on_success()
+            UPSTREAM_ATTEMPTS.labels(endpoint.name, "ok").inc()
+        finally:
+            # 被取消或调用方提前结束时中止所有进行中的请求
+            for attempt in attempts:
+                await attempt.close()
+                attempt.endpoint.breaker.release()
+
+    @classmethod
+    def _record_failure(cls, endpoint: Endpoint, error: Exception) -> None:
+        endpoint.stats["errors"] += 1
+        endpoint.breaker.on_failure()
+        UPSTREAM_ATTEMPTS.labels(endpoint.name, "error").inc()
+        logger.warning(
+            f"上游 {endpoint.name} 请求失败: {str(error)}，"
+            f"熔断状态: {endpoint.breaker.state}"
+        )
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """路由统计和各上游的状态"""
+        return {
+            **cls.stats,
+            "endpoints": [endpoint.get_stats() for endpoint in cls.endpoints],
+        }
@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict
+from bson.timestamp import Timestamp
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+from tornado.ioloop import IOLoop
+from tornado.queues import Queue
+from config.settings import SETTINGS
+from utils.database import Database
+from utils.async_database import AsyncDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class LocalBroker:
+    """进程内广播，单进程部署时的默认实现"""
+
+    def __init__(self):
+        self.subscribers = {}
+        self.loop = None
+
+    def start(self) -> None:
+        """在当前 IOLoop 上开始分发消息"""
+        self.loop = IOLoop.current()
+
+    def stop(self) -> None:
+        """停止分发消息"""
+
+    def subscribe(self, channel: str, callback: Callable[[Dict], Any]) -> None:
+        """订阅频道，回调在 IOLoop 线程中执行"""
+        self.subscribers.setdefault(channel, []).append(callback)
+
+    def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        """发布消息（不阻塞）"""
+        self.loop.add_callback(self.dispatch, channel, message)
+
+    def dispatch(self, channel: str, message: Dict[str, Any]) -> None:
+        """把消息交给本进程内该频道的订阅者"""
+        for callback in self.subscribers.get(channel, []):
+            try:
+                callback(message)
+            except Exception as e:
+                logger.error(f"处理频道消息失败: {channel}, {str(e)}")
+
+
+class MongoBroker(LocalBroker):
+    """基于 MongoDB capped collection 的跨进程广播
+
+    没有 Redis 时的替代方案：消息按顺序写入 capped collection，
+    每个进程在后台线程中用 tailable cursor 读取新消息（效果类似 change stream，
+    但不要求副本集）。写入在队列中批量进行，保证本进程发布的消息顺序不变。
+
+    Args:
+        db: pymongo Database
+        size: capped collection 的大小（字节）
+    """
+
+    collection_name = "pubsub"
+
+    def __init__(self, db, size: int):
+        super().__init__()
+        self.db = db
+        self.size = size
+        self.queue = Queue()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        super().start()
+        try:
+            self.db.create_collection(self.collection_name, capped=True, size=self.size)
+        except CollectionInvalid:
+            pass  # 已存在
+        collection = self.db[self.collection_name]
+
+        # 只读取启动之后发布的消息；ts 为空 Timestamp 时由服务端填入写入时间
+        last = collection.find_one(sort=[("$natural", -1)])
+        if last is None:
+            collection.insert_one({"ts": Timestamp(0, 0), "channel": None})
+            last = collection.find_one(sort=[("$natural", -1)])
+        self._thread = threading.Thread(
+            target=self._tail, args=(last["ts"],), name="pubsub", daemon=True
+        )
+        self._thread.start()
+        self.loop.spawn_callback(self._writer)
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        # 消息体序列化为字符串，避免 $oid 等字段名不能写入 MongoDB
+        self.queue.put_nowait(
+            {"ts": Timestamp(0, 0), "channel": channel, "message": json.dumps(message)}
+        )
+
+    async def _writer(self) -> None:
+        """按发布顺序批量写入"""
+        collection = self.db[self.collection_name]
+        while not self._stopped.is_set():
+            docs = [await self.queue.get()]
+            while self.queue.qsize():
+                docs.append(self.queue.get_nowait())
+            try:
+                await AsyncDatabase.run(collection.insert_many, docs, ordered=True)
+            except PyMongoError as e:
+                logger.error(f"发布频道消息失败: {str(e)}")
+
+    def _tail(self, last_ts: Timestamp) -> None:
+        """后台线程：持续读取新消息并交给 IOLoop 分发"""
+        collection = self.db[self.collection_name]
+        while not self._stopped.is_set():
+            try:
+                cursor = collection.find(
+                    {"ts": {"$gt": last_ts}},
+                    cursor_type=CursorType.TAILABLE_AWAIT,
+                    max_await_time_ms=1000,
+                )
+                while cursor.alive and not self._stopped.is_set():
+                    for doc in cursor:
+                        last_ts = doc["ts"]
+                        self.loop.add_callback(
+                            self.dispatch, doc["channel"], json.loads(doc["message"])
+                        )
+            except PyMongoError as e:
+                logger.error(f"读取频道消息失败: {str(e)}")
+            time.sleep(0.1)
+
+
+class PubSub:
+    """进程间消息广播
+
+    多进程部署时，同一用户的连接可能落在不同的工作进程上，
+    取消和恢复生成等请求通过广播交给持有该生成的进程处理。
+    后端由 SETTINGS["pubsub"]["backend"] 选择：local（仅进程内）或 mongo。
+    """
+
+    broker = None
+    worker_id = None
+
+    @classmethod
+    def initialize(cls, backend: str = None) -> None:
+        """创建并启动广播后端（需在 fork 之后、数据库初始化之后调用）
+
+        Args:
+            backend: local 或 mongo，默认读取配置
+        """
+        if cls.broker is not None:
+            return
+
+        backend = backend or SETTINGS["pubsub"]["backend"]
+        cls.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        if backend == "mongo":
+            cls.broker = MongoBroker(
+                Database.ensure_connection(), SETTINGS["pubsub"]["mongo_size"]
+            )
+        elif backend == "local":
+            cls.broker = LocalBroker()
+        else:
+            raise ValueError(f"不支持的广播后端: {backend}")
+        cls.broker.start()
+        logger.info(f"消息广播初始化成功，后端: {backend}，进程: {cls.worker_id}")
+
+    @classmethod
+    def cleanup(cls) -> None:
+        """停止广播后端"""
+        if cls.broker is not None:
+            cls.broker.stop()
+            cls.broker = None
+
+    @classmethod
+    def is_local(cls) -> bool:
+        """是否只在进程内广播（消息不会到达其他工作进程）"""
+        return cls.broker is None or type(cls.broker) is LocalBroker
+
+    @classmethod
+    def worker_channel(cls, worker_id: str = None) -> str:
+        """发给指定工作进程的频道"""
+        return f"worker:{worker_id or cls.worker_id}"
+
+    @classmethod
+    def subscribe(cls, channel: str, callback: Callable[[Dict], Any]) -> None:
+        """订阅频道"""
+        cls.broker.subscribe(channel, callback)
+
+    @classmethod
+    def publish(cls, channel: str, message: Dict[str, Any]) -> None:
+        """发布消息"""
+        cls.broker.publish(channel, message)
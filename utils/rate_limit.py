@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from pymongo import ReturnDocument
+from config.settings import SETTINGS
+from utils.database import Database
+from utils.async_database import AsyncDatabase
+from utils.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_DECISIONS = Counter(
+    "mychat_rate_limit_decisions_total",
+    "限流结果（admitted / queued / rejected）",
+    ["result"],
+)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "mychat_rate_limit_wait_seconds", "排队等待令牌的时间"
+)
+
+# (桶的键, 每秒补充的令牌数, 容量, 范围)
+Bucket = Tuple[str, float, float, str]
+
+
+class RateLimited(Exception):
+    """请求超出限流且无法在允许的等待时间内获得令牌
+
+    Attributes:
+        retry_after: 建议的重试等待时间（秒）
+        scope: 触发限流的范围（user / model / global）
+    """
+
+    def __init__(self, retry_after: float, scope: str):
+        self.retry_after = retry_after
+        self.scope = scope
+        super().__init__(f"请求过于频繁，请在{retry_after:.0f}秒后重试")
+
+    def to_dict(self) -> Dict:
+        """返回给客户端的结构化错误"""
+        return {
+            "error": str(self),
+            "code": "rate_limited",
+            "scope": self.scope,
+            "retry_after": round(self.retry_after, 1),
+        }
+
+
+class LocalBucketStore:
+    """进程内的令牌桶，单进程部署时的默认实现"""
+
+    # 超过该数量时清理已经补满的桶（补满的桶与不存在等价）
+    max_buckets = 10000
+
+    def __init__(self):
+        self.buckets = {}  # 键 -> [令牌数, 更新时间, 速率, 容量]
+
+    def reserve(
+        self, buckets: List[Bucket], max_wait: float, cost: float = 1
+    ) -> Tuple[bool, float, str]:
+        """从所有桶中各预订 cost 个令牌
+
+        令牌数可以透支为负数，透支部分按速率补足所需的时间就是预订者的等待时间，
+        因此排队的请求按先后顺序在各自的时刻放行。任何一个桶的等待时间超过
+        max_wait 时都不预订。
+
+        Returns:
+            Tuple[bool, float, str]: (是否已预订, 等待秒数, 等待最久的范围)；
+            未预订时等待秒数为建议的 retry_after
+        """
+        now = time.monotonic()
+        states = []
+        wait, scope = 0.0, ""
+        for key, rate, capacity, bucket_scope in buckets:
+            state = self.buckets.get(key)
+            if state is None:
+                state = self.buckets[key] = [capacity, now, rate, capacity]
+            state[0] = min(capacity, state[0] + (now - state[1]) * rate)
+            state[1:] = [now, rate, capacity]
+            bucket_wait = max(0.0, (cost - state[0]) / rate)
+            if bucket_wait > wait:
+                wait, scope = bucket_wait, bucket_scope
+            states.append(state)
+
+        if wait > max_wait:
+            return False, wait, scope
+        for state in states:
+            state[0] -= cost
+        if len(self.buckets) > self.max_buckets:
+            self._prune(now)
+        return True, wait, scope
+
+    def release(self, buckets: List[Bucket], cost: float = 1) -> None:
+        """退回预订的令牌（排队时被取消）"""
+        for key, _, capacity, _ in buckets:
+            state = self.buckets.get(key)
+            if state is not None:
+                state[0] = min(capacity, state[0] + cost)
+
+    def _prune(self, now: float) -> None:
+        """删除已经补满的桶
+
+        每个桶按自己的速率计算补满所需的时间 (容量 - 令牌数) / 速率，
+        透支（排队中）的桶要等透支部分也补足后才会删除。
+        """
+        self.buckets = {
+            key: state
+            for key, state in self.buckets.items()
+            if now - state[1] < (state[3] - state[0]) / state[2]
+        }
+
+
+class MongoBucketStore:
+    """基于 MongoDB 的共享令牌桶，多进程/多机部署时使用
+
+    每个桶是 rate_limits 集合中的一个文档，补充和预订在一次 findAndModify
+    （更新管道）中完成，多个工作进程并发预订也不会超发；多个桶依次预订，
+    某个桶超出等待上限时退回已预订的令牌。空闲的桶由 TTL 索引删除。
+
+    Args:
+        db: pymongo Database
+    """
+
+    def __init__(self, db):
+        self.collection = db.rate_limits
+
+    def reserve(
+        self, buckets: List[Bucket], max_wait: float, cost: float = 1
+    ) -> Tuple[bool, float, str]:
+        """同 LocalBucketStore.reserve（阻塞，需在线程池中调用）"""
+        reserved = []
+        wait, scope = 0.0, ""
+        for bucket in buckets:
+            granted, bucket_wait = self._reserve_one(bucket, max_wait, cost)
+            if not granted:
+                self.release(reserved, cost)
+                return False, bucket_wait, bucket[3]
+            if bucket_wait > wait:
+                wait, scope = bucket_wait, bucket[3]
+            reserved.append(bucket)
+        return True, wait, scope
+
+    def release(self, buckets: List[Bucket], cost: float = 1) -> None:
+        """同 LocalBucketStore.release"""
+        for key, _, capacity, _ in buckets:
+            self.collection.update_one(
+                {"_id": key},
+                [
+                    {
+                        "$set": {
+                            "tokens": {"$min": [capacity, {"$add": ["$tokens", cost]}]}
+                        }
+                    }
+                ],
+            )
+
+    def _reserve_one(
+        self, bucket: Bucket, max_wait: float, cost: float
+    ) -> Tuple[bool, float]:
+        key, rate, capacity, _ = bucket
+        now = time.time()
+        elapsed = {"$max": [0, {"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}]}
+        refilled = {
+            "$add": [{"$ifNull": ["$tokens", capacity]}, {"$multiply": [elapsed, rate]}]
+        }
+        document = self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {
+                    "$set": {
+                        "tokens": {"$min": [capacity, refilled]},
+                        "updated_at": now,
+                        # 补满所需时间之后桶与不存在等价，可由 TTL 索引删除
+                        "expires_at": datetime.utcnow()
+                        + timedelta(seconds=(capacity + rate * max_wait) / rate),
+                    }
+                },
+                {
+                    "$set": {
+                        "granted": {
+                            "$gte": [
+                                {"$subtract": ["$tokens", cost]},
+                                -rate * max_wait,
+                            ]
+                        }
+                    }
+                },
+                {
+                    "$set": {
+                        "tokens": {
+                            "$cond": [
+                                "$granted",
+                                {"$subtract": ["$tokens", cost]},
+                                "$tokens",
+                            ]
+                        }
+                    }
+                },
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        tokens = document["tokens"]
+        if document["granted"]:
+            return True, max(0.0, -tokens / rate)
+        return False, (cost - tokens) / rate
+
+
+class RateLimiter:
+    """生成请求的令牌桶限流（按用户、按模型、全局）
+
+    每个请求从用户桶、模型桶和全局桶中各预订一个令牌。令牌不足但在
+    max_wait_seconds 内能补足时排队，按预订顺序放行；
+    否则抛出 RateLimited（带 retry_after）。
+    速率为 0 的范围不限流。
+    """
+
+    store = None
+    shared = False
+
+    @classmethod
+    def initialize(cls, backend: str = None) -> None:
+        """创建令牌桶存储（多进程部署时需在 fork 之后、数据库初始化之后调用）
+
+        Args:
+            backend: local 或 mongo，默认读取配置
+        """
+        if cls.store is not None:
+            return
+
+        backend = backend or SETTINGS["rate_limit"]["backend"]
+        if backend == "mongo":
+            cls.store = MongoBucketStore(Database.ensure_connection())
+            cls.shared = True
+        elif backend == "local":
+            cls.store = LocalBucketStore()
+            cls.shared = False
+        else:
+            raise ValueError(f"不支持的限流后端: {backend}")
+        logger.info(f"限流初始化成功，后端: {backend}")
+
+    @classmethod
+    def buckets_for(cls, user_id: str, model: str) -> List[Bucket]:
+        """请求需要扣减的令牌桶"""
+        config = SETTINGS["rate_limit"]
+        model_rates = config["models"]
+        rules = [
+            (
+                f"user:{user_id}",
+                config["user_per_minute"],
+                config["user_burst"],
+                "user",
+            ),
+            (
+                f"model:{model}",
+                model_rates.get(model, config["model_per_minute"]),
+                config["model_burst"],
+                "model",
+            ),
+            ("global", config["global_per_minute"], config["global_burst"], "global"),
+        ]
+        return [
+            (key, per_minute / 60, max(burst, 1), scope)
+            for key, per_minute, burst, scope in rules
+            if per_minute > 0
+        ]
+
+    @classmethod
+    async def acquire(
+        cls,
+        user_id: str,
+        model: str,
+        max_wait: float = None,
+        on_queued: Optional[Callable[[float], None]] = None,
+    ) -> float:
+        """获取一次生成的许可，必要时排队等待
+
+        Args:
+            user_id: 用户ID
+            model: 模型ID
+            max_wait: 最多排队等待的秒数，默认读取配置
+            on_queued: 开始排队时调用，参数为预计等待的秒数
+
+        Returns:
+            float: 实际排队等待的秒数
+
+        Raises:
+            RateLimited: 无法在 max_wait 内获得许可
+        """
+        config = SETTINGS["rate_limit"]
+        if not config["enabled"]:
+            return 0.0
+        if cls.store is None:
+            cls.initialize()
+
+        buckets = cls.buckets_for(user_id, model)
+        if not buckets:
+            return 0.0
+
+        max_wait = config["max_wait_seconds"] if max_wait is None else max_wait
+        if cls.shared:
+            reserved, wait, scope = await AsyncDatabase.run(
+                cls.store.reserve, buckets, max_wait
+            )
+        else:
+            reserved, wait, scope = cls.store.reserve(buckets, max_wait)
+
+        if not reserved:
+            RATE_LIMIT_DECISIONS.labels("rejected").inc()
+            logger.info(
+                f"请求被限流: user={user_id}, model={model}, "
+                f"scope={scope}, retry_after={wait:.1f}s"
+            )
+            raise RateLimited(wait, scope)
+
+        if not wait:
+            RATE_LIMIT_DECISIONS.labels("admitted").inc()
+            return 0.0
+
+        # 已预订令牌，等到补足的时刻放行
+        RATE_LIMIT_DECISIONS.labels("queued").inc()
+        RATE_LIMIT_WAIT_SECONDS.observe(wait)
+        if on_queued is not None:
+            on_queued(wait)
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            # 排队时被取消，退回预订的令牌
+            if cls.shared:
+                asyncio.ensure_future(AsyncDatabase.run(cls.store.release, buckets))
+            else:
+                cls.store.release(buckets)
+            raise
+        return wait
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+from config.settings import SETTINGS
+from utils.cache import LRUCache
+from utils.database import utc_now
+from utils.async_database import AsyncDatabase
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "mychat_response_cache_lookups_total",
+    "回答缓存查询结果（memory / mongo / miss）",
+    ["result"],
+)
+RESPONSE_CACHE_STORES = Counter(
+    "mychat_response_cache_stores_total", "写入回答缓存的次数"
+)
+
+
+class ResponseCache:
+    """完全相同的请求直接返回缓存的回答
+
+    缓存键是（模型, 组装后的上下文消息, 请求参数）规范化 JSON 的 SHA-256，
+    系统提示词和历史消息任何变化都会得到不同的键。先查进程内的 LRU，
+    未命中再查 MongoDB 的 response_cache 集合（TTL 索引过期，多个工作进程共享）。
+    只缓存正常结束（finish_reason 为 stop）的完整回答。
+
+    默认关闭（上游采样有随机性，只适合确定性的提示词）；开启后会话可以通过
+    cache_responses: false 单独关闭。
+    """
+
+    memory = None
+    stats = {"memory_hits": 0, "mongo_hits": 0, "misses": 0, "stores": 0}
+
+    @classmethod
+    def initialize(cls) -> None:
+        """创建内存缓存"""
+        if cls.memory is None:
+            config = SETTINGS["response_cache"]
+            cls.memory = LRUCache(config["max_entries"], config["ttl"])
+
+    @staticmethod
+    def enabled_for(conversation: Dict[str, Any]) -> bool:
+        """该会话是否使用回答缓存"""
+        return SETTINGS["response_cache"]["enabled"] and conversation.get(
+            "cache_responses", True
+        )
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: List[Dict[str, Any]],
+        params: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """计算缓存键
+
+        Args:
+            model: 模型ID
+            messages: 发送给上游的消息（ContextBuilder 组装的结果）
+            params: 其他影响回答的请求参数（如 temperature）
+
+        Returns:
+            str: 十六进制的 SHA-256
+        """
+        canonical = json.dumps(
+            {
+                "model": model,
+                "messages": [
+                    {"role": message["role"], "content": message["content"]}
+                    for message in messages
+                ],
+                "params": params or {},
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    @classmethod
+    async def get(cls, key: str) -> Optional[Dict[str, Any]]:
+        """查询缓存
+
+        Returns:
+            Optional[Dict[str, Any]]: 包含 content 和 model 的缓存条目，未命中时返回None
+        """
+        if cls.memory is None:
+            cls.initialize()
+
+        entry = cls.memory.get(key)
+        if entry is not None:
+            cls.stats["memory_hits"] += 1
+            RESPONSE_CACHE_LOOKUPS.labels("memory").inc()
+            return entry
+
+        try:
+            entry = await AsyncDatabase.get_cached_response(key)
+        except Exception as e:
+            # 缓存不可用时按未命中处理
+            logger.error(f"查询回答缓存失败: {str(e)}")
+            entry = None
+        if entry is None:
+            cls.stats["misses"] += 1
+            RESPONSE_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+
+        cls.stats["mongo_hits"] += 1
+        RESPONSE_CACHE_LOOKUPS.labels("mongo").inc()
+        cls.memory.set(key, entry)
+        return entry
+
+    @classmethod
+    def put(cls, key: str, model: str, content: str) -> None:
+        """写入缓存（MongoDB 在后台写入，不等待）"""
+        if cls.memory is None:
+            cls.initialize()
+
+        entry = {"content": content, "model": model}
+        cls.memory.set(key, entry)
+        cls.stats["stores"] += 1
+        RESPONSE_CACHE_STORES.inc()
+
+        now = utc_now()
+        document = {
+            **entry,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=SETTINGS["response_cache"]["ttl"]),
+        }
+        future = asyncio.ensure_future(AsyncDatabase.set_cached_response(key, document))
+        # 写入失败只影响其他进程的命中率，取走异常避免“未获取的异常”日志
+        future.add_done_callback(lambda f: f.exception())
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """命中统计"""
+        lookups = (
+            cls.stats["memory_hits"] + cls.stats["mongo_hits"] + cls.stats["misses"]
+        )
+        hits = cls.stats["memory_hits"] + cls.stats["mongo_hits"]
+        return {
+            **cls.stats,
+            "enabled": SETTINGS["response_cache"]["enabled"],
+            "hit_rate": hits / lookups if lookups else None,
+            "memory": cls.memory.stats() if cls.memory is not None else None,
+        }
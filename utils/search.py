@@ -0,0 +1,143 @@
+import math
+import re
+import unicodedata
+from typing import List, Dict, Any, Tuple
+
+# 连续的CJK字符
+_CJK_RUN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]+")
+# 字母数字组成的词
+_WORD = re.compile(r"[^\W_]+")
+# 单条消息最多索引的词数，避免超长消息撑大索引
+MAX_INDEX_TOKENS = 2000
+# 单次查询最多使用的词数
+MAX_QUERY_TOKENS = 16
+
+
+def _normalize(text: str) -> str:
+    """统一全角/半角并转为小写"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def _split(text: str) -> Tuple[List[str], List[str]]:
+    """把文本拆成CJK片段和非CJK的词"""
+    cjk_runs = _CJK_RUN.findall(text)
+    words = _WORD.findall(_CJK_RUN.sub(" ", text))
+    return cjk_runs, words
+
+
+def index_tokens(text: str) -> List[str]:
+    """生成消息的索引词
+
+    中文等CJK文本没有空格分词，使用单字和相邻二字组合（bigram）；
+    其余文本按词切分。结果写入消息的 search_tokens 字段，
+    配合多键索引实现精确的词匹配查询。
+
+    Args:
+        text: 消息内容
+
+    Returns:
+        List[str]: 去重后的索引词
+    """
+    cjk_runs, words = _split(_normalize(text))
+    tokens = set(words)
+    for run in cjk_runs:
+        tokens.update(run)
+        tokens.update(run[i : i + 2] for i in range(len(run) - 1))
+        if len(tokens) >= MAX_INDEX_TOKENS:
+            break
+    return sorted(tokens)[:MAX_INDEX_TOKENS]
+
+
+def query_tokens(query: str) -> List[str]:
+    """生成查询词，所有查询词都需要出现在消息中
+
+    CJK片段长度大于1时使用bigram，否则使用单字。
+
+    Args:
+        query: 搜索关键词
+
+    Returns:
+        List[str]: 查询词
+    """
+    cjk_runs, words = _split(_normalize(query))
+    tokens = list(dict.fromkeys(words))
+    for run in cjk_runs:
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return list(dict.fromkeys(tokens))[:MAX_QUERY_TOKENS]
+
+
+def _terms(query: str) -> List[str]:
+    """用于计分和高亮的查询片段（完整的CJK片段和词）"""
+    cjk_runs, words = _split(_normalize(query))
+    return sorted(set(cjk_runs + words), key=len, reverse=True)
+
+
+def score(content: str, query: str) -> float:
+    """计算消息与查询的相关度
+
+    各查询片段按出现次数取对数累加，完整包含整个查询时额外加分，
+    并按消息长度做轻微惩罚，让短而集中的消息排在前面。
+
+    Args:
+        content: 消息内容
+        query: 搜索关键词
+
+    Returns:
+        float: 相关度分数
+    """
+    text = _normalize(content)
+    value = sum(math.log1p(text.count(term)) for term in _terms(query))
+    phrase = _normalize(query).strip()
+    if phrase and phrase in text:
+        value += 2.0
+    return value / (1.0 + math.log1p(len(text) / 500))
+
+
+def highlight(content: str, query: str, context: int = 60) -> Dict[str, Any]:
+    """生成带高亮位置的摘要
+
+    Args:
+        content: 消息内容
+        query: 搜索关键词
+        context: 第一个命中位置前后保留的字符数
+
+    Returns:
+        Dict[str, Any]: snippet 为摘要文本，highlights 为摘要中命中片段的
+            [起始, 结束) 位置列表
+    """
+    # NFKC 可能改变长度，无法对齐时仅做小写匹配
+    text = _normalize(content)
+    if len(text) != len(content):
+        text = content.lower()
+
+    spans = []
+    for term in _terms(query):
+        start = text.find(term)
+        while start != -1:
+            end = start + len(term)
+            if not any(s < end and start < e for s, e in spans):
+                spans.append((start, end))
+            start = text.find(term, end)
+    spans.sort()
+
+    if spans:
+        begin = max(0, spans[0][0] - context)
+        finish = min(len(content), spans[0][1] + context * 2)
+    else:
+        begin, finish = 0, min(len(content), context * 3)
+
+    snippet = content[begin:finish]
+    highlights = [
+        [start - begin, min(end, finish) - begin]
+        for start, end in spans
+        if begin <= start < finish
+    ]
+    if begin > 0:
+        snippet = "…" + snippet
+        highlights = [[start + 1, end + 1] for start, end in highlights]
+    if finish < len(content):
+        snippet += "…"
+    return {"snippet": snippet, "highlights": highlights}
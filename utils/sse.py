@@ -0,0 +1,200 @@
+import json
+from typing import Any, Dict, List, Optional
+
+# 上游在流结束时发送的数据
+DONE = b"[DONE]"
+
+
+class SSEEvent:
+    """一个完整的 SSE 事件
+
+    Args:
+        data: 各 data 行以换行连接后的内容（bytes，未解码）
+        event: event 字段，未指定时为 message
+        id: id 字段
+    """
+
+    __slots__ = ("data", "event", "id")
+
+    def __init__(self, data: bytes, event: str = "message", id: Optional[str] = None):
+        self.data = data
+        self.event = event
+        self.id = id
+
+    def __repr__(self):
+        return f"SSEEvent(event={self.event!r}, data={self.data!r})"
+
+
+class SSEDecoder:
+    """增量 SSE 解码器
+
+    直接在字节上工作：数据块中没有换行时只追加到缓冲区，有换行时一次性切分，
+    跨数据块的半行留到下一块；非 data 行不解码，data 行保持为 bytes，
+    每行只复制一次。支持多行 data、event / id 字段和注释行，
+    行尾可以是 \\n 或 \\r\\n。
+    """
+
+    def __init__(self):
+        self._pending = bytearray()
+        self._data = []
+        self._event = None
+        self._id = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """输入一个数据块，返回其中已完整的事件
+
+        Args:
+            chunk: 上游数据块，可以在任意位置截断
+
+        Returns:
+            List[SSEEvent]: 本次完整解析出的事件
+        """
+        if b"\n" not in chunk:
+            # 半行：只追加，不扫描已缓存的内容
+            self._pending += chunk
+            return []
+
+        if self._pending:
+            self._pending += chunk
+            chunk = self._pending
+        lines = chunk.split(b"\n")
+        self._pending = bytearray(lines.pop())
+
+        events = []
+        data = self._data
+        for line in lines:
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            if not line:
+                # 空行：分发当前事件，没有 data 的事件被忽略
+                if data:
+                    events.append(self._dispatch())
+                    data = self._data
+            elif line.startswith(b"data: "):
+                data.append(line[6:])
+            elif line.startswith(b"data:"):
+                data.append(line[5:])
+            elif not line.startswith(b":"):  # 冒号开头的是注释行
+                self._field(line)
+        return events
+
+    def close(self) -> List[SSEEvent]:
+        """流结束：解析缓冲区剩余内容，并分发缺少结尾空行的最后一个事件"""
+        events = self.feed(b"\n") if self._pending else []
+        if self._data:
+            events.append(self._dispatch())
+        return events
+
+    def _field(self, line: bytes) -> None:
+        """解析 data 以外的 field: value 行"""
+        name, _, value = line.partition(b":")
+        if value.startswith(b" "):
+            value = value[1:]
+        if name == b"data":
+            self._data.append(value)
+        elif name == b"event":
+            # 在 feed 中执行，无效字节不能中断整个流
+            self._event = value.decode("utf-8", errors="replace")
+        elif name == b"id":
+            self._id = value.decode("utf-8", errors="replace")
+
+    def _dispatch(self) -> SSEEvent:
+        """结束当前事件（id 在后续事件中保持）"""
+        data = self._data
+        event = SSEEvent(
+            data[0] if len(data) == 1 else b"\n".join(data),
+            self._event or "message",
+            self._id,
+        )
+        self._data = []
+        self._event = None
+        return event
+
+
+class ChatDelta:
+    """流式对话的一个增量
+
+    Attributes:
+        content: 本次新增的回复内容
+        role: 角色（通常只在第一个增量中出现）
+        finish_reason: 结束原因（stop / length / tool_calls 等）
+        tool_calls: 工具调用增量
+        usage: token 用量（通常只在最后一个增量中出现）
+        model: 上游实际使用的模型
+    """
+
+    __slots__ = ("content", "role", "finish_reason", "tool_calls", "usage", "model")
+
+    def __init__(
+        self,
+        content: Optional[str] = None,
+        role: Optional[str] = None,
+        finish_reason: Optional[str] = None,
+        tool_calls: Optional[List[Dict[str, Any]]] = None,
+        usage: Optional[Dict[str, int]] = None,
+        model: Optional[str] = None,
+    ):
+        self.content = content
+        self.role = role
+        self.finish_reason = finish_reason
+        self.tool_calls = tool_calls
+        self.usage = usage
+        self.model = model
+
+    def __repr__(self):
+        return (
+            f"ChatDelta(content={self.content!r}, finish_reason={self.finish_reason!r}, "
+            f"usage={self.usage!r})"
+        )
+
+
+class UpstreamError(Exception):
+    """上游在流中返回了错误事件"""
+
+
+def parse_chat_event(event: SSEEvent) -> Optional[ChatDelta]:
+    """把 chat.completion.chunk 事件解析为增量
+
+    Args:
+        event: SSE 事件
+
+    Returns:
+        Optional[ChatDelta]: 增量，[DONE] 时返回None
+
+    Raises:
+        UpstreamError: 事件中包含 error 字段
+        ValueError: data 不是合法的 UTF-8 JSON 对象
+    """
+    if event.data.strip() == DONE:
+        return None
+
+    # json.loads 允许前后的空白（如 "data:  {...}"），拒绝 JSON 之后的多余内容
+    payload = json.loads(event.data.decode("utf-8"))
+    if not isinstance(payload, dict):
+        raise ValueError(f"事件数据不是 JSON 对象: {type(payload).__name__}")
+    if "error" in payload:
+        error = payload["error"]
+        message = error.get("message") if isinstance(error, dict) else error
+        raise UpstreamError(f"上游返回错误: {message}")
+
+    choices = payload.get("choices")
+    if not choices:
+        # 只有 usage 的最后一个事件
+        return ChatDelta(
+            None, None, None, None, payload.get("usage"), payload.get("model")
+        )
+
+    choice = choices[0] if isinstance(choices, list) else None
+    if not isinstance(choice, dict):
+        raise ValueError("事件的 choices 格式无效")
+    message = choice.get("delta") or {}
+    if not isinstance(message, dict):
+        raise ValueError("事件的 delta 格式无效")
+    return ChatDelta(
+        message.get("content"),
+        message.get("role"),
+        choice.get("finish_reason"),
+        message.get("tool_calls"),
+        payload.get("usage"),
+        payload.get("model"),
+    )
@@ -0,0 +1,76 @@
+import logging
+from tornado.ioloop import IOLoop
+
+logger = logging.getLogger(__name__)
+
+
+class CoalescingWriter:
+    """合并流式片段后再发送的写入器
+
+    上游每个 SSE 事件通常只有一两个字符，逐个发送会产生大量很小的
+    WebSocket 帧。写入器把片段缓存起来，在时间窗口到期或累计字节数达到
+    阈值时合并为一帧发送；第一个片段立即发送，不增加首字延迟。
+
+    时间窗口会根据发送背压自适应：上一帧还未写完（客户端或网络较慢）时
+    窗口加倍，直到 max_interval；写入顺畅时恢复为初始窗口。
+
+    Args:
+        send: 发送函数，参数为合并后的文本，可返回写入完成的 Future
+        interval: 初始时间窗口（秒），为 0 时不合并
+        max_bytes: 缓存达到该字节数时立即发送
+        max_interval: 自适应时间窗口的上限（秒）
+    """
+
+    def __init__(self, send, interval: float, max_bytes: int, max_interval: float):
+        self.send = send
+        self.base_interval = interval
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.max_interval = max(max_interval, interval)
+        self.frames = 0
+        self.chunks = 0
+        self._buffer = []
+        self._size = 0
+        self._timer = None
+        self._pending = None
+        self._started = False
+
+    def write(self, content: str) -> None:
+        """写入一个片段"""
+        self.chunks += 1
+        self._buffer.append(content)
+        self._size += len(content.encode("utf-8"))
+
+        if not self._started or self.interval <= 0 or self._size >= self.max_bytes:
+            self._started = True
+            self.flush()
+        elif self._timer is None:
+            self._timer = IOLoop.current().call_later(self.interval, self.flush)
+
+    def flush(self) -> None:
+        """立即发送缓存的片段"""
+        if self._timer is not None:
+            IOLoop.current().remove_timeout(self._timer)
+            self._timer = None
+        if not self._buffer:
+            return
+
+        self._adapt()
+        content = "".join(self._buffer)
+        self._buffer = []
+        self._size = 0
+        self.frames += 1
+        self._pending = self.send(content)
+
+    def _adapt(self) -> None:
+        """根据上一帧是否已写完调整时间窗口"""
+        if self.base_interval <= 0:
+            return
+        if self._pending is not None and not self._pending.done():
+            self.interval = min(self.interval * 2, self.max_interval)
+        else:
+            self.interval = self.base_interval
+
+    def close(self) -> None:
+        """发送剩余片段并停止计时器"""
+        self.flush()
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from tornado.ioloop import PeriodicCallback
+from config.settings import SETTINGS
+from utils.database import utc_now
+from utils.async_database import AsyncDatabase
+
+logger = logging.getLogger(__name__)
+
+# 累加的计数字段（$inc），其余为最大值字段（$max）
+COUNTER_FIELDS = (
+    "requests",
+    "errors",
+    "cancelled",
+    "cached",
+    "estimated",
+    "prompt_tokens",
+    "completion_tokens",
+    "ttft_total",
+    "ttft_count",
+    "duration_total",
+)
+MAX_FIELDS = ("ttft_max", "duration_max")
+
+# 汇总接口支持的分组方式
+GROUP_FIELDS = ("user_id", "model", "conversation_id")
+
+
+def usage_hour(timestamp: datetime = None) -> datetime:
+    """用量按小时汇总，返回所在小时的起始时间（UTC）"""
+    timestamp = timestamp or utc_now()
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+class UsageTracker:
+    """每轮对话的用量统计
+
+    每轮记录首字延迟、总生成时间、输入/输出 token 数和上游状态，先在内存中按
+    （小时, 用户, 会话, 模型）累加，由后台定期用一次 bulk_write 汇总到 usage
+    集合（$inc / $max 的 upsert，多个工作进程各自汇总互不覆盖）。
+    """
+
+    buckets: Dict[tuple, Dict[str, Any]] = {}
+    stats = {"records": 0, "rollups": 0, "failures": 0}
+    _periodic = None
+    _flushing = None
+
+    @classmethod
+    def initialize(cls, rollup_interval: float = None) -> None:
+        """开始定期汇总
+
+        Args:
+            rollup_interval: 汇总间隔（秒），默认读取配置
+        """
+        if cls._periodic is not None:
+            return
+
+        rollup_interval = rollup_interval or SETTINGS["usage"]["rollup_interval"]
+        cls._periodic = PeriodicCallback(cls.flush, rollup_interval * 1000)
+        cls._periodic.start()
+        logger.info(f"用量统计初始化成功，汇总间隔: {rollup_interval}s")
+
+    @classmethod
+    def cleanup(cls) -> None:
+        """停止定期汇总（剩余数据由 flush 写入）"""
+        if cls._periodic is not None:
+            cls._periodic.stop()
+            cls._periodic = None
+
+    @classmethod
+    def record(
+        cls,
+        user_id: str,
+        conversation_id: str,
+        model: str,
+        status: str,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        ttft: Optional[float] = None,
+        duration: float = 0.0,
+        upstream_status: Optional[int] = None,
+        estimated: bool = False,
+    ) -> None:
+        """记录一轮对话
+
+        Args:
+            user_id: 用户ID
+            conversation_id: 会话ID
+            model: 模型ID
+            status: ok、error、cancelled 或 cached（回答缓存命中，不请求上游）
+            prompt_tokens: 输入 token 数
+            completion_tokens: 输出 token 数
+            ttft: 首字延迟（秒），没有收到任何内容时为None
+            duration: 总生成时间（秒）
+            upstream_status: 上游 HTTP 状态码，未收到响应时为None
+            estimated: token 数是否为本地估算（上游未返回 usage）
+        """
+        key = (usage_hour(), user_id, conversation_id, model)
+        bucket = cls.buckets.get(key)
+        if bucket is None:
+            bucket = cls.buckets[key] = dict.fromkeys(COUNTER_FIELDS + MAX_FIELDS, 0)
+            bucket["statuses"] = {}
+
+        bucket["requests"] += 1
+        bucket["errors"] += status == "error"
+        bucket["cancelled"] += status == "cancelled"
+        bucket["cached"] += status == "cached"
+        bucket["estimated"] += estimated
+        bucket["prompt_tokens"] += prompt_tokens
+        bucket["completion_tokens"] += completion_tokens
+        bucket["duration_total"] += duration
+        bucket["duration_max"] = max(bucket["duration_max"], duration)
+        if ttft is not None:
+            bucket["ttft_total"] += ttft
+            bucket["ttft_count"] += 1
+            bucket["ttft_max"] = max(bucket["ttft_max"], ttft)
+        upstream_status = str(upstream_status or "none")
+        bucket["statuses"][upstream_status] = (
+            bucket["statuses"].get(upstream_status, 0) + 1
+        )
+        cls.stats["records"] += 1
+
+    @classmethod
+    async def flush(cls) -> None:
+        """把内存中的累加值汇总到数据库，失败时合并回内存等待下次汇总"""
+        if cls._flushing is not None:
+            # 已在汇总时等它完成，保证返回后之前的记录都已写入
+            await asyncio.wait([cls._flushing])
+        if not cls.buckets:
+            return
+
+        rows = [
+            {
+                "hour": hour,
+                "user_id": user_id,
+                "conversation_id": conversation_id,
+                "model": model,
+                **bucket,
+            }
+            for (hour, user_id, conversation_id, model), bucket in cls.buckets.items()
+        ]
+        buckets, cls.buckets = cls.buckets, {}
+        start = time.perf_counter()
+        try:
+            cls._flushing = asyncio.ensure_future(AsyncDatabase.rollup_usage(rows))
+            await cls._flushing
+            cls.stats["rollups"] += 1
+            logger.debug(
+                f"用量汇总完成: {len(rows)} 行, "
+                f"{(time.perf_counter() - start) * 1000:.1f}ms"
+            )
+        except Exception as e:
+            cls.stats["failures"] += 1
+            logger.error(f"用量汇总失败，下次重试: {str(e)}")
+            for key, bucket in buckets.items():
+                cls._merge(key, bucket)
+        finally:
+            cls._flushing = None
+
+    @classmethod
+    async def get_summary(
+        cls, group_by: str, days: float, user_id: str = None, limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """按用户、模型或会话汇总用量（先写入本进程尚未汇总的记录）
+
+        Args:
+            group_by: user_id、model 或 conversation_id
+            days: 统计最近多少天
+            user_id: 只统计该用户
+            limit: 最多返回的分组数（按总 token 数倒序）
+
+        Returns:
+            List[Dict[str, Any]]: 各分组的请求数、token 数、平均延迟等
+        """
+        if group_by not in GROUP_FIELDS:
+            raise ValueError(f"不支持的分组方式: {group_by}")
+
+        await cls.flush()
+        since = usage_hour() - timedelta(days=days)
+        return await AsyncDatabase.get_usage_summary(group_by, since, user_id, limit)
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """统计信息"""
+        return {**cls.stats, "pending_buckets": len(cls.buckets)}
+
+    @classmethod
+    def _merge(cls, key: tuple, bucket: Dict[str, Any]) -> None:
+        """把汇总失败的累加值合并回内存"""
+        current = cls.buckets.get(key)
+        if current is None:
+            cls.buckets[key] = bucket
+            return
+        for field in COUNTER_FIELDS:
+            current[field] += bucket[field]
+        for field in MAX_FIELDS:
+            current[field] = max(current[field], bucket[field])
+        for code, count in bucket["statuses"].items():
+            current["statuses"][code] = current["statuses"].get(code, 0) + count
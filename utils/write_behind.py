@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Tuple
+from config.settings import SETTINGS
+from utils.database import Database
+from utils.async_database import AsyncDatabase
+from utils.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_WRITE_PENDING = Gauge("mychat_message_write_pending", "后写队列中的消息数")
+MESSAGE_FLUSH_SECONDS = Histogram(
+    "mychat_message_flush_seconds", "一批消息的写入时间（含重试）"
+)
+MESSAGE_FLUSH_SIZE = Histogram(
+    "mychat_message_flush_size",
+    "每批写入的消息数",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+MESSAGES_DROPPED = Counter("mychat_messages_dropped_total", "重试后仍写入失败的消息")
+
+
+class MessageWriter:
+    """消息的后写队列
+
+    聊天过程中产生的消息先写入缓存并进入队列，由后台任务每隔 flush_interval
+    把所有会话积累的消息合并为一次 insert_many，会话的最后消息时间合并为一次
+    bulk_write。durability 为 ack 时 create_message 等到所在批次写入成功才返回；
+    为 async 时立即返回，写入失败会重试 max_retries 次。
+    进程退出前调用 drain 写完队列中剩余的消息。
+    """
+
+    pending = []  # (消息文档, Future)
+    durability = "ack"
+    flush_interval = 0.02
+    max_batch = 500
+    max_retries = 3
+    stats = {
+        "messages": 0,
+        "batches": 0,
+        "failures": 0,
+        "dropped": 0,
+        "max_batch_size": 0,
+        "flush_time_total": 0.0,
+    }
+    _wakeup = None
+    _task = None
+    _stopping = False
+
+    @classmethod
+    def initialize(
+        cls, flush_interval_ms: int = None, max_batch: int = None, durability=None
+    ) -> None:
+        """启动后台写入任务
+
+        Args:
+            flush_interval_ms: 合并写入的时间窗口（毫秒），默认读取配置
+            max_batch: 每批最多写入的消息数，默认读取配置
+            durability: ack（写入后再返回）或 async（立即返回），默认读取配置
+        """
+        if cls._task is not None:
+            return
+
+        config = SETTINGS["database"]["write_behind"]
+        interval_ms = (
+            config["flush_interval_ms"]
+            if flush_interval_ms is None
+            else flush_interval_ms
+        )
+        cls.flush_interval = interval_ms / 1000
+        cls.max_batch = max_batch or config["max_batch"]
+        cls.durability = durability or config["durability"]
+        if cls.durability not in ("ack", "async"):
+            raise ValueError(f"不支持的持久化模式: {cls.durability}")
+        cls.max_retries = config["max_retries"]
+        cls._stopping = False
+        cls._wakeup = asyncio.Event()
+        cls._task = asyncio.ensure_future(cls._run())
+        logger.info(
+            f"消息后写队列初始化成功，时间窗口: {interval_ms}ms，"
+            f"持久化模式: {cls.durability}"
+        )
+
+    @classmethod
+    def add(
+        cls, conversation_id: str, role: str, content: str
+    ) -> Tuple[Dict[str, Any], asyncio.Future]:
+        """把消息放入队列并写穿缓存（同步执行，调用后即不会丢失顺序）
+
+        Returns:
+            Tuple[Dict[str, Any], asyncio.Future]: 序列化后的消息，以及写入完成的 Future
+        """
+        if cls._task is None:
+            cls.initialize()
+
+        message = Database.build_message(conversation_id, role, content)
+        Database.cache_new_message(conversation_id, message, message["created_at"])
+        future = asyncio.get_running_loop().create_future()
+        cls.pending.append((message, future))
+        cls._wakeup.set()
+        return Database.serialize_message(message), future
+
+    @classmethod
+    async def create_message(
+        cls, conversation_id: str, role: str, content: str, wait: bool = None
+    ) -> Dict[str, Any]:
+        """创建消息（与 Database.create_message 的返回值相同）
+
+        Args:
+            conversation_id: 会话ID
+            role: 消息角色
+            content: 消息内容
+            wait: 是否等待写入数据库，默认由 durability 决定
+
+        Returns:
+            Dict[str, Any]: 创建的消息
+        """
+        message, future = cls.add(conversation_id, role, content)
+        if wait if wait is not None else cls.durability == "ack":
+            await asyncio.shield(future)
+        return message
+
+    @classmethod
+    async def drain(cls) -> None:
+        """停止后台任务并写完队列中的全部消息（进程退出前调用）"""
+        if cls._task is None:
+            return
+        cls._stopping = True
+        cls._wakeup.set()
+        await cls._task
+        cls._task = None
+        logger.info(f"消息后写队列已排空，累计写入 {cls.stats['messages']} 条消息")
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """写入统计"""
+        return {
+            **cls.stats,
+            "pending": len(cls.pending),
+            "durability": cls.durability,
+            "flush_interval_ms": int(cls.flush_interval * 1000),
+        }
+
+    @classmethod
+    async def _run(cls) -> None:
+        """后台任务：等待新消息，经过一个时间窗口后批量写入"""
+        while True:
+            await cls._wakeup.wait()
+            cls._wakeup.clear()
+            if not cls._stopping and len(cls.pending) < cls.max_batch:
+                # 让更多会话的消息进入同一批
+                await asyncio.sleep(cls.flush_interval)
+            while cls.pending:
+                await cls._flush(cls.pending[: cls.max_batch])
+            if cls._stopping:
+                return
+
+    @classmethod
+    async def _flush(cls, batch) -> None:
+        """写入一批消息，失败时重试，仍失败则通知等待者"""
+        del cls.pending[: len(batch)]
+        messages = [message for message, _ in batch]
+        last_message_at = {}
+        for message in messages:
+            conversation_id = str(message["conversation_id"])
+            last_message_at[conversation_id] = max(
+                last_message_at.get(conversation_id, message["created_at"]),
+                message["created_at"],
+            )
+
+        start = time.perf_counter()
+        error = None
+        for attempt in range(cls.max_retries + 1):
+            try:
+                await AsyncDatabase.run(
+                    Database.write_messages, messages, last_message_at
+                )
+                error = None
+                break
+            except Exception as e:
+                error = e
+                cls.stats["failures"] += 1
+                logger.error(f"批量写入失败（第{attempt + 1}次）: {str(e)}")
+                if attempt < cls.max_retries:
+                    await asyncio.sleep(min(0.1 * 2**attempt, 2))
+
+        elapsed = time.perf_counter() - start
+        cls.stats["flush_time_total"] += elapsed
+        MESSAGE_FLUSH_SECONDS.observe(elapsed)
+        MESSAGE_FLUSH_SIZE.observe(len(messages))
+        if error is not None:
+            cls.stats["dropped"] += len(messages)
+            MESSAGES_DROPPED.inc(len(messages))
+            # add 时已写穿缓存，丢弃的消息不能继续出现在上下文和会话摘要中
+            for conversation_id in last_message_at:
+                Database.invalidate_cache("conversations", conversation_id)
+        else:
+            cls.stats["messages"] += len(messages)
+            cls.stats["batches"] += 1
+            cls.stats["max_batch_size"] = max(
+                cls.stats["max_batch_size"], len(messages)
+            )
+            # 消息已写入，其他进程的缓存此时失效才不会重新加载到旧数据
+            for conversation_id in last_message_at:
+                Database.publish_cache_change(conversation_id)
+
+        for _, future in batch:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(None)
+            # async 模式下没人等待，取走异常避免“未获取的异常”日志
+            future.exception()
+
+
+MESSAGE_WRITE_PENDING.set_function(lambda: len(MessageWriter.pending))